@@ -7,8 +7,10 @@
 #
 #
 
+import hashlib
 import math
 import os
+import pickle
 import queue
 import random
 import socket
@@ -16,7 +18,8 @@ import struct
 import sys
 import threading
 import time
-from collections import Counter
+from collections import Counter, deque, namedtuple
+from contextlib import contextmanager
 from functools import partial, partialmethod, wraps
 from io import StringIO
 from unittest import SkipTest
@@ -40,6 +43,19 @@ from scapy.layers.l2 import Ether
 from testvector import tvutils
 
 RPC_TIMEOUT = 10  # used when sending Write/Read requests.
+# Default maximum size of the messages received by a gRPC server, batched write
+# requests are split to stay below it.
+WRITE_BATCH_MAX_BYTES = 4 * 1024 * 1024
+# Upper bound of the encoding overhead (field tag and length) of an update in a
+# WriteRequest.
+WRITE_BATCH_UPDATE_OVERHEAD_BYTES = 6
+# Default number of WriteRequests sent without waiting for their response
+WRITE_MAX_IN_FLIGHT = 16
+
+# Outcome of a pipelined write: the WriteResponse if the request succeeded, the
+# exception otherwise. Requests not sent because an earlier one failed have a
+# P4RuntimeWriteNotSentException.
+WriteResult = namedtuple("WriteResult", ["req", "response", "error"])
 
 # Convert integer (with length) to binary byte string
 def stringify(n, length):
@@ -226,11 +242,215 @@ class P4RuntimeException(Exception):
         return message
 
 
+# Raised when a batched write fails. The indexes of the P4Runtime errors are
+# relative to the WriteRequest which was sent, which does not match any request
+# built by the test, so the updates they refer to are reported as well.
+class P4RuntimeBatchException(P4RuntimeException):
+    def __init__(self, grpc_error, updates):
+        super(P4RuntimeBatchException, self).__init__(grpc_error)
+        self.updates = updates
+        self.failed_updates = [
+            (updates[idx], p4_error) for idx, p4_error in self.errors
+        ]
+
+    def __str__(self):
+        message = "Error(s) during batched write of {} updates: {} {}\n".format(
+            len(self.updates), self.grpc_error.code(), self.grpc_error.details()
+        )
+        for idx, p4_error in self.errors:
+            code_name = code_pb2._CODE.values_by_number[p4_error.canonical_code].name
+            message += "\t* At index {}: {}, '{}'\n\t  {}\n".format(
+                idx,
+                code_name,
+                p4_error.message,
+                google.protobuf.text_format.MessageToString(
+                    self.updates[idx], as_one_line=True
+                ),
+            )
+        return message
+
+
+# Error of the pipelined write requests which were not sent because an earlier
+# request failed.
+class P4RuntimeWriteNotSentException(Exception):
+    def __init__(self):
+        super(P4RuntimeWriteNotSentException, self).__init__(
+            "Request not sent because an earlier request failed"
+        )
+
+
+# Raised when several write requests failed, e.g. when undoing the writes of a
+# test, where every request is sent even if an earlier one failed.
+class P4RuntimeWriteErrorsException(Exception):
+    def __init__(self, errors):
+        super(P4RuntimeWriteErrorsException, self).__init__()
+        self.errors = errors
+
+    def __str__(self):
+        message = "{} write request(s) failed:\n".format(len(self.errors))
+        for error in self.errors:
+            message += str(error)
+        return message
+
+
+# Types of the p4info objects which can be looked up by name
+P4INFO_OBJ_TYPES = [
+    "tables",
+    "action_profiles",
+    "actions",
+    "counters",
+    "meters",
+    "direct_counters",
+    "registers",
+]
+
+
+# Lookup tables of a P4Info message. In order to make writing tests easier, we
+# accept any suffix that uniquely identifies the object among p4info objects of
+# the same type. The tables are built from the positions of the objects in the
+# p4info (see positions()), which can be persisted and reused instead of being
+# recomputed.
+class P4InfoIndex:
+    def __init__(self, p4info, positions=None):
+        if positions is None:
+            positions = P4InfoIndex.positions(p4info)
+        self.p4info = p4info
+        self.positions = positions
+        # (object type, name suffix) to object
+        self.obj_map = {
+            key: getattr(p4info, key[0])[i] for key, i in positions["objects"].items()
+        }
+        self.id_to_name = positions["id_to_name"]
+        # table ID to {match field name: match field}
+        self.match_fields = {}
+        for t_i, mfs in positions["match_fields"].items():
+            t = p4info.tables[t_i]
+            self.match_fields[t.preamble.id] = {
+                name: t.match_fields[i] for name, i in mfs.items()
+            }
+        # action ID to {param name: param}
+        self.params = {}
+        for a_i, params in positions["params"].items():
+            a = p4info.actions[a_i]
+            self.params[a.preamble.id] = {
+                name: a.params[i] for name, i in params.items()
+            }
+
+    @staticmethod
+    def positions(p4info):
+        """
+        Computes the lookup tables of a p4info, with objects given by position.
+        :param p4info: The P4Info message
+        :return: A dict of plain lookup tables, which can be pickled
+        """
+        objects = {}
+        id_to_name = {}
+        suffix_count = Counter()
+        for p4_obj_type in P4INFO_OBJ_TYPES:
+            for i, obj in enumerate(getattr(p4info, p4_obj_type)):
+                pre = obj.preamble
+                suffix = None
+                for s in reversed(pre.name.split(".")):
+                    suffix = s if suffix is None else s + "." + suffix
+                    key = (p4_obj_type, suffix)
+                    objects[key] = i
+                    suffix_count[key] += 1
+                id_to_name[pre.id] = pre.name
+        for key, c in suffix_count.items():
+            if c > 1:
+                del objects[key]
+        return {
+            "objects": objects,
+            "id_to_name": id_to_name,
+            "match_fields": {
+                t_i: {mf.name: i for i, mf in enumerate(t.match_fields)}
+                for t_i, t in enumerate(p4info.tables)
+            },
+            "params": {
+                a_i: {p.name: i for i, p in enumerate(a.params)}
+                for a_i, a in enumerate(p4info.actions)
+            },
+        }
+
+
+# P4InfoIndex of the p4info files loaded by this process, by path and content
+# hash, so that the file is parsed once and not by each test.
+_p4info_indexes = {}
+# Same, by path, modification time and size, so that the file is not read and
+# hashed again while it does not change.
+_p4info_indexes_by_stat = {}
+
+
+def _load_p4info_index(content, index_path):
+    if index_path is not None:
+        try:
+            with open(index_path, "rb") as fin:
+                saved = pickle.load(fin)
+            p4info = p4info_pb2.P4Info()
+            p4info.ParseFromString(saved["p4info"])
+            return P4InfoIndex(p4info, saved["positions"])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print("Ignoring invalid p4info index {}: {}".format(index_path, e))
+
+    p4info = p4info_pb2.P4Info()
+    google.protobuf.text_format.Merge(content, p4info)
+    index = P4InfoIndex(p4info)
+    if index_path is not None:
+        # Written under a temporary name, as other processes may be reading
+        saved = {"p4info": p4info.SerializeToString(), "positions": index.positions}
+        try:
+            tmp_path = "{}.{}".format(index_path, os.getpid())
+            with open(tmp_path, "wb") as fout:
+                pickle.dump(saved, fout, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print("Unable to save p4info index to {}: {}".format(index_path, e))
+    return index
+
+
+def get_p4info_index(path, persist=False):
+    """
+    Returns the P4InfoIndex of a text format p4info file.
+    :param path: The p4info file
+    :param persist: If the index should be saved next to the file
+        (<path>.<hash>.index), as the binary protobuf and its lookup tables,
+        which is much faster to load than the text format, and loaded from
+        there by the next processes.
+    :return: The P4InfoIndex, shared by all the callers in the process.
+    """
+    real_path = os.path.realpath(path)
+    stat = os.stat(real_path)
+    stat_key = (real_path, stat.st_mtime_ns, stat.st_size)
+    index = _p4info_indexes_by_stat.get(stat_key)
+    if index is not None:
+        return index
+
+    with open(real_path, "rb") as fin:
+        content = fin.read()
+    digest = hashlib.sha256(content).hexdigest()[:16]
+    key = (real_path, digest)
+    index = _p4info_indexes.get(key)
+    if index is None:
+        index_path = "{}.{}.index".format(path, digest) if persist else None
+        index = _load_p4info_index(content, index_path)
+        _p4info_indexes[key] = index
+    _p4info_indexes_by_stat[stat_key] = index
+    return index
+
+
 # This code is common to all tests. setUp() is invoked at the beginning of the
 # test and tearDown is called at the end, no matter whether the test passed /
 # failed / errored.
 # noinspection PyUnresolvedReferences
 class P4RuntimeTest(BaseTest):
+    # (update, store) pairs waiting to be written, None when writes are not
+    # batched (see batch_writes)
+    _write_batch = None
+    _write_batch_max_bytes = WRITE_BATCH_MAX_BYTES
+    _write_batch_max_in_flight = WRITE_MAX_IN_FLIGHT
+
     def setUp(self):
         BaseTest.setUp(self)
         self._swports = []
@@ -255,9 +475,10 @@ class P4RuntimeTest(BaseTest):
 
         proto_txt_path = testutils.test_param_get("p4info")
         # print("Importing p4info proto from {}".format(proto_txt_path))
-        self.p4info = p4info_pb2.P4Info()
-        with open(proto_txt_path, "rb") as fin:
-            google.protobuf.text_format.Merge(fin.read(), self.p4info)
+        self.p4info_index = get_p4info_index(
+            proto_txt_path, testutils.test_param_get("p4info_cache") == "True"
+        )
+        self.p4info = self.p4info_index.p4info
 
         self.import_p4info_names()
 
@@ -285,33 +506,11 @@ class P4RuntimeTest(BaseTest):
             self.stub = p4runtime_pb2_grpc.P4RuntimeStub(self.channel)
             self.set_up_stream()
 
-    # In order to make writing tests easier, we accept any suffix that uniquely
-    # identifies the object among p4info objects of the same type.
+    # Name lookups are done with the P4InfoIndex shared by all tests, see
+    # P4InfoIndex.
     def import_p4info_names(self):
-        self.p4info_obj_map = {}
-        self.p4info_id_to_name = {}
-        suffix_count = Counter()
-        for p4_obj_type in [
-            "tables",
-            "action_profiles",
-            "actions",
-            "counters",
-            "meters",
-            "direct_counters",
-            "registers",
-        ]:
-            for obj in getattr(self.p4info, p4_obj_type):
-                pre = obj.preamble
-                suffix = None
-                for s in reversed(pre.name.split(".")):
-                    suffix = s if suffix is None else s + "." + suffix
-                    key = (p4_obj_type, suffix)
-                    self.p4info_obj_map[key] = obj
-                    suffix_count[key] += 1
-                self.p4info_id_to_name[pre.id] = pre.name
-        for key, c in suffix_count.items():
-            if c > 1:
-                del self.p4info_obj_map[key]
+        self.p4info_obj_map = self.p4info_index.obj_map
+        self.p4info_id_to_name = self.p4info_index.id_to_name
 
     def set_up_stream(self):
         self.stream_out_q = queue.Queue()
@@ -466,34 +665,27 @@ class P4RuntimeTest(BaseTest):
 
     def get_param_id(self, action_name, param_name):
         a = self.get_obj("actions", action_name)
-        for p in a.params:
-            if p.name == param_name:
-                return p.id
-        raise Exception(
-            "Param '%s' not found in action '%s'" % (param_name, action_name)
-        )
+        p = self.p4info_index.params[a.preamble.id].get(param_name)
+        if p is None:
+            raise Exception(
+                "Param '%s' not found in action '%s'" % (param_name, action_name)
+            )
+        return p.id
 
-    def get_mf_id(self, table_name, mf_name):
+    def get_mf(self, table_name, mf_name):
         t = self.get_obj("tables", table_name)
-        if t is None:
-            return None
-        for mf in t.match_fields:
-            if mf.name == mf_name:
-                return mf.id
-        raise Exception(
-            "Match field '%s' not found in table '%s'" % (mf_name, table_name)
-        )
+        mf = self.p4info_index.match_fields[t.preamble.id].get(mf_name)
+        if mf is None:
+            raise Exception(
+                "Match field '%s' not found in table '%s'" % (mf_name, table_name)
+            )
+        return mf
+
+    def get_mf_id(self, table_name, mf_name):
+        return self.get_mf(table_name, mf_name).id
 
     def get_mf_bitwidth(self, table_name, mf_name):
-        t = self.get_obj("tables", table_name)
-        if t is None:
-            return None
-        for mf in t.match_fields:
-            if mf.name == mf_name:
-                return mf.bitwidth
-        raise Exception(
-            "Match field '%s' not found in table '%s'" % (mf_name, table_name)
-        )
+        return self.get_mf(table_name, mf_name).bitwidth
 
     def send_packet(self, port, pkt):
         if self.generate_tv:
@@ -646,9 +838,8 @@ class P4RuntimeTest(BaseTest):
     # iterable object of MF instances
     def set_match_key(self, table_entry, t_name, mk):
         for mf in mk:
-            mf_id = self.get_mf_id(t_name, mf.name)
-            mf_bitwidth = self.get_mf_bitwidth(t_name, mf.name)
-            mf.add_to(mf_id, table_entry.match, mf_bitwidth)
+            mf_info = self.get_mf(t_name, mf.name)
+            mf.add_to(mf_info.id, table_entry.match, mf_info.bitwidth)
 
     def set_action(self, action, a_name, params):
         action.action_id = self.get_action_id(a_name)
@@ -671,6 +862,8 @@ class P4RuntimeTest(BaseTest):
             raise P4RuntimeException(e)
 
     def read_request(self, req):
+        # Reads must see the updates written before them
+        self.flush_write_batch()
         entities = []
         if self.generate_tv:
             return entities
@@ -685,6 +878,9 @@ class P4RuntimeTest(BaseTest):
             return entities
 
     def write_request(self, req, store=True):
+        if self._write_batch is not None:
+            self._write_batch.extend((update, store) for update in req.updates)
+            return None
         if self.generate_tv:
             tvutils.add_write_operation(self.tc, req)
             if store:
@@ -696,6 +892,259 @@ class P4RuntimeTest(BaseTest):
                 self.reqs.append(req)
             return rep
 
+    @contextmanager
+    def batch_writes(
+        self, max_bytes=WRITE_BATCH_MAX_BYTES, max_in_flight=WRITE_MAX_IN_FLIGHT
+    ):
+        """
+        Context in which write_request (and so all the send_request_* and
+        FabricTest helpers) does not send the request but queues its updates.
+        The queued updates are written when leaving the context, or before a
+        read, in as few WriteRequests as max_bytes allows. Updates which may
+        depend on each other (e.g. a table entry pointing to an action profile
+        group inserted before it) are never sent in the same WriteRequest,
+        since the server may apply the updates of a request in any order.
+        WriteRequests are pipelined like in write_requests. Requests are
+        recorded for autocleanup as they are written, a failed
+        write raises a P4RuntimeBatchException. Nested contexts join the
+        outermost one. Updates queued when an exception is raised in the
+        context are dropped.
+
+        :param max_bytes: maximum size of a WriteRequest
+        :param max_in_flight: maximum number of WriteRequests in flight
+        """
+        if self._write_batch is not None:
+            yield
+            return
+        self._write_batch = []
+        self._write_batch_max_bytes = max_bytes
+        self._write_batch_max_in_flight = max_in_flight
+        try:
+            yield
+            self.flush_write_batch()
+        finally:
+            self._write_batch = None
+
+    @staticmethod
+    def _write_batch_key(update):
+        """
+        Returns (dependency, entity) for an update. dependency orders updates
+        of entities which reference each other: action profile members and
+        PRE entries are referenced by groups and table entries, groups by
+        table entries. It is (level, is delete) or None for entities which are
+        not referenced nor reference others. entity identifies the updated
+        entity, two updates of the same entity must be applied in order.
+        """
+        entity_type = update.entity.WhichOneof("entity")
+        obj = getattr(update.entity, entity_type)
+        level = None
+        if entity_type == "table_entry":
+            level = 2
+            entity = (
+                obj.table_id,
+                obj.priority,
+                obj.is_default_action,
+                tuple(m.SerializeToString() for m in obj.match),
+            )
+        elif entity_type == "action_profile_group":
+            level = 1
+            entity = (obj.action_profile_id, obj.group_id)
+        elif entity_type == "action_profile_member":
+            level = 0
+            entity = (obj.action_profile_id, obj.member_id)
+        elif entity_type == "packet_replication_engine_entry":
+            level = 0
+            entity = obj.SerializeToString(deterministic=True)
+            if obj.HasField("multicast_group_entry"):
+                entity = ("multicast", obj.multicast_group_entry.multicast_group_id)
+            elif obj.HasField("clone_session_entry"):
+                entity = ("clone", obj.clone_session_entry.session_id)
+        elif entity_type in ["meter_entry", "counter_entry", "register_entry"]:
+            obj_id = getattr(obj, entity_type.replace("_entry", "_id"))
+            entity = (obj_id, obj.index.index)
+        else:
+            entity = obj.SerializeToString(deterministic=True)
+        dependency = None
+        if level is not None:
+            dependency = (level, update.type == p4runtime_pb2.Update.DELETE)
+        return dependency, (entity_type, entity)
+
+    @staticmethod
+    def _write_batch_conflict(state, key):
+        """
+        Returns True if an update may depend on the updates before it, given
+        as (set of dependencies, set of entities). Inserts and modifies must
+        follow the ones of lower levels, deletes the ones of higher levels.
+        """
+        dependencies, entities = state
+        dependency, entity = key
+        if entity in entities:
+            return True
+        if dependency is None:
+            return False
+        level, delete = dependency
+        return any(
+            d_delete == delete and (d_level > level if delete else d_level < level)
+            for d_level, d_delete in dependencies
+        )
+
+    @staticmethod
+    def _write_batch_states_conflict(before, after):
+        # Same as _write_batch_conflict, for all the updates of a request
+        if not before[1].isdisjoint(after[1]):
+            return True
+        return any(
+            P4RuntimeTest._write_batch_conflict((before[0], ()), (dependency, None))
+            for dependency in after[0]
+        )
+
+    @staticmethod
+    def _write_batch_add(state, key):
+        dependency, entity = key
+        if dependency is not None:
+            state[0].add(dependency)
+        state[1].add(entity)
+
+    def _write_batch_chunks(self, updates):
+        """
+        Splits the (update, store) pairs to write in lists fitting in one
+        WriteRequest. An update joins the current list only if it does not
+        depend on the updates already in it.
+        """
+        request_bytes = self.get_new_write_request().ByteSize()
+        chunk, state, size = [], (set(), set()), request_bytes
+        for update, store in updates:
+            key = self._write_batch_key(update)
+            update_bytes = update.ByteSize() + WRITE_BATCH_UPDATE_OVERHEAD_BYTES
+            if chunk and (
+                size + update_bytes > self._write_batch_max_bytes
+                or self._write_batch_conflict(state, key)
+            ):
+                yield chunk
+                chunk, state, size = [], (set(), set()), request_bytes
+            chunk.append((update, store))
+            self._write_batch_add(state, key)
+            size += update_bytes
+        if chunk:
+            yield chunk
+
+    def flush_write_batch(self):
+        """
+        Writes the updates queued by batch_writes, if any.
+        """
+        if not self._write_batch:
+            return
+        updates, self._write_batch = self._write_batch, []
+        reqs, stores = [], []
+        for chunk in self._write_batch_chunks(updates):
+            req = self.get_new_write_request()
+            for update, _ in chunk:
+                req.updates.add().CopyFrom(update)
+            reqs.append(req)
+            stores.append([store for _, store in chunk])
+        for result in self._write_pipelined(
+            reqs, stores, self._write_batch_max_in_flight
+        ):
+            if result.error is not None:
+                raise result.error
+
+    def write_requests(self, reqs, store=True, max_in_flight=WRITE_MAX_IN_FLIGHT):
+        """
+        Writes requests without waiting for the response of a request before
+        sending the next one, up to max_in_flight requests at a time. A request
+        is sent only after the requests it may depend on completed (e.g. the
+        ones inserting action profile members before one inserting groups).
+        Once a request is seen failing, no more requests are sent; the ones
+        already in flight are still completed, the others get a
+        P4RuntimeWriteNotSentException. Requests are recorded for
+        autocleanup as they complete; for a failed request, only the updates
+        which were applied.
+
+        :param reqs: WriteRequests, in the order they would be sent one by one
+        :param store: if the requests must be recorded for autocleanup
+        :param max_in_flight: maximum number of requests in flight
+        :return: a list of WriteResult, one for each request
+        """
+        stores = [[store] * len(req.updates) for req in reqs]
+        return self._write_pipelined(reqs, stores, max_in_flight)
+
+    def _write_pipelined(self, reqs, stores, max_in_flight, stop_on_error=True):
+        if self.generate_tv:
+            for i, req in enumerate(reqs):
+                tvutils.add_write_operation(self.tc, req)
+                self._store_write(req, stores[i])
+            return [WriteResult(req, None, None) for req in reqs]
+
+        # Overwritten as requests complete
+        results = [
+            WriteResult(req, None, P4RuntimeWriteNotSentException()) for req in reqs
+        ]
+
+        # (index, future, (dependencies, entities)) of the requests in flight,
+        # oldest first
+        in_flight = deque()
+        failed = False
+
+        def complete():
+            i, future, _ = in_flight.popleft()
+            req = reqs[i]
+            try:
+                results[i] = WriteResult(req, future.result(), None)
+                self._store_write(req, stores[i])
+            except grpc.RpcError as e:
+                if e.code() != grpc.StatusCode.UNKNOWN:
+                    results[i] = WriteResult(req, None, e)
+                    return True
+                try:
+                    error = P4RuntimeBatchException(e, req.updates)
+                except P4RuntimeErrorFormatException as format_error:
+                    # Without the error of each update, whether any was applied
+                    # is unknown.
+                    results[i] = WriteResult(req, None, format_error)
+                    return True
+                results[i] = WriteResult(req, None, error)
+                if len(error.errors) == 0:
+                    # No update error listed, the outcome is unknown as above
+                    return True
+                # Updates which did not fail were applied and must be cleaned up
+                self._store_write(req, stores[i], {idx for idx, _ in error.errors})
+                return True
+            return False
+
+        try:
+            for i, req in enumerate(reqs):
+                state = (set(), set())
+                for update in req.updates:
+                    self._write_batch_add(state, self._write_batch_key(update))
+                while in_flight and (
+                    len(in_flight) >= max_in_flight
+                    or any(
+                        self._write_batch_states_conflict(s, state)
+                        for _, _, s in in_flight
+                    )
+                ):
+                    failed |= complete()
+                if failed and stop_on_error:
+                    break
+                in_flight.append(
+                    (i, self.stub.Write.future(req, timeout=RPC_TIMEOUT), state)
+                )
+        finally:
+            # Requests in flight may have been applied, they must be recorded
+            # even if sending failed.
+            while in_flight:
+                complete()
+        return results
+
+    def _store_write(self, req, stores, failed=()):
+        # Records the updates of a written request for autocleanup
+        stored = self.get_new_write_request()
+        for idx, (update, store) in enumerate(zip(req.updates, stores)):
+            if store and idx not in failed:
+                stored.updates.add().CopyFrom(update)
+        if len(stored.updates) != 0:
+            self.reqs.append(stored)
+
     def get_new_write_request(self):
         req = p4runtime_pb2.WriteRequest()
         req.device_id = self.device_id
@@ -1207,7 +1656,6 @@ class P4RuntimeTest(BaseTest):
                     or self.is_meter_update(update)
                 ):
                     updates.append(update)
-        new_req = self.get_new_write_request()
         for update in updates:
             if self.is_default_action_update(update):
                 # Reset table default entry to original one
@@ -1217,15 +1665,32 @@ class P4RuntimeTest(BaseTest):
                 update.entity.meter_entry.ClearField("config")
             else:
                 update.type = p4runtime_pb2.Update.DELETE
-            new_req.updates.add().CopyFrom(update)
+        # Split like batched writes, to stay below the message size limit and
+        # delete entries before the groups and members they point to.
+        new_reqs = []
+        for chunk in self._write_batch_chunks((update, False) for update in updates):
+            new_req = self.get_new_write_request()
+            for update, _ in chunk:
+                new_req.updates.add().CopyFrom(update)
+            new_reqs.append(new_req)
         if self.generate_tv:
-            if len(reqs) != 0:
-                if create_new_tv:
-                    self.tc = tvutils.get_new_testcase(self.tv)
-                    self.tc.test_case_id = "Undo Write Requests"
-                tvutils.add_write_operation(self.tc, new_req)
-        else:
-            self._write(new_req)
+            if len(reqs) == 0:
+                return
+            if create_new_tv:
+                self.tc = tvutils.get_new_testcase(self.tv)
+                self.tc.test_case_id = "Undo Write Requests"
+        # Like a single request, every update is tried even if others failed
+        results = self._write_pipelined(
+            new_reqs,
+            [[False] * len(new_req.updates) for new_req in new_reqs],
+            self._write_batch_max_in_flight,
+            stop_on_error=False,
+        )
+        errors = [result.error for result in results if result.error is not None]
+        if len(errors) == 1:
+            raise errors[0]
+        if len(errors) > 1:
+            raise P4RuntimeWriteErrorsException(errors)
 
 
 # Add p4info object and object id "getters" for each object type; these are
@@ -249,6 +249,8 @@ def run_test(
     generate_tv=False,
     loopback=False,
     trex_server_addr=None,
+    pipeline_config_path=None,
+    p4info_cache=False,
     extra_args=(),
 ):
     """
@@ -327,6 +329,9 @@ def run_test(
     if trex_server_addr is not None:
         test_params += ";trex_server_addr='{}'".format(trex_server_addr)
     test_params += ";profile='{}'".format(profile)
+    if pipeline_config_path is not None:
+        test_params += ";pipeline_config='{}'".format(pipeline_config_path)
+    test_params += ";p4info_cache='{}'".format(p4info_cache)
     cmd.append("--test-params={}".format(test_params))
     cmd.extend(extra_args)
     info("Executing PTF command: {}".format(" ".join(cmd)))
@@ -453,6 +458,13 @@ def main():
         action="store_true",
         required=False,
     )
+    parser.add_argument(
+        "--p4info-cache",
+        help="Save the parsed P4Info and its lookup tables next to the P4Info "
+        "file, to load them faster in the next runs",
+        action="store_true",
+        default=False,
+    )
     args, unknown_args = parser.parse_known_args()
 
     if not check_ptf():
@@ -513,6 +525,8 @@ def main():
                 loopback=args.loopback,
                 profile=args.profile,
                 trex_server_addr=args.trex_address,
+                pipeline_config_path=pipeline_config,
+                p4info_cache=args.p4info_cache,
                 extra_args=unknown_args,
             )
             if not success:
@@ -536,6 +550,7 @@ def main():
                 generate_tv=args.generate_tv,
                 loopback=args.loopback,
                 profile=args.profile,
+                p4info_cache=args.p4info_cache,
                 extra_args=unknown_args,
             )
             if not success:
@@ -4,10 +4,28 @@
 import gnmi_utils
 from base_test import *
 from trex.stl.api import STLClient
+from trex_utils import (
+    L1_OVERHEAD_BYTES,
+    THROUGHPUT_SEARCH_LOSS_RATIOS,
+    THROUGHPUT_SEARCH_PRECISION,
+    THROUGHPUT_SEARCH_TRIAL_SECONDS,
+    RunTelemetry,
+    ThroughputSearchResult,
+    ThroughputTrial,
+    binary_search_throughput,
+    get_latency_stats,
+    get_port_stats,
+    pipeline_hash,
+    to_readable,
+)
+
+# Formats of the telemetry files written by each test, see RunTelemetry.write()
+TELEMETRY_FORMATS = ["prom", "csv"]
 
 
 class TRexTest(P4RuntimeTest):
     trex_client: STLClient
+    telemetry: RunTelemetry
 
     def setUp(self):
         super(TRexTest, self).setUp()
@@ -22,16 +40,163 @@ class TRexTest(P4RuntimeTest):
         self.trex_client.set_port_attr(
             self.trex_client.get_all_ports(), promiscuous=True
         )
+        self.telemetry = RunTelemetry(self.run_metadata())
 
     def tearDown(self):
-        print("Tearing down STLClient...")
-        self.trex_client.stop()
-        self.trex_client.release()
-        self.trex_client.disconnect()
-        super(TRexTest, self).tearDown()
+        try:
+            self.export_telemetry()
+        finally:
+            # TRex ports must be released even if the export failed, or the
+            # next tests cannot acquire them.
+            print("Tearing down STLClient...")
+            self.trex_client.stop()
+            self.trex_client.release()
+            self.trex_client.disconnect()
+            super(TRexTest, self).tearDown()
 
     def push_chassis_config(self) -> None:
         this_dir = os.path.dirname(os.path.realpath(__file__))
         with open(f"{this_dir}/../linerate/chassis_config.pb.txt", mode="rb") as file:
             chassis_config = file.read()
         gnmi_utils.push_chassis_config(chassis_config)
+
+    def run_metadata(self) -> dict:
+        """
+        Labels identifying the run in the exported telemetry.
+        """
+        return {
+            "profile": ptf.testutils.test_param_get("profile", ""),
+            "test": self.__class__.__name__,
+            "pipeline": pipeline_hash(
+                ptf.testutils.test_param_get("p4info"),
+                ptf.testutils.test_param_get("pipeline_config"),
+            ),
+        }
+
+    def record_port_stats(self, stats: dict) -> None:
+        """
+        Adds the stats of every port in a TRex get_stats() result to the
+        telemetry.
+        """
+        for port in self.trex_client.get_all_ports():
+            if port in stats:
+                self.telemetry.add_port_stats(port, get_port_stats(port, stats))
+
+    def telemetry_dir(self) -> str:
+        """
+        Directory of the telemetry files, given by the "telemetry_dir" test
+        parameter, /tmp by default.
+        """
+        telemetry_dir = ptf.testutils.test_param_get("telemetry_dir", "/tmp")
+        os.makedirs(telemetry_dir, exist_ok=True)
+        return telemetry_dir
+
+    def export_telemetry(self) -> None:
+        """
+        Writes the telemetry collected by the test, if any, to
+        <telemetry_dir>/<test class>.<format>.
+        """
+        if not len(self.telemetry):
+            return
+        telemetry_dir = self.telemetry_dir()
+        for fmt in TELEMETRY_FORMATS:
+            path = f"{telemetry_dir}/{self.__class__.__name__}.{fmt}"
+            self.telemetry.write(path)
+            print(f"Telemetry written to {path}")
+        if self.telemetry.latency_histograms:
+            path = f"{telemetry_dir}/{self.__class__.__name__}.latency.json"
+            self.telemetry.write_latency_histograms(path)
+            print(f"Latency histograms written to {path}")
+
+    def run_throughput_trial(
+        self,
+        streams: [],
+        tx_port: int,
+        rx_port: int,
+        rate_bps: float,
+        duration: int = THROUGHPUT_SEARCH_TRIAL_SECONDS,
+        latency_pg_id: int = None,
+    ) -> ThroughputTrial:
+        """
+        Sends streams from a port for a fixed duration and measures the
+        packets lost on the way to another port.
+
+        :parameters:
+            streams: []
+                streams of the trial, sending rate_bps in total
+            tx_port, rx_port: int
+                TRex ports sending and receiving the traffic
+            rate_bps: float
+                offered L1 rate of the streams
+            duration: int
+                duration of the trial in seconds
+            latency_pg_id: int
+                pg_id of a latency stream among the streams, None to skip
+                latency
+        :returns:
+            The ThroughputTrial
+        """
+        self.trex_client.remove_all_streams(ports=[tx_port])
+        self.trex_client.clear_stats()
+        self.trex_client.add_streams(streams, ports=[tx_port])
+        self.trex_client.start(ports=[tx_port], duration=duration)
+        self.trex_client.wait_on_traffic(ports=[tx_port], rx_delay_ms=100)
+        stats = self.trex_client.get_stats()
+        tx_packets = stats[tx_port]["opackets"]
+        rx_packets = stats[rx_port]["ipackets"]
+        rx_bytes_L1 = stats[rx_port]["ibytes"] + L1_OVERHEAD_BYTES * rx_packets
+        return ThroughputTrial(
+            rate_bps=rate_bps,
+            tx_packets=tx_packets,
+            rx_packets=rx_packets,
+            loss_ratio=max(tx_packets - rx_packets, 0) / max(tx_packets, 1),
+            rx_bps_L1=8 * rx_bytes_L1 / duration,
+            latency=None
+            if latency_pg_id is None
+            else get_latency_stats(latency_pg_id, stats),
+        )
+
+    def search_throughput(
+        self,
+        create_streams,
+        tx_port: int,
+        rx_port: int,
+        max_bps: float,
+        duration: int = THROUGHPUT_SEARCH_TRIAL_SECONDS,
+        latency_pg_id: int = None,
+        loss_ratios: dict = THROUGHPUT_SEARCH_LOSS_RATIOS,
+        precision: float = THROUGHPUT_SEARCH_PRECISION,
+    ) -> ThroughputSearchResult:
+        """
+        Searches the NDR and PDR from tx_port to rx_port, running one trial
+        per offered rate, see run_throughput_trial() and
+        trex_utils.binary_search_throughput().
+
+        :parameters:
+            create_streams: callable
+                returns the streams of a trial given its rate in bps
+            max_bps: float
+                maximum rate to search
+            loss_ratios, precision:
+                see binary_search_throughput()
+            other parameters:
+                see run_throughput_trial()
+        :returns:
+            The ThroughputSearchResult
+        """
+
+        def run_trial(rate_bps):
+            trial = self.run_throughput_trial(
+                create_streams(rate_bps),
+                tx_port,
+                rx_port,
+                rate_bps,
+                duration,
+                latency_pg_id,
+            )
+            print(f"Offered {to_readable(rate_bps)}, loss ratio {trial.loss_ratio:.4%}")
+            return trial
+
+        return binary_search_throughput(
+            run_trial, max_bps, loss_ratios=loss_ratios, precision=precision
+        )
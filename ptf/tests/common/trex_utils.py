@@ -2,7 +2,12 @@
 # SPDX-License-Identifier: Apache-2.0
 import argparse
 import collections
+import csv
+import hashlib
+import json
 import logging
+import os
+import threading
 import time
 
 import numpy as np
@@ -159,8 +164,8 @@ def monitor_port_stats(c: STLClient, ports: []) -> dict:
 
             rx_bps = 8 * (ibytes - prev[port]["ibytes"]) / time_diff
             tx_bps = 8 * (obytes - prev[port]["obytes"]) / time_diff
-            rx_pps = ipackets - prev[port]["ipackets"] / time_diff
-            tx_pps = opackets - prev[port]["opackets"] / time_diff
+            rx_pps = (ipackets - prev[port]["ipackets"]) / time_diff
+            tx_pps = (opackets - prev[port]["opackets"]) / time_diff
 
             print(
                 "{:^4} | {:<10} | {:<10} | {:<10} | {:<10} |".format(
@@ -190,6 +195,195 @@ def monitor_port_stats(c: STLClient, ports: []) -> dict:
     return results
 
 
+# Ethernet preamble, start of frame delimiter and inter-frame gap, counted
+# in L1 rates like TRex does.
+L1_OVERHEAD_BYTES = 20
+# Counters of TRex port stats sampled by PortStatsSampler
+SAMPLED_PORT_COUNTERS = ["opackets", "ipackets", "obytes", "ibytes"]
+PORT_STATS_SAMPLE_INTERVAL = 0.1  # sec
+# Number of samples kept per port, about 55 minutes at the default interval
+PORT_STATS_SAMPLE_CAPACITY = 1 << 15
+
+PortRates = collections.namedtuple(
+    "PortRates",
+    [
+        # Time (sec) since the sampler start at the end of each interval
+        "time",
+        "tx_bps",
+        "rx_bps",
+        "tx_pps",
+        "rx_pps",
+        "tx_bps_L1",
+        "rx_bps_L1",
+        # L1 utilization of the port speed in percent, like TRex tx_util
+        "tx_util",
+        "rx_util",
+    ],
+)
+
+
+class PortStatsSampler:
+    """
+    Samples the counters of TRex ports in a background thread, so that the
+    test thread is free while traffic runs. Samples are kept in preallocated
+    ring buffers holding the last `capacity` samples. Rates are computed
+    from the counters of consecutive samples, see rates().
+
+    The sampler is started and stopped with start() and stop(), or used as a
+    context manager:
+
+        c.start(ports=[0], duration=10)
+        with PortStatsSampler(c, [0, 1]) as sampler:
+            c.wait_on_traffic(ports=[0])
+        rates = sampler.rates(1)
+
+    :parameters:
+        client: STLClient
+            TRex stateless client to get statistics from
+        ports: []
+            List of ports to sample
+        interval: float
+            sampling interval in seconds
+        capacity: int
+            maximum number of samples kept per port
+    """
+
+    def __init__(
+        self,
+        client: STLClient,
+        ports: [],
+        interval: float = PORT_STATS_SAMPLE_INTERVAL,
+        capacity: int = PORT_STATS_SAMPLE_CAPACITY,
+    ):
+        self.client = client
+        self.ports = list(ports)
+        self.interval = interval
+        self.capacity = capacity
+        self.speed_bps = {}
+        self._times = np.zeros(capacity)
+        self._counters = np.zeros(
+            (len(self.ports), len(SAMPLED_PORT_COUNTERS), capacity), dtype=np.int64
+        )
+        self._samples = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._error = None
+        self._start_time = None
+        # Wall-clock time (sec since epoch) of the sampler start
+        self.start_timestamp = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self) -> None:
+        """
+        Discards the previous samples and starts sampling.
+        """
+        if self._thread is not None:
+            raise RuntimeError("Port stats sampler already started")
+        port_info = self.client.get_port_info(ports=self.ports)
+        self.speed_bps = {
+            port: info.get("speed", 0) * G for port, info in zip(self.ports, port_info)
+        }
+        self._samples = 0
+        self._error = None
+        self._stopped.clear()
+        self._start_time = time.monotonic()
+        self.start_timestamp = time.time()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops sampling. Errors raised while sampling are raised here.
+        """
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        if self._error is not None:
+            raise self._error
+
+    def _sample(self) -> None:
+        next_time = time.monotonic()
+        while not self._stopped.is_set():
+            try:
+                stats = self.client.get_stats(ports=self.ports)
+            except Exception as e:
+                self._error = e
+                return
+            now = time.monotonic() - self._start_time
+            with self._lock:
+                slot = self._samples % self.capacity
+                self._times[slot] = now
+                for i, port in enumerate(self.ports):
+                    self._counters[i, :, slot] = [
+                        stats[port].get(counter, 0) for counter in SAMPLED_PORT_COUNTERS
+                    ]
+                self._samples += 1
+            # Sample at a fixed rate, whatever the time taken by get_stats.
+            next_time += self.interval
+            self._stopped.wait(max(0, next_time - time.monotonic()))
+
+    def samples(self):
+        """
+        :returns:
+            A tuple (times, counters) with the time (sec since start) of the
+            samples kept, oldest first, and their counters as an array of
+            shape (ports, SAMPLED_PORT_COUNTERS, samples)
+        """
+        with self._lock:
+            count = min(self._samples, self.capacity)
+            order = (np.arange(count) + self._samples - count) % self.capacity
+            return self._times[order], self._counters[:, :, order]
+
+    def rates(self, port: int, start: float = None, stop: float = None) -> PortRates:
+        """
+        Rates of a port between consecutive samples.
+
+        :parameters:
+            port: int
+                port to get the rates of
+            start, stop: float
+                only return the rates of the intervals ending between these
+                times (sec since the sampler start)
+        :returns:
+            A PortRates of arrays, one entry per sampling interval
+        """
+        times, counters = self.samples()
+        elapsed = np.diff(times)
+        deltas = np.diff(counters[self.ports.index(port)], axis=1)
+        opackets, ipackets, obytes, ibytes = deltas / np.maximum(elapsed, 1e-9)
+        times = times[1:]
+        selected = np.ones(len(times), dtype=bool)
+        if start is not None:
+            selected &= times >= start
+        if stop is not None:
+            selected &= times <= stop
+        tx_bps = 8 * obytes
+        rx_bps = 8 * ibytes
+        tx_bps_L1 = tx_bps + 8 * L1_OVERHEAD_BYTES * opackets
+        rx_bps_L1 = rx_bps + 8 * L1_OVERHEAD_BYTES * ipackets
+        speed_bps = self.speed_bps.get(port) or np.nan
+        return PortRates(
+            time=times[selected],
+            tx_bps=tx_bps[selected],
+            rx_bps=rx_bps[selected],
+            tx_pps=opackets[selected],
+            rx_pps=ipackets[selected],
+            tx_bps_L1=tx_bps_L1[selected],
+            rx_bps_L1=rx_bps_L1[selected],
+            tx_util=100 * tx_bps_L1[selected] / speed_bps,
+            rx_util=100 * rx_bps_L1[selected] / speed_bps,
+        )
+
+
 LatencyStats = collections.namedtuple(
     "LatencyStats",
     [
@@ -265,6 +459,16 @@ def get_port_stats(port: int, stats) -> PortStats:
     )
 
 
+def latency_bucket_end(range_start: int) -> int:
+    """
+    End (us) of a bucket of the TRex latency histogram. Buckets span one unit
+    of the most significant digit of their start, the first one is [0, 10).
+    """
+    if range_start == 0:
+        return 10
+    return range_start + pow(10, (len(str(range_start)) - 1))
+
+
 def get_latency_stats(pg_id: int, stats) -> LatencyStats:
     lat_stats = stats["latency"].get(pg_id)
     lat = lat_stats["latency"]
@@ -273,11 +477,7 @@ def get_latency_stats(pg_id: int, stats) -> LatencyStats:
     l.sort()
     all_latencies = []
     for sample in l:
-        range_start = sample
-        if range_start == 0:
-            range_end = 10
-        else:
-            range_end = range_start + pow(10, (len(str(range_start)) - 1))
+        range_end = latency_bucket_end(sample)
         val = lat["histogram"][sample]
         # Assume whole the bucket experienced the range_end latency.
         all_latencies += [range_end] * val
@@ -315,10 +515,7 @@ def get_readable_latency_stats(stats: LatencyStats) -> str:
     l.sort()
     for sample in l:
         range_start = sample
-        if range_start == 0:
-            range_end = 10
-        else:
-            range_end = range_start + pow(10, (len(str(range_start)) - 1))
+        range_end = latency_bucket_end(range_start)
         val = stats.histogram[sample]
         histogram = (
             histogram
@@ -349,6 +546,243 @@ def get_readable_latency_stats(stats: LatencyStats) -> str:
     """
 
 
+# Latency histograms
+
+# Number of bits of the linear sub-buckets of LatencyHistogram. Values are
+# recorded with a relative error below 2^-(bits - 1), 0.8% with 8 bits.
+LATENCY_HISTOGRAM_SUB_BUCKET_BITS = 8
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of latencies in microseconds. Values below
+    2^sub_bucket_bits are recorded exactly, larger values in log-linear
+    buckets: every power of two is split in 2^(sub_bucket_bits - 1) buckets
+    of equal width. Histograms with the same sub_bucket_bits can be merged,
+    to compute the latency of a traffic class over many pg_ids, streams or
+    runs:
+
+        histograms = [get_latency_histogram(pg_id, stats) for pg_id in pg_ids]
+        merged = LatencyHistogram.merged(histograms)
+        p99_9 = merged.percentile(99.9)
+
+    Values are reported as the lower bound of their bucket: exact below
+    2^sub_bucket_bits, and within the relative error of
+    LATENCY_HISTOGRAM_SUB_BUCKET_BITS above. For instance the end of the
+    10000 us TRex bucket, 20000 us, is reported as 19968 us with 8 bits.
+
+    :parameters:
+        sub_bucket_bits: int
+            precision of the histogram, see LATENCY_HISTOGRAM_SUB_BUCKET_BITS
+    """
+
+    def __init__(self, sub_bucket_bits: int = LATENCY_HISTOGRAM_SUB_BUCKET_BITS):
+        if sub_bucket_bits < 1:
+            raise ValueError("A latency histogram needs at least 1 sub-bucket bit")
+        self.sub_bucket_bits = sub_bucket_bits
+        self.counts = np.zeros(1 << sub_bucket_bits, dtype=np.int64)
+
+    def _indexes(self, values) -> np.ndarray:
+        values = np.floor(np.asarray(values, dtype=np.float64)).astype(np.int64)
+        if (values < 0).any():
+            raise ValueError("Latencies cannot be negative")
+        sub_buckets = 1 << self.sub_bucket_bits
+        # frexp() exponents are the bit lengths of the values.
+        _, bit_lengths = np.frexp(values)
+        shifts = np.maximum(bit_lengths - self.sub_bucket_bits, 0)
+        return np.where(
+            shifts == 0,
+            values,
+            sub_buckets
+            + (shifts - 1) * (sub_buckets >> 1)
+            + (values >> shifts)
+            - (sub_buckets >> 1),
+        )
+
+    def _lower_bounds(self, indexes) -> np.ndarray:
+        indexes = np.asarray(indexes, dtype=np.int64)
+        sub_buckets = 1 << self.sub_bucket_bits
+        half = sub_buckets >> 1
+        exact = indexes < sub_buckets
+        shifts = np.where(exact, 0, (indexes - sub_buckets) // half + 1)
+        subs = np.where(exact, indexes, (indexes - sub_buckets) % half + half)
+        return subs << shifts
+
+    def record(self, values, counts=1) -> None:
+        """
+        Records latencies.
+
+        :parameters:
+            values: float or array-like
+                latencies in microseconds, truncated to integers
+            counts: int or array-like
+                number of occurrences of each value
+        """
+        indexes = np.atleast_1d(self._indexes(values))
+        counts = np.broadcast_to(np.asarray(counts, dtype=np.int64), indexes.shape)
+        if not len(indexes):
+            return
+        size = int(indexes.max()) + 1
+        if size > len(self.counts):
+            self.counts = np.concatenate(
+                [self.counts, np.zeros(size - len(self.counts), dtype=np.int64)]
+            )
+        np.add.at(self.counts, indexes, counts)
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        """
+        Adds the counts of another histogram to this one.
+
+        :returns:
+            This histogram
+        """
+        if other.sub_bucket_bits != self.sub_bucket_bits:
+            raise ValueError(
+                "Cannot merge latency histograms of {} and {} sub-bucket bits".format(
+                    self.sub_bucket_bits, other.sub_bucket_bits
+                )
+            )
+        if len(other.counts) > len(self.counts):
+            self.counts, counts = other.counts.copy(), self.counts
+        else:
+            counts = other.counts
+        self.counts[: len(counts)] += counts
+        return self
+
+    def __iadd__(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        return self.merge(other)
+
+    def __add__(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        return self.copy().merge(other)
+
+    def copy(self) -> "LatencyHistogram":
+        histogram = LatencyHistogram(self.sub_bucket_bits)
+        histogram.counts = self.counts.copy()
+        return histogram
+
+    @classmethod
+    def merged(cls, histograms) -> "LatencyHistogram":
+        """
+        :returns:
+            A new histogram with the counts of all the given histograms
+        """
+        histograms = list(histograms)
+        if not histograms:
+            return cls()
+        result = histograms[0].copy()
+        for histogram in histograms[1:]:
+            result.merge(histogram)
+        return result
+
+    @classmethod
+    def from_trex(
+        cls, histogram: dict, sub_bucket_bits: int = LATENCY_HISTOGRAM_SUB_BUCKET_BITS
+    ) -> "LatencyHistogram":
+        """
+        Builds a histogram from the histogram of TRex latency stats, which
+        maps bucket starts to counts. Like get_latency_stats(), every packet
+        of a bucket is assumed to have the latency of the bucket end.
+        """
+        result = cls(sub_bucket_bits)
+        starts = sorted(histogram)
+        result.record(
+            [latency_bucket_end(start) for start in starts],
+            [histogram[start] for start in starts],
+        )
+        return result
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def buckets(self):
+        """
+        :returns:
+            A tuple (values, counts) of arrays with the lower bound and count
+            of the non empty buckets
+        """
+        indexes = np.flatnonzero(self.counts)
+        return self._lower_bounds(indexes), self.counts[indexes]
+
+    def percentile(self, q):
+        """
+        Latency percentiles, computed by nearest rank.
+
+        :parameters:
+            q: float or array-like
+                percentiles to compute, between 0 and 100
+        :returns:
+            The lower bound of the bucket of each percentile, NaN when the
+            histogram is empty
+        """
+        q = np.asarray(q, dtype=np.float64)
+        total = self.total
+        if total == 0:
+            return np.full(q.shape, np.nan)[()]
+        ranks = np.maximum(np.ceil(q / 100 * total), 1)
+        indexes = np.searchsorted(np.cumsum(self.counts), ranks)
+        return self._lower_bounds(indexes)[()]
+
+    @property
+    def min(self) -> float:
+        values, _ = self.buckets()
+        return float(values[0]) if len(values) else np.nan
+
+    @property
+    def max(self) -> float:
+        values, _ = self.buckets()
+        return float(values[-1]) if len(values) else np.nan
+
+    @property
+    def mean(self) -> float:
+        values, counts = self.buckets()
+        return float((values * counts).sum() / counts.sum()) if len(values) else np.nan
+
+    def to_dict(self) -> dict:
+        """
+        :returns:
+            A JSON serializable dictionary with the non empty buckets, see
+            from_dict()
+        """
+        values, counts = self.buckets()
+        return {
+            "sub_bucket_bits": self.sub_bucket_bits,
+            "values": values.tolist(),
+            "counts": counts.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LatencyHistogram":
+        result = cls(data["sub_bucket_bits"])
+        result.record(data["values"], data["counts"])
+        return result
+
+    def save(self, path: str) -> None:
+        """
+        Writes the histogram as JSON, see load().
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path: str) -> "LatencyHistogram":
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+
+def get_latency_histogram(
+    pg_id: int, stats, sub_bucket_bits: int = LATENCY_HISTOGRAM_SUB_BUCKET_BITS
+) -> LatencyHistogram:
+    """
+    :returns:
+        The latency histogram of a pg_id in TRex stats
+    """
+    lat_stats = stats["latency"].get(pg_id)
+    return LatencyHistogram.from_trex(
+        lat_stats["latency"]["histogram"], sub_bucket_bits
+    )
+
+
 def get_flow_stats(pg_id: int, stats) -> FlowStats:
     flow_stats = stats["flow_stats"].get(pg_id)
     ret = FlowStats(
@@ -407,6 +841,813 @@ def get_readable_flow_rate_shares(stats: FlowRateShares) -> str:
     RX total: {to_readable(stats.rx_bps_total)}\n{rx_str}"""
 
 
+# Throughput search
+
+# Maximum loss ratio of each throughput searched by binary_search_throughput():
+# the no drop rate (NDR) and the partial drop rate (PDR).
+THROUGHPUT_SEARCH_LOSS_RATIOS = {"ndr": 0.0, "pdr": 0.005}
+# The search stops when the rate of every threshold is known within this
+# fraction of the lowest rate that exceeded it.
+THROUGHPUT_SEARCH_PRECISION = 0.005
+THROUGHPUT_SEARCH_MAX_TRIALS = 20
+THROUGHPUT_SEARCH_TRIAL_SECONDS = 10
+
+ThroughputTrial = collections.namedtuple(
+    "ThroughputTrial",
+    [
+        # Offered L1 rate (bps)
+        "rate_bps",
+        "tx_packets",
+        "rx_packets",
+        # Fraction of the transmitted packets that were not received
+        "loss_ratio",
+        # Received L1 rate (bps) over the trial
+        "rx_bps_L1",
+        # LatencyStats of the trial, None when latency was not measured
+        "latency",
+    ],
+)
+
+ThroughputSearchResult = collections.namedtuple(
+    "ThroughputSearchResult",
+    [
+        # Threshold name (like "ndr") to the highest rate (bps) whose loss
+        # ratio was within the threshold, 0 when no rate was
+        "rates",
+        # ThroughputTrials in the order they were run
+        "trials",
+    ],
+)
+
+
+def binary_search_throughput(
+    run_trial,
+    max_bps: float,
+    loss_ratios: dict = THROUGHPUT_SEARCH_LOSS_RATIOS,
+    precision: float = THROUGHPUT_SEARCH_PRECISION,
+    max_trials: int = THROUGHPUT_SEARCH_MAX_TRIALS,
+) -> ThroughputSearchResult:
+    """
+    RFC 2544 style throughput search: binary searches the highest offered
+    rate whose loss ratio is within each threshold. The first trial runs at
+    the maximum rate. Every trial narrows the search of all thresholds, the
+    next one runs in the middle of the widest interval left.
+
+    :parameters:
+        run_trial: callable
+            runs a trial at the given rate (bps) and returns its
+            ThroughputTrial
+        max_bps: float
+            maximum rate to search, like the port speed
+        loss_ratios: dict
+            threshold name to maximum loss ratio
+        precision: float
+            relative resolution of the search. A threshold not met at
+            max_bps * precision is reported with a rate of 0.
+        max_trials: int
+            maximum number of trials
+    :returns:
+        The ThroughputSearchResult
+    """
+    passed = dict.fromkeys(loss_ratios, 0)
+    failed = dict.fromkeys(loss_ratios, max_bps)
+    trials = []
+    rate = max_bps
+    while len(trials) < max_trials:
+        trial = run_trial(rate)
+        trials.append(trial)
+        for name, loss_ratio in loss_ratios.items():
+            if trial.loss_ratio <= loss_ratio:
+                passed[name] = max(passed[name], rate)
+            else:
+                failed[name] = min(failed[name], rate)
+        if len(trials) == 1:
+            # Thresholds met at the maximum rate are done.
+            for name in loss_ratios:
+                if passed[name] == max_bps:
+                    failed[name] = max_bps
+        # Thresholds failing even below max_bps * precision are done, with a
+        # rate of 0.
+        widths = {
+            name: 0
+            if failed[name] <= max_bps * precision
+            else (failed[name] - passed[name]) / failed[name]
+            for name in loss_ratios
+        }
+        name = max(widths, key=widths.get)
+        if widths[name] <= precision:
+            break
+        rate = (passed[name] + failed[name]) / 2
+    return ThroughputSearchResult(rates=passed, trials=trials)
+
+
+def get_readable_throughput_search(result: ThroughputSearchResult) -> str:
+    trials = "\n".join(
+        [
+            "        {:>12} offered, {:>12} received, loss {:.4%}{}".format(
+                to_readable(trial.rate_bps),
+                to_readable(trial.rx_bps_L1),
+                trial.loss_ratio,
+                ""
+                if trial.latency is None
+                else f", latency avg {trial.latency.average} us,"
+                f" 99.9th percentile {trial.latency.percentile_99_9} us",
+            )
+            for trial in sorted(result.trials, key=lambda trial: trial.rate_bps)
+        ]
+    )
+    rates = "\n".join(
+        [
+            f"    {name.upper()}: {to_readable(rate)}"
+            for name, rate in result.rates.items()
+        ]
+    )
+    return f"""Throughput search:
+{rates}
+    Trials:
+{trials}"""
+
+
+def write_throughput_curve(path: str, results: dict) -> None:
+    """
+    Writes the throughput/latency curve of throughput searches as CSV, one
+    row per trial sorted by offered rate.
+
+    :parameters:
+        path: str
+            the CSV file to write
+        results: dict
+            traffic (like the frame size) to ThroughputSearchResult
+    """
+    columns = [
+        "traffic",
+        "rate_bps",
+        "rx_bps_L1",
+        "tx_packets",
+        "rx_packets",
+        "loss_ratio",
+        "latency_average_us",
+        "latency_percentile_99_us",
+        "latency_percentile_99_9_us",
+        "latency_max_us",
+    ]
+    names = list(
+        dict.fromkeys(name for result in results.values() for name in result.rates)
+    )
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns + [f"{name}_bps" for name in names])
+        for traffic, result in results.items():
+            for trial in sorted(result.trials, key=lambda trial: trial.rate_bps):
+                latency = trial.latency
+                writer.writerow(
+                    [
+                        traffic,
+                        trial.rate_bps,
+                        trial.rx_bps_L1,
+                        trial.tx_packets,
+                        trial.rx_packets,
+                        trial.loss_ratio,
+                    ]
+                    + (
+                        [""] * 4
+                        if latency is None
+                        else [
+                            latency.average,
+                            latency.percentile_99,
+                            latency.percentile_99_9,
+                            latency.total_max,
+                        ]
+                    )
+                    + [result.rates.get(name, "") for name in names]
+                )
+
+
+# Latency under load sweeps
+
+# Offered load of each step of a sweep, as a fraction of the link rate
+LOAD_SWEEP_STEPS = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2]
+# Percentiles of the latency reported for each step
+LOAD_SWEEP_PERCENTILES = [50, 99, 99.9]
+# The knee of a curve is the first step whose tail latency is more than this
+# factor of the latency at the lowest load.
+LOAD_SWEEP_KNEE_LATENCY_FACTOR = 2
+
+LoadSweepPoint = collections.namedtuple(
+    "LoadSweepPoint",
+    [
+        "traffic_class",
+        # Aggregate offered load, as a fraction of the link rate
+        "load",
+        # L1 rate (bps) offered by the traffic class
+        "offered_bps",
+        "tx_packets",
+        "rx_packets",
+        "loss_ratio",
+        # LatencyHistogram of the traffic class
+        "latency",
+    ],
+)
+
+
+def load_sweep_knee(
+    points: [],
+    max_loss_ratio: float = 0.0,
+    latency_factor: float = LOAD_SWEEP_KNEE_LATENCY_FACTOR,
+    percentile: float = 99.9,
+):
+    """
+    Finds the knee of the latency under load curve of a traffic class: the
+    lowest load where the class loses packets or where its tail latency
+    grows beyond latency_factor times the latency at the lowest load.
+
+    :parameters:
+        points: []
+            LoadSweepPoints of one traffic class
+        max_loss_ratio: float
+            loss ratio tolerated before the knee
+        latency_factor: float
+            tail latency growth tolerated before the knee
+        percentile: float
+            percentile of the tail latency
+    :returns:
+        The load of the knee, None when the class is protected at every load
+    """
+    points = sorted(points, key=lambda point: point.load)
+    baseline = None
+    for point in points:
+        if point.loss_ratio > max_loss_ratio:
+            return point.load
+        if point.latency.total == 0:
+            continue
+        latency = point.latency.percentile(percentile)
+        if baseline is None:
+            baseline = latency
+        elif latency > latency_factor * max(baseline, 1):
+            return point.load
+    return None
+
+
+def write_load_sweep(path: str, points: []) -> None:
+    """
+    Writes the latency under load curves of a sweep as CSV, one row per
+    traffic class and step.
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            [
+                "traffic_class",
+                "load",
+                "offered_bps",
+                "tx_packets",
+                "rx_packets",
+                "loss_ratio",
+            ]
+            + [
+                "latency_percentile_{}_us".format(str(q).replace(".", "_"))
+                for q in LOAD_SWEEP_PERCENTILES
+            ]
+            + ["latency_max_us"]
+        )
+        for point in points:
+            writer.writerow(
+                [
+                    point.traffic_class,
+                    point.load,
+                    point.offered_bps,
+                    point.tx_packets,
+                    point.rx_packets,
+                    point.loss_ratio,
+                ]
+                + list(np.atleast_1d(point.latency.percentile(LOAD_SWEEP_PERCENTILES)))
+                + [point.latency.max]
+            )
+
+
+def get_readable_load_sweep(points: []) -> str:
+    classes = list(dict.fromkeys(point.traffic_class for point in points))
+    lines = []
+    for traffic_class in classes:
+        class_points = [
+            point for point in points if point.traffic_class == traffic_class
+        ]
+        knee = load_sweep_knee(class_points)
+        knee = "none" if knee is None else f"{knee:.0%} load"
+        lines.append(f"    {traffic_class} (knee: {knee})")
+        for point in sorted(class_points, key=lambda point: point.load):
+            p50, p99, p99_9 = point.latency.percentile(LOAD_SWEEP_PERCENTILES)
+            lines.append(
+                "        {:>4.0%} load: {:>12} offered, loss {:.4%}, latency p50 {} us,"
+                " p99 {} us, p99.9 {} us".format(
+                    point.load,
+                    to_readable(point.offered_bps),
+                    point.loss_ratio,
+                    p50,
+                    p99,
+                    p99_9,
+                )
+            )
+    return "Latency under load:\n" + "\n".join(lines)
+
+
+# Run telemetry export
+
+# Prefix of the exported metric names
+TELEMETRY_METRIC_PREFIX = "linerate"
+# Quantile label of each latency percentile of LatencyStats
+LATENCY_QUANTILES = {
+    "0.5": "percentile_50",
+    "0.75": "percentile_75",
+    "0.9": "percentile_90",
+    "0.99": "percentile_99",
+    "0.999": "percentile_99_9",
+    "0.9999": "percentile_99_99",
+    "0.99999": "percentile_99_999",
+}
+# Counters of LatencyStats, exported with an "error" label
+LATENCY_ERROR_COUNTERS = [
+    "dropped",
+    "out_of_order",
+    "duplicate",
+    "seq_too_high",
+    "seq_too_low",
+]
+
+MetricSample = collections.namedtuple(
+    "MetricSample", ["name", "labels", "value", "timestamp"]
+)
+
+
+def pipeline_hash(*paths: str) -> str:
+    """
+    Identifies a pipeline build by the content of its files.
+
+    :parameters:
+        paths: str
+            files of the pipeline, like the P4Info and the pipeline config.
+            Missing files are ignored.
+    :returns:
+        The first 16 hex digits of the SHA-256 of the files, an empty string
+        when no file exists
+    """
+    digest = hashlib.sha256()
+    found = False
+    for path in paths:
+        if not path or not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        found = True
+    return digest.hexdigest()[:16] if found else ""
+
+
+def _openmetrics_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = [
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for key, value in labels.items()
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+def _openmetrics_value(value) -> str:
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    value = float(value)
+    if np.isnan(value):
+        return "NaN"
+    if np.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class RunTelemetry:
+    """
+    Collects the results of a line rate run as metric samples, labelled with
+    the run metadata, and writes them as OpenMetrics text, CSV or Parquet so
+    that runs can be loaded into dashboards and compared across builds.
+
+        telemetry = RunTelemetry({"profile": "fabric-int", "test": "MeterTest"})
+        telemetry.add_port_stats(0, get_port_stats(0, stats))
+        telemetry.add_latency_stats(get_latency_stats(pg_id, stats))
+        telemetry.write("/tmp/run.prom")
+
+    Metric names are prefixed with TELEMETRY_METRIC_PREFIX. Samples without
+    timestamp get the time at which they are added.
+
+    :parameters:
+        metadata: dict
+            labels added to every sample, like the profile, the test class and
+            the pipeline hash
+        prefix: str
+            prefix of the metric names
+    """
+
+    def __init__(self, metadata: dict = None, prefix: str = TELEMETRY_METRIC_PREFIX):
+        self.metadata = {key: str(value) for key, value in (metadata or {}).items()}
+        self.prefix = prefix
+        # Metric family name to (type, help), in insertion order
+        self.families = {}
+        # Metric family name to its samples
+        self.samples = collections.defaultdict(list)
+        # pg_id to the merged latency histogram of all its LatencyStats
+        self.latency_histograms = {}
+
+    def __len__(self):
+        return sum(len(samples) for samples in self.samples.values())
+
+    def add(
+        self,
+        family: str,
+        value,
+        labels: dict = None,
+        timestamp: float = None,
+        metric_type: str = "gauge",
+        help: str = "",
+        suffix: str = None,
+    ) -> None:
+        """
+        Adds a sample.
+
+        :parameters:
+            family: str
+                metric family name, without prefix
+            value: int or float
+                value of the sample
+            labels: dict
+                labels of the sample, added to the run metadata
+            timestamp: float
+                time of the sample in seconds since epoch, now when None
+            metric_type: str
+                OpenMetrics type of the family: gauge, counter or histogram
+            help: str
+                description of the family
+            suffix: str
+                suffix of the sample name, "_total" by default for counters
+        """
+        name = f"{self.prefix}_{family}"
+        known_type, _ = self.families.setdefault(name, (metric_type, help))
+        if known_type != metric_type:
+            raise ValueError(
+                f"Metric {name} is a {known_type}, cannot add a {metric_type} sample"
+            )
+        if suffix is None:
+            suffix = "_total" if metric_type == "counter" else ""
+        sample_labels = dict(self.metadata)
+        sample_labels.update({key: str(value) for key, value in (labels or {}).items()})
+        if timestamp is None:
+            timestamp = time.time()
+        self.samples[name].append(
+            MetricSample(name + suffix, sample_labels, value, timestamp)
+        )
+
+    def add_port_stats(
+        self, port: int, stats: PortStats, timestamp: float = None
+    ) -> None:
+        """
+        Adds the counters and rates of a port, see get_port_stats().
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        for field in PortStats._fields:
+            direction, _, stat = field.partition("_")
+            labels = {"port": port, "direction": direction}
+            metric_type = (
+                "counter" if stat in ["packets", "bytes", "errors"] else "gauge"
+            )
+            self.add(
+                f"port_{stat.lower()}",
+                getattr(stats, field),
+                labels,
+                timestamp,
+                metric_type,
+            )
+
+    def add_port_rates(
+        self, port: int, rates: PortRates, start_timestamp: float
+    ) -> None:
+        """
+        Adds the rates of a port sampled by PortStatsSampler, one sample per
+        interval.
+
+        :parameters:
+            port: int
+                port of the rates
+            rates: PortRates
+                rates returned by PortStatsSampler.rates()
+            start_timestamp: float
+                wall-clock start of the sampler, see
+                PortStatsSampler.start_timestamp
+        """
+        timestamps = start_timestamp + rates.time
+        for field in PortRates._fields[1:]:
+            direction, _, stat = field.partition("_")
+            labels = {"port": port, "direction": direction}
+            for timestamp, value in zip(timestamps, getattr(rates, field)):
+                self.add(f"port_sampled_{stat.lower()}", value, labels, timestamp)
+
+    def add_flow_stats(self, stats: FlowStats, timestamp: float = None) -> None:
+        """
+        Adds the counters of a pg_id, see get_flow_stats().
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        for field in FlowStats._fields[1:]:
+            direction, _, stat = field.partition("_")
+            labels = {"pg_id": stats.pg_id, "direction": direction}
+            self.add(
+                f"flow_{stat}", getattr(stats, field), labels, timestamp, "counter"
+            )
+
+    def add_flow_rate_shares(
+        self, shares: FlowRateShares, timestamp: float = None
+    ) -> None:
+        """
+        Adds the rate and share of each pg_id, see get_flow_rate_shares().
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        for direction in ["tx", "rx"]:
+            bps = getattr(shares, f"{direction}_bps")
+            ratios = getattr(shares, f"{direction}_shares")
+            for pg_id in bps:
+                labels = {"pg_id": pg_id, "direction": direction}
+                self.add("flow_bps", bps[pg_id], labels, timestamp)
+                self.add("flow_rate_share", ratios[pg_id], labels, timestamp)
+
+    def add_latency_stats(self, stats: LatencyStats, timestamp: float = None) -> None:
+        """
+        Adds the latency of a pg_id, see get_latency_stats(): the summary
+        statistics, the percentiles with a "quantile" label, the error
+        counters and the histogram with cumulative buckets.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        histogram = LatencyHistogram.from_trex(stats.histogram)
+        if stats.pg_id in self.latency_histograms:
+            self.latency_histograms[stats.pg_id].merge(histogram)
+        else:
+            self.latency_histograms[stats.pg_id] = histogram
+        labels = {"pg_id": stats.pg_id}
+        for field in ["average", "jitter", "total_min", "total_max", "last_max"]:
+            self.add(f"latency_{field}_us", getattr(stats, field), labels, timestamp)
+        for quantile, field in LATENCY_QUANTILES.items():
+            self.add(
+                "latency_percentile_us",
+                getattr(stats, field),
+                dict(labels, quantile=quantile),
+                timestamp,
+            )
+        for field in LATENCY_ERROR_COUNTERS:
+            self.add(
+                "latency_errors",
+                getattr(stats, field),
+                dict(labels, error=field),
+                timestamp,
+                "counter",
+            )
+        count = 0
+        for range_start in sorted(stats.histogram):
+            count += stats.histogram[range_start]
+            self.add(
+                "latency_us",
+                count,
+                dict(labels, le=float(latency_bucket_end(range_start))),
+                timestamp,
+                "histogram",
+                suffix="_bucket",
+            )
+        self.add(
+            "latency_us",
+            count,
+            dict(labels, le="+Inf"),
+            timestamp,
+            "histogram",
+            suffix="_bucket",
+        )
+        self.add("latency_us", count, labels, timestamp, "histogram", suffix="_count")
+
+    def add_throughput_search(
+        self, result: ThroughputSearchResult, labels: dict = None, timestamp=None
+    ) -> None:
+        """
+        Adds the rates found by a throughput search and the loss, received
+        rate and latency of each trial, labelled with its offered rate.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        labels = dict(labels or {})
+        for name, rate in result.rates.items():
+            self.add("throughput_bps", rate, dict(labels, threshold=name), timestamp)
+        for trial in result.trials:
+            trial_labels = dict(labels, offered_bps=int(trial.rate_bps))
+            self.add(
+                "throughput_trial_loss_ratio", trial.loss_ratio, trial_labels, timestamp
+            )
+            self.add(
+                "throughput_trial_rx_bps_l1", trial.rx_bps_L1, trial_labels, timestamp
+            )
+            if trial.latency is None:
+                continue
+            for field in ["average", "percentile_99", "percentile_99_9", "total_max"]:
+                self.add(
+                    f"throughput_trial_latency_{field}_us",
+                    getattr(trial.latency, field),
+                    trial_labels,
+                    timestamp,
+                )
+
+    def add_load_sweep_point(
+        self, point: LoadSweepPoint, labels: dict = None, timestamp: float = None
+    ) -> None:
+        """
+        Adds the loss and latency percentiles of a traffic class at a step of
+        a latency under load sweep.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        labels = dict(labels or {}, traffic_class=point.traffic_class, load=point.load)
+        self.add("load_sweep_offered_bps", point.offered_bps, labels, timestamp)
+        self.add("load_sweep_loss_ratio", point.loss_ratio, labels, timestamp)
+        percentiles = np.atleast_1d(point.latency.percentile(LOAD_SWEEP_PERCENTILES))
+        for q, latency in zip(LOAD_SWEEP_PERCENTILES, percentiles):
+            self.add(
+                "load_sweep_latency_percentile_us",
+                latency,
+                dict(labels, quantile=f"{q / 100:g}"),
+                timestamp,
+            )
+
+    def add_int_analysis(
+        self, results, labels: dict = None, timestamp: float = None
+    ) -> None:
+        """
+        Adds the numeric fields of an INT analysis result, like the
+        ReportAnalysisResults of xnt.analyze_int_report_pcap(). Scores that
+        could not be computed (None) and non numeric fields are skipped.
+
+        :parameters:
+            results: namedtuple or dict
+                analysis results
+            labels: dict
+                labels of the samples, like the analyzed capture
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if not isinstance(results, dict):
+            results = results._asdict()
+        for field, value in results.items():
+            if isinstance(value, (bool, np.bool_)):
+                value = int(value)
+            if not isinstance(value, (int, float, np.integer, np.floating)):
+                continue
+            self.add(f"int_{field}", value, labels, timestamp)
+
+    def _rows(self):
+        label_keys = list(self.metadata)
+        for samples in self.samples.values():
+            for sample in samples:
+                for key in sample.labels:
+                    if key not in label_keys:
+                        label_keys.append(key)
+        columns = ["timestamp", "metric", "value"] + label_keys
+        rows = []
+        for samples in self.samples.values():
+            for sample in samples:
+                row = dict.fromkeys(label_keys, "")
+                row.update(sample.labels)
+                row["timestamp"] = float(sample.timestamp)
+                row["metric"] = sample.name
+                row["value"] = float(sample.value)
+                rows.append(row)
+        return columns, rows
+
+    def write_openmetrics(self, path: str) -> None:
+        """
+        Writes the samples in the OpenMetrics text format.
+        """
+        with open(path, "w") as f:
+            for name, (metric_type, help) in self.families.items():
+                f.write(f"# TYPE {name} {metric_type}\n")
+                if help:
+                    f.write(f"# HELP {name} {help}\n")
+                for sample in self.samples[name]:
+                    f.write(
+                        "{}{} {} {:.6f}\n".format(
+                            sample.name,
+                            _openmetrics_labels(sample.labels),
+                            _openmetrics_value(sample.value),
+                            sample.timestamp,
+                        )
+                    )
+            f.write("# EOF\n")
+
+    def write_csv(self, path: str) -> None:
+        """
+        Writes the samples as CSV, one row per sample and one column per
+        label.
+        """
+        columns, rows = self._rows()
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def write_parquet(self, path: str) -> None:
+        """
+        Writes the samples as Parquet, with the same columns as write_csv().
+        Requires pyarrow.
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("Parquet export requires pyarrow") from e
+        columns, rows = self._rows()
+        table = pyarrow.table(
+            {column: [row[column] for row in rows] for column in columns}
+        )
+        pyarrow.parquet.write_table(table, path)
+
+    def write_latency_histograms(self, path: str) -> None:
+        """
+        Writes the latency histogram of each pg_id and the run metadata as
+        JSON, so that the latency of several runs can be merged, see
+        load_latency_histograms().
+        """
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "metadata": self.metadata,
+                    "histograms": {
+                        str(pg_id): histogram.to_dict()
+                        for pg_id, histogram in self.latency_histograms.items()
+                    },
+                },
+                f,
+            )
+
+    def write(self, path: str) -> None:
+        """
+        Writes the samples in the format given by the file extension: .csv,
+        .parquet, or OpenMetrics text for any other extension.
+        """
+        if path.endswith(".csv"):
+            self.write_csv(path)
+        elif path.endswith(".parquet"):
+            self.write_parquet(path)
+        else:
+            self.write_openmetrics(path)
+
+
+def load_latency_histograms(path: str):
+    """
+    Reads the latency histograms written by
+    RunTelemetry.write_latency_histograms().
+
+    :returns:
+        A tuple (metadata, histograms) with the run metadata and a dictionary
+        of pg_id to LatencyHistogram
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+    histograms = {
+        int(pg_id): LatencyHistogram.from_dict(histogram)
+        for pg_id, histogram in data["histograms"].items()
+    }
+    return data["metadata"], histograms
+
+
+def merge_latency_histograms(paths: [], pg_ids: [] = None) -> LatencyHistogram:
+    """
+    Merges the latency histograms of several runs, like the latency of a
+    traffic class over repetitions of a test.
+
+    :parameters:
+        paths: []
+            files written by RunTelemetry.write_latency_histograms()
+        pg_ids: []
+            pg_ids to merge, all of them when None
+    :returns:
+        The merged LatencyHistogram
+    """
+    histograms = []
+    for path in paths:
+        _, run_histograms = load_latency_histograms(path)
+        histograms += [
+            histogram
+            for pg_id, histogram in run_histograms.items()
+            if pg_ids is None or pg_id in pg_ids
+        ]
+    return LatencyHistogram.merged(histograms)
+
+
 class ParseExtendArgAction(argparse.Action):
     def __init__(self, option_strings, dest, nargs=None, **kwargs):
         if nargs:
@@ -4,11 +4,26 @@
 
 # eXtensible Network Telemetry
 
+import argparse
+import collections
+import glob
+import hashlib
 import logging
+import mmap
+import multiprocessing
 import os
 import pickle
-from os.path import abspath, exists, splitext
-from subprocess import Popen
+import queue
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from functools import partial
+from os.path import abspath, dirname, exists, splitext
+from subprocess import PIPE, Popen, check_call
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -16,9 +31,14 @@ from scapy.fields import BitField, ShortField, XByteField, XIntField, XShortFiel
 from scapy.layers.inet import IP, TCP, UDP
 from scapy.layers.l2 import Ether
 from scapy.packet import Packet, bind_layers
-from scapy.utils import PcapReader, inet_aton
+from scapy.utils import inet_aton
 from scipy import stats
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 
 class INT_META_HDR(Packet):
     name = "INT_META"
@@ -156,7 +176,7 @@ def get_readable_int_report_str(pkt: Packet) -> str:
 def analyze_report_pcap(
     pcap_file: str, total_flows_from_trace: int = 0, drop_reason: int = 0
 ) -> dict:
-    pcap_reader = PcapReader(pcap_file)
+    pcap_reader = open_pcap_reader(pcap_file)
     skipped = 0
     dropped = 0  # based on seq number
     prev_seq_no = {}  # HW ID -> seq number
@@ -178,13 +198,7 @@ def analyze_report_pcap(
     bad_drop_report_irgs = []
     invalid_drop_report_irgs = []
     pkt_processed = 0
-    while True:
-        try:
-            report_pkt = pcap_reader.read_packet()
-        except EOFError:
-            break
-        except StopIteration:
-            break
+    for report_pkt in pcap_reader.packets():
         pkt_processed += 1
 
         if INT_L45_REPORT_FIXED not in report_pkt:
@@ -269,6 +283,8 @@ def analyze_report_pcap(
 
         five_tuple_to_prev_report_time[five_tuple] = packet_enter_time
 
+    pcap_reader.close()
+
     results = {
         "pkt_processed": pkt_processed,
         "local_reports": local_reports,
@@ -290,30 +306,69 @@ def analyze_report_pcap(
         "correct_drop_reports": correct_drop_reports,
     }
 
-    print("Pkt processed: {}".format(pkt_processed))
+    return summarize_report_analysis(
+        pcap_file,
+        results,
+        valid_local_report_irgs,
+        valid_drop_report_irgs,
+        total_flows_from_trace,
+    )
+
+
+def summarize_report_analysis(
+    pcap_file: str,
+    results: dict,
+    valid_local_report_irgs,
+    valid_drop_report_irgs,
+    total_flows_from_trace: int = 0,
+) -> dict:
+    """
+    Prints the report analysis, computes the accuracy and efficiency scores
+    and plots the IRG distributions. Shared by every analysis engine so that
+    they all produce the same output for the same capture.
+
+    :parameters:
+        pcap_file: str
+            the analyzed capture, used to name the plot files
+        results: dict
+            the counters computed by the engine, updated in place
+        valid_local_report_irgs, valid_drop_report_irgs:
+            sequences of valid IRGs (in seconds) to plot
+        total_flows_from_trace: int
+            number of flows in the trace, 0 to skip the accuracy scores
+    :returns:
+        The results dictionary
+    """
+    print("Pkt processed: {}".format(results["pkt_processed"]))
     # Local report
-    print("Local reports: {}".format(local_reports))
-    print("Total 5-tuples: {}".format(len(five_tuple_to_prev_local_report_time)))
+    print("Local reports: {}".format(results["local_reports"]))
+    print("Total 5-tuples: {}".format(results["five_tuple_to_prev_local_report_time"]))
+    print(
+        "Flows with multiple report: {}".format(
+            results["flow_with_multiple_local_reports"]
+        )
+    )
+    print("Total INT IRGs: {}".format(results["valid_local_report_irgs"]))
+    print("Total bad INT IRGs(<0.9s): {}".format(results["bad_local_report_irgs"]))
     print(
-        "Flows with multiple report: {}".format(len(flow_with_multiple_local_reports))
+        "Total invalid INT IRGs(<=0s): {}".format(results["invalid_local_report_irgs"])
     )
-    print("Total INT IRGs: {}".format(len(valid_local_report_irgs)))
-    print("Total bad INT IRGs(<0.9s): {}".format(len(bad_local_report_irgs)))
-    print("Total invalid INT IRGs(<=0s): {}".format(len(invalid_local_report_irgs)))
     if total_flows_from_trace != 0:
         flow_accuracy_score = (
-            len(five_tuple_to_prev_local_report_time) * 100 / total_flows_from_trace
+            results["five_tuple_to_prev_local_report_time"]
+            * 100
+            / total_flows_from_trace
         )
         print("Flow report filter accuracy score: {}".format(flow_accuracy_score))
         results["flow_accuracy_score"] = flow_accuracy_score
 
-    if len(valid_local_report_irgs) <= 0:
+    if results["valid_local_report_irgs"] <= 0:
         print("No valid local report IRGs")
     else:
         flow_efficiency_score = (
-            (len(valid_local_report_irgs) - len(bad_local_report_irgs))
+            (results["valid_local_report_irgs"] - results["bad_local_report_irgs"])
             * 100
-            / len(valid_local_report_irgs)
+            / results["valid_local_report_irgs"]
         )
         print("Flow report filter efficiency score: {}".format(flow_efficiency_score))
         results["flow_efficiency_score"] = flow_efficiency_score
@@ -324,28 +379,36 @@ def analyze_report_pcap(
 
     # Drop report
     print("----------------------")
-    print("Drop reports: {}".format(drop_reports))
-    print("Total 5-tuples: {}".format(len(five_tuple_to_prev_drop_report_time)))
-    print("Flows with multiple report: {}".format(len(flow_with_multiple_drop_reports)))
-    print("Total INT IRGs: {}".format(len(valid_drop_report_irgs)))
-    print("Total bad INT IRGs(<0.9s): {}".format(len(bad_drop_report_irgs)))
-    print("Total invalid INT IRGs(<=0s): {}".format(len(invalid_drop_report_irgs)))
-    print("Total report dropped: {}".format(dropped))
-    print("Skipped packets: {}".format(skipped))
+    print("Drop reports: {}".format(results["drop_reports"]))
+    print("Total 5-tuples: {}".format(results["five_tuple_to_prev_drop_report_time"]))
+    print(
+        "Flows with multiple report: {}".format(
+            results["flow_with_multiple_drop_reports"]
+        )
+    )
+    print("Total INT IRGs: {}".format(results["valid_drop_report_irgs"]))
+    print("Total bad INT IRGs(<0.9s): {}".format(results["bad_drop_report_irgs"]))
+    print(
+        "Total invalid INT IRGs(<=0s): {}".format(results["invalid_drop_report_irgs"])
+    )
+    print("Total report dropped: {}".format(results["dropped"]))
+    print("Skipped packets: {}".format(results["skipped"]))
     if total_flows_from_trace != 0:
         drop_accuracy_score = (
-            len(five_tuple_to_prev_drop_report_time) * 100 / total_flows_from_trace
+            results["five_tuple_to_prev_drop_report_time"]
+            * 100
+            / total_flows_from_trace
         )
         print("Drop report filter accuracy score: {}".format(drop_accuracy_score))
         results["drop_accuracy_score"] = drop_accuracy_score
 
-    if len(valid_drop_report_irgs) <= 0:
+    if results["valid_drop_report_irgs"] <= 0:
         print("No valid drop report IRGs")
     else:
         drop_efficiency_score = (
-            (len(valid_drop_report_irgs) - len(bad_drop_report_irgs))
+            (results["valid_drop_report_irgs"] - results["bad_drop_report_irgs"])
             * 100
-            / len(valid_drop_report_irgs)
+            / results["valid_drop_report_irgs"]
         )
         print("Drop report filter efficiency score: {}".format(drop_efficiency_score))
         results["drop_efficiency_score"] = drop_efficiency_score
@@ -356,40 +419,2544 @@ def analyze_report_pcap(
     return results
 
 
+# Fast decoding of INT report captures with NumPy.
+#
+# Instead of dissecting every packet with scapy, the raw pcap records are
+# decoded at fixed offsets into a structured array with one row per record.
+# The offsets of the variable-length headers (VLAN tags, MPLS labels, IPv4
+# options) are computed per record with array operations.
+
+PCAP_GLOBAL_HEADER_LEN = 24
+PCAP_RECORD_HEADER_LEN = 16
+PCAP_LINKTYPE_ETHERNET = 1
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+# Record lengths are verified in bulk after this many records of equal length,
+# starting with PCAP_SPECULATION_MIN records at once.
+PCAP_SPECULATION_RUN = 16
+PCAP_SPECULATION_MIN = 64
+PCAP_SPECULATION_MAX = 1 << 16
+# Number of records decoded at once, bounds the size of temporary arrays.
+DECODE_CHUNK_SIZE = 1 << 18
+# Number of valid IRGs per report type kept exactly before switching to a
+# QuantileSketch.
+EXACT_IRGS_LIMIT = 1 << 20
+
+INT_REPORT_UDP_PORT = 32766
+INT_REPORT_FIXED_LEN = 12
+INT_LOCAL_REPORT_LEN = 16
+INT_DROP_REPORT_LEN = 12
+
+ETH_TYPE_IPV4 = 0x0800
+ETH_TYPE_VLAN = 0x8100
+ETH_TYPE_QINQ = 0x88A8
+ETH_TYPE_MPLS_UNICAST = 0x8847
+IP_PROTO_TCP = 6
+IP_PROTO_UDP = 17
+
+# Maximum number of VLAN tags or MPLS labels skipped before the IPv4 header.
+MAX_L2_TAGS = 4
+
+# Values of the "kind" field of REPORT_DTYPE.
+REPORT_KIND_NONE = 0  # Not an INT report
+REPORT_KIND_LOCAL = 1  # Flow and/or queue report (with local report header)
+REPORT_KIND_DROP = 2  # Drop report
+REPORT_KIND_OTHER = 3  # INT report with an unknown nproto
+
+FIVE_TUPLE_FIELDS = ["ip_src", "ip_dst", "ip_proto", "l4_sport", "l4_dport"]
+
+# One decoded INT report (or non-report packet) per pcap record. Field names
+# follow the scapy headers above, inner 5-tuple fields are only meaningful
+# when has_five_tuple is set.
+REPORT_DTYPE = np.dtype(
+    [
+        ("capture_ns", "<i8"),
+        ("kind", "u1"),
+        ("d", "u1"),
+        ("q", "u1"),
+        ("f", "u1"),
+        ("hw_id", "u1"),
+        ("seq_no", "<u4"),
+        ("ingress_tstamp", "<u4"),
+        ("switch_id", "<u4"),
+        ("ingress_port_id", "<u2"),
+        ("egress_port_id", "<u2"),
+        ("queue_id", "u1"),
+        ("queue_occupancy", "<u4"),
+        ("egress_tstamp", "<u4"),
+        ("drop_reason", "u1"),
+        ("has_five_tuple", "?"),
+        ("ip_src", "<u4"),
+        ("ip_dst", "<u4"),
+        ("ip_proto", "u1"),
+        ("l4_sport", "<u2"),
+        ("l4_dport", "<u2"),
+    ]
+)
+
+
+class MmapPcapReader:
+    """
+    Memory-mapped pcap reader.
+
+    The file is mapped in memory and never copied: packets are exposed as
+    memoryviews of the mapping and the record offsets, captured lengths and
+    capture timestamps as NumPy arrays. The kernel pages the file in and out
+    as needed, so memory usage does not grow with the size of the capture.
+    Views returned by the reader are only valid until close() is called.
+
+    :parameters:
+        pcap_file: str
+            path to a pcap file (Ethernet link type)
+    """
+
+    def __init__(self, pcap_file: str):
+        self.pcap_file = pcap_file
+        with open(pcap_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size < PCAP_GLOBAL_HEADER_LEN:
+                raise ValueError("{} is not a pcap file".format(pcap_file))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = np.frombuffer(self._mmap, dtype=np.uint8)
+
+        magic = struct.unpack_from("<I", self._mmap, 0)[0]
+        if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            endian = "<"
+        else:
+            magic = struct.unpack_from(">I", self._mmap, 0)[0]
+            endian = ">"
+            if magic not in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+                self.close()
+                raise ValueError("{} is not a pcap file".format(pcap_file))
+        frac_to_ns = 1 if magic == PCAP_MAGIC_NSEC else 1000
+        linktype = struct.unpack_from(endian + "I", self._mmap, 20)[0]
+        if linktype != PCAP_LINKTYPE_ETHERNET:
+            self.close()
+            raise ValueError("Unsupported pcap link type {}".format(linktype))
+
+        # Start offset of the packet bytes, captured length and capture time
+        # in nanoseconds of every record.
+        self.offsets = _walk_pcap_records(self.data, endian)
+        self.lengths, self.capture_ns = _pcap_record_fields(
+            self.data, self.offsets, endian, frac_to_ns
+        )
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        if self._mmap is None:
+            return
+        self.data = None
+        self._mmap.close()
+        self._mmap = None
+
+    def packet_bytes(self, index: int) -> memoryview:
+        offset = int(self.offsets[index])
+        return memoryview(self._mmap)[offset : offset + int(self.lengths[index])]
+
+    def __iter__(self):
+        """
+        Yields the bytes of every packet as a memoryview.
+        """
+        view = memoryview(self._mmap)
+        for offset, length in zip(self.offsets.tolist(), self.lengths.tolist()):
+            yield view[offset : offset + length]
+
+    def packets(self):
+        """
+        Yields every packet dissected by scapy, for the analyses that need
+        full dissection. Only one packet is alive at a time.
+        """
+        for offset, length, capture_ns in zip(
+            self.offsets.tolist(), self.lengths.tolist(), self.capture_ns.tolist()
+        ):
+            # Slicing the mapping copies the packet without exporting a view,
+            # so the reader can be closed even if the iteration is abandoned.
+            pkt = Ether(self._mmap[offset : offset + length])
+            pkt.time = capture_ns / 10 ** 9
+            yield pkt
+
+    def decode_reports(self, chunk_size: int = DECODE_CHUNK_SIZE) -> np.ndarray:
+        """
+        Decodes every record as an INT report, see decode_report_records.
+        Records are decoded chunk by chunk to bound the temporary memory.
+        """
+        return _decode_report_chunks(
+            self.data, self.offsets, self.lengths, self.capture_ns, chunk_size
+        )
+
+
+def _read_u32(data, pos, endian):
+    b = [data[pos + i].astype(np.uint32) for i in range(4)]
+    if endian == ">":
+        b.reverse()
+    return b[0] | (b[1] << 8) | (b[2] << 16) | (b[3] << 24)
+
+
+def _walk_records(data, endian, offset, length_pos, header_len, min_stride):
+    """
+    Returns the offsets of every complete record of a buffer, starting at
+    offset. The length of a record is header_len plus the 32-bit field at
+    length_pos in its header. The walk stops at the first truncated record,
+    or at the first record shorter than min_stride.
+
+    Records have variable length, so they can only be located one after the
+    other. INT reports are truncated by the switch and usually have the same
+    length: after a run of records with the same length, we guess that the
+    next records have that length too and verify the guess for many records
+    at once, doubling the guess on every success.
+    """
+    buf = memoryview(data)
+    length_field = struct.Struct(endian + "I")
+    chunks = []
+    offsets = []
+    size = len(data)
+    prev_length = -1
+    run = 0
+    guess = PCAP_SPECULATION_MIN
+    while offset + max(header_len, length_pos + 4) <= size:
+        length = length_field.unpack_from(buf, offset + length_pos)[0]
+        stride = header_len + length
+        if stride < min_stride:
+            break
+        if run < PCAP_SPECULATION_RUN:
+            # Like PcapReader, we stop at a truncated last record.
+            if offset + stride > size:
+                break
+            offsets.append(offset)
+            if len(offsets) == PCAP_SPECULATION_MAX:
+                chunks.append(np.array(offsets, dtype=np.int64))
+                offsets = []
+            run = run + 1 if length == prev_length else 1
+            prev_length = length
+            offset += stride
+            continue
+        count = min(guess, (size - offset) // stride)
+        if count == 0:
+            break
+        headers = offset + np.arange(count, dtype=np.int64) * stride
+        mismatch = np.flatnonzero(
+            _read_u32(data, headers + length_pos, endian) != length
+        )
+        matched = int(mismatch[0]) if len(mismatch) else count
+        chunks.append(np.array(offsets, dtype=np.int64))
+        chunks.append(headers[:matched])
+        offsets = []
+        offset += matched * stride
+        if matched == count:
+            guess = min(guess * 2, PCAP_SPECULATION_MAX)
+        else:
+            run = 0
+            guess = PCAP_SPECULATION_MIN
+    chunks.append(np.array(offsets, dtype=np.int64))
+    return np.concatenate(chunks)
+
+
+def _walk_pcap_records(data, endian, offset=PCAP_GLOBAL_HEADER_LEN) -> np.ndarray:
+    """
+    Returns the offsets of the packet bytes of every complete pcap record,
+    see _walk_records.
+    """
+    headers = _walk_records(
+        data, endian, offset, 8, PCAP_RECORD_HEADER_LEN, PCAP_RECORD_HEADER_LEN
+    )
+    return headers + PCAP_RECORD_HEADER_LEN
+
+
+def _pcap_record_fields(data, offsets, endian, frac_to_ns):
+    """
+    Returns the captured length and the capture time in nanoseconds of the
+    pcap records with packet bytes at offsets.
+    """
+    header = offsets - PCAP_RECORD_HEADER_LEN
+    seconds = _read_u32(data, header, endian).astype(np.int64)
+    fractions = _read_u32(data, header + 4, endian).astype(np.int64)
+    lengths = _read_u32(data, header + 8, endian).astype(np.int64)
+    return lengths, seconds * 10 ** 9 + fractions * frac_to_ns
+
+
+class _RecordView:
+    """
+    Big-endian reads at per-record offsets of a packet buffer. Reads past
+    the end of a record return garbage, callers are expected to check has()
+    before trusting a value.
+    """
+
+    def __init__(self, data, offsets, lengths):
+        self.data = data
+        self.end = offsets + lengths
+        self.last = max(len(data) - 1, 0)
+
+    def has(self, pos, size):
+        return pos + size <= self.end
+
+    def u8(self, pos):
+        return self.data[np.minimum(pos, self.last)].astype(np.uint32)
+
+    def u16(self, pos):
+        return (self.u8(pos) << 8) | self.u8(pos + 1)
+
+    def u24(self, pos):
+        return (self.u8(pos) << 16) | self.u16(pos + 1)
+
+    def u32(self, pos):
+        return (self.u16(pos) << 16) | self.u16(pos + 2)
+
+    def skip_l2(self, pos, valid):
+        """
+        Skips an Ethernet header and any VLAN tags or MPLS labels after it.
+        Returns the offset of the L3 header and a mask of records carrying
+        IPv4 at that offset.
+        """
+        valid = valid & self.has(pos, 14)
+        eth_type = self.u16(pos + 12)
+        pos = pos + 14
+        for _ in range(MAX_L2_TAGS):
+            tagged = valid & ((eth_type == ETH_TYPE_VLAN) | (eth_type == ETH_TYPE_QINQ))
+            if not tagged.any():
+                break
+            valid = valid & (~tagged | self.has(pos, 4))
+            eth_type = np.where(tagged, self.u16(pos + 2), eth_type)
+            pos = np.where(tagged, pos + 4, pos)
+        mpls = valid & (eth_type == ETH_TYPE_MPLS_UNICAST)
+        for _ in range(MAX_L2_TAGS):
+            if not mpls.any():
+                break
+            valid = valid & (~mpls | self.has(pos, 4))
+            bottom_of_stack = mpls & ((self.u8(pos + 2) & 1) == 1)
+            pos = np.where(mpls, pos + 4, pos)
+            # After the last label the payload is guessed from the IP version.
+            is_ipv4 = bottom_of_stack & ((self.u8(pos) >> 4) == 4)
+            eth_type = np.where(is_ipv4, ETH_TYPE_IPV4, eth_type)
+            mpls = mpls & ~bottom_of_stack
+        return pos, valid & (eth_type == ETH_TYPE_IPV4) & ~mpls
+
+    def skip_ipv4(self, pos, valid):
+        """
+        Parses an IPv4 header. Returns the offset of the L4 header, the end of
+        the IPv4 payload, the protocol and a mask of non-fragmented packets
+        with a complete IPv4 header.
+        """
+        valid = valid & self.has(pos, 20)
+        ihl = (self.u8(pos) & 0x0F).astype(np.int64) * 4
+        total_len = self.u16(pos + 2).astype(np.int64)
+        frag = self.u16(pos + 6) & 0x1FFF
+        proto = self.u8(pos + 9)
+        valid = valid & (ihl >= 20) & self.has(pos, ihl) & (frag == 0)
+        payload_end = np.where(
+            total_len >= ihl, np.minimum(self.end, pos + total_len), self.end
+        )
+        return pos + ihl, payload_end, proto, valid
+
+
+def decode_report_records(data, offsets, lengths, capture_ns) -> np.ndarray:
+    """
+    Decodes INT report packets from raw pcap records.
+
+    :parameters:
+        data: numpy array of uint8 holding the packet bytes
+        offsets, lengths: int64 arrays with the position and captured length
+            of each packet in data
+        capture_ns: int64 array with the capture time of each packet
+    :returns:
+        A numpy array of REPORT_DTYPE with one entry per record
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    reports = np.zeros(len(offsets), dtype=REPORT_DTYPE)
+    reports["capture_ns"] = capture_ns
+    if len(offsets) == 0:
+        return reports
+    view = _RecordView(data, offsets, lengths)
+
+    # Outer headers: Ethernet / IPv4 / UDP with INT report destination port.
+    pos, valid = view.skip_l2(offsets, np.ones(len(offsets), dtype=bool))
+    pos, _, proto, valid = view.skip_ipv4(pos, valid)
+    valid = valid & (proto == IP_PROTO_UDP) & view.has(pos, 8)
+    valid = valid & (view.u16(pos + 2) == INT_REPORT_UDP_PORT)
+
+    # Fixed report header
+    fixed = pos + 8
+    valid = valid & view.has(fixed, INT_REPORT_FIXED_LEN)
+    nproto = view.u8(fixed) & 0x0F
+    flags = view.u8(fixed + 1)
+    reports["d"] = np.where(valid, (flags >> 7) & 1, 0)
+    reports["q"] = np.where(valid, (flags >> 6) & 1, 0)
+    reports["f"] = np.where(valid, (flags >> 5) & 1, 0)
+    reports["hw_id"] = np.where(valid, view.u8(fixed + 3) & 0x3F, 0)
+    reports["seq_no"] = np.where(valid, view.u32(fixed + 4), 0)
+    reports["ingress_tstamp"] = np.where(valid, view.u32(fixed + 8), 0)
+
+    # Local or drop report header
+    report = fixed + INT_REPORT_FIXED_LEN
+    local = valid & (nproto == 2) & view.has(report, INT_LOCAL_REPORT_LEN)
+    drop = valid & (nproto == 1) & view.has(report, INT_DROP_REPORT_LEN)
+    is_report = local | drop
+    reports["kind"] = np.where(
+        local,
+        REPORT_KIND_LOCAL,
+        np.where(drop, REPORT_KIND_DROP, np.where(valid, REPORT_KIND_OTHER, 0)),
+    )
+    reports["switch_id"] = np.where(is_report, view.u32(report), 0)
+    reports["ingress_port_id"] = np.where(is_report, view.u16(report + 4), 0)
+    reports["egress_port_id"] = np.where(is_report, view.u16(report + 6), 0)
+    reports["queue_id"] = np.where(is_report, view.u8(report + 8), 0)
+    reports["queue_occupancy"] = np.where(local, view.u24(report + 9), 0)
+    reports["egress_tstamp"] = np.where(local, view.u32(report + 12), 0)
+    reports["drop_reason"] = np.where(drop, view.u8(report + 9), 0)
+
+    # Inner packet: Ethernet / IPv4 / TCP or UDP
+    inner = np.where(local, report + INT_LOCAL_REPORT_LEN, report + INT_DROP_REPORT_LEN)
+    inner_valid = _decode_five_tuples(view, inner, is_report, reports)
+    inner_valid = inner_valid & (
+        (reports["ip_proto"] == IP_PROTO_TCP) | (reports["ip_proto"] == IP_PROTO_UDP)
+    )
+    reports["has_five_tuple"] = inner_valid
+    for field in FIVE_TUPLE_FIELDS:
+        reports[field] = np.where(inner_valid, reports[field], 0)
+    return reports
+
+
+def _decode_five_tuples(view, pos, valid, records) -> np.ndarray:
+    """
+    Decodes the 5-tuple of Ethernet / IPv4 packets starting at pos into
+    records. Ports are only decoded for complete TCP and UDP headers, and left
+    to 0 otherwise, as well as the protocol of TCP or UDP packets with
+    truncated headers. Returns the mask of IPv4 packets.
+    """
+    pos, valid = view.skip_l2(pos, valid)
+    ip = pos
+    pos, payload_end, proto, valid = view.skip_ipv4(pos, valid)
+    is_tcp = proto == IP_PROTO_TCP
+    is_udp = proto == IP_PROTO_UDP
+    has_ports = valid & (
+        (is_tcp & (pos + 20 <= payload_end)) | (is_udp & (pos + 8 <= payload_end))
+    )
+    records["ip_src"] = np.where(valid, view.u32(ip + 12), 0)
+    records["ip_dst"] = np.where(valid, view.u32(ip + 16), 0)
+    records["ip_proto"] = np.where(has_ports | (valid & ~is_tcp & ~is_udp), proto, 0)
+    records["l4_sport"] = np.where(has_ports, view.u16(pos), 0)
+    records["l4_dport"] = np.where(has_ports, view.u16(pos + 2), 0)
+    return valid
+
+
+def decode_packet_records(data, offsets, lengths, capture_ns) -> np.ndarray:
+    """
+    Decodes the 5-tuple of regular packets (not INT reports) from raw pcap
+    records, for instance of the traffic sent to the switch.
+
+    :returns:
+        A numpy array of REPORT_DTYPE with one entry per record, of kind
+        REPORT_KIND_NONE. has_five_tuple is set for IPv4 packets, the ports of
+        other protocols than TCP and UDP are 0.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    records = np.zeros(len(offsets), dtype=REPORT_DTYPE)
+    records["capture_ns"] = capture_ns
+    if len(offsets) == 0:
+        return records
+    view = _RecordView(data, offsets, lengths)
+    valid = np.ones(len(offsets), dtype=bool)
+    records["has_five_tuple"] = _decode_five_tuples(view, offsets, valid, records)
+    return records
+
+
+def _decode_report_chunks(
+    data,
+    offsets,
+    lengths,
+    capture_ns,
+    chunk_size=DECODE_CHUNK_SIZE,
+    decode=decode_report_records,
+) -> np.ndarray:
+    reports = np.empty(len(offsets), dtype=REPORT_DTYPE)
+    for start in range(0, len(offsets), chunk_size):
+        stop = start + chunk_size
+        reports[start:stop] = decode(
+            data, offsets[start:stop], lengths[start:stop], capture_ns[start:stop]
+        )
+    return reports
+
+
+def decode_report_pcap(pcap_file: str) -> np.ndarray:
+    """
+    Decodes every record of an INT report capture.
+
+    :parameters:
+        pcap_file: str
+            path to the capture, see open_pcap_reader for the formats
+    :returns:
+        A numpy array of REPORT_DTYPE with one entry per record
+    """
+    return _decode_pcap(pcap_file, decode_report_records)
+
+
+# Compressed and pcapng captures cannot be mapped in memory. They are read
+# by a background thread in buffers of up to READ_AHEAD_BUFFER_SIZE bytes,
+# decompressed if needed, while the decoder walks the records of the
+# previous buffers. At most READ_AHEAD_BUFFERS buffers are queued.
+READ_AHEAD_BUFFER_SIZE = 1 << 23
+READ_AHEAD_BUFFERS = 4
+GZIP_MAGIC = b"\x1f\x8b"
+GZIP_WBITS = zlib.MAX_WBITS | 16
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+PCAPNG_BLOCK_SHB = 0x0A0D0D0A
+PCAPNG_BLOCK_IDB = 0x00000001
+PCAPNG_BLOCK_SPB = 0x00000003
+PCAPNG_BLOCK_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_BLOCK_MIN_LEN = 12
+PCAPNG_OPTION_END = 0
+PCAPNG_OPTION_TSRESOL = 9
+PCAPNG_OPTION_TSOFFSET = 14
+
+# Packet bytes of a range of records, see decode_report_records.
+PcapChunk = collections.namedtuple(
+    "PcapChunk", ["data", "offsets", "lengths", "capture_ns"]
+)
+
+
+def _file_buffers(f, buffer_size):
+    while True:
+        buf = f.read(buffer_size)
+        if not buf:
+            return
+        yield buf
+
+
+def _gunzip_buffers(f, buffer_size):
+    # Decompressed with zlib directly, which releases the GIL for the whole
+    # buffer, rather than with gzip.GzipFile, which works on small blocks.
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    member_start = True
+    for data in _file_buffers(f, buffer_size):
+        while data:
+            if member_start:
+                # Zeros after a member are padding, not another member.
+                data = data.lstrip(b"\0")
+                if not data:
+                    break
+                member_start = False
+            buf = decompressor.decompress(data, buffer_size)
+            if buf:
+                yield buf
+            if decompressor.eof:
+                # Captures can be made of several gzip members.
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+                member_start = True
+            else:
+                data = decompressor.unconsumed_tail
+
+
+def _unzstd_buffers(f, buffer_size):
+    if zstandard is not None:
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            f, read_size=buffer_size, read_across_frames=True, closefd=False
+        )
+        yield from _file_buffers(reader, buffer_size)
+        return
+    # Without the zstandard module, fall back to the zstd command.
+    zstd = Popen(["zstd", "-d", "-c", "-q"], stdin=f, stdout=PIPE)
+    try:
+        yield from _file_buffers(zstd.stdout, buffer_size)
+    finally:
+        # Closing the pipe first stops zstd if the reader is closed early.
+        zstd.stdout.close()
+        zstd.wait()
+    if zstd.returncode != 0:
+        raise ValueError("zstd failed with exit code {}".format(zstd.returncode))
+
+
+class ReadAheadReader:
+    """
+    Reads a capture, decompressing gzip and zstd captures, in a background
+    thread and queues the buffers for the consumer. Iterating the reader
+    yields the buffers in order, errors of the thread are raised there.
+
+    :parameters:
+        pcap_file: str
+            path to a capture
+        buffer_size: int
+            maximum size of the buffers
+        buffers: int
+            maximum number of buffers queued
+    """
+
+    def __init__(
+        self,
+        pcap_file: str,
+        buffer_size: int = READ_AHEAD_BUFFER_SIZE,
+        buffers: int = READ_AHEAD_BUFFERS,
+    ):
+        # Unbuffered, so that the zstd command reads from the start.
+        self._file = open(pcap_file, "rb", buffering=0)
+        magic = self._file.read(4)
+        self._file.seek(0)
+        if magic[:2] == GZIP_MAGIC:
+            self._buffers = _gunzip_buffers(self._file, buffer_size)
+        elif magic == ZSTD_MAGIC:
+            self._buffers = _unzstd_buffers(self._file, buffer_size)
+        else:
+            self._buffers = _file_buffers(self._file, buffer_size)
+        self._queue = queue.Queue(buffers)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._read, daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read(self):
+        try:
+            for buf in self._buffers:
+                if not self._put(buf):
+                    return
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self._buffers.close()
+        self._file.close()
+
+
+def _read_u16(data, pos, endian):
+    return struct.unpack_from(endian + "H", data, pos)[0]
+
+
+class _PcapngInterface:
+    def __init__(self, data, offset, length, endian):
+        self.linktype = _read_u16(data, offset + 8, endian)
+        # Timestamps are in microseconds unless the if_tsresol option is set.
+        self.units_per_sec = 10 ** 6
+        self.tsoffset_ns = 0
+        pos = offset + 16
+        end = offset + length - 4
+        while pos + 4 <= end:
+            code = _read_u16(data, pos, endian)
+            option_len = _read_u16(data, pos + 2, endian)
+            value = pos + 4
+            if code == PCAPNG_OPTION_END:
+                break
+            if code == PCAPNG_OPTION_TSRESOL and option_len == 1:
+                resolution = int(data[value])
+                if resolution & 0x80:
+                    self.units_per_sec = 1 << (resolution & 0x7F)
+                else:
+                    self.units_per_sec = 10 ** resolution
+            elif code == PCAPNG_OPTION_TSOFFSET and option_len == 8:
+                tsoffset = struct.unpack_from(endian + "q", data, value)[0]
+                self.tsoffset_ns = tsoffset * 10 ** 9
+            pos = value + (option_len + 3) // 4 * 4
+
+    def to_ns(self, tstamps: np.ndarray) -> np.ndarray:
+        seconds, units = np.divmod(tstamps, np.uint64(self.units_per_sec))
+        if self.units_per_sec <= 10 ** 9:
+            fractions = units * np.uint64(10 ** 9) // np.uint64(self.units_per_sec)
+        else:
+            # Finer resolutions are rounded down to the nanosecond.
+            fractions = units // np.uint64(self.units_per_sec // 10 ** 9)
+        ns = seconds.astype(np.int64) * 10 ** 9 + fractions.astype(np.int64)
+        return ns + self.tsoffset_ns
+
+
+class StreamPcapReader:
+    """
+    Sequential reader of pcap and pcapng captures, optionally gzip or zstd
+    compressed. The capture is read and decompressed by a ReadAheadReader,
+    records are yielded in PcapChunks, one per buffer. Packets of pcapng
+    interfaces with another link type than Ethernet are skipped, as well as
+    blocks other than packet blocks.
+
+    :parameters:
+        pcap_file: str
+            path to the capture
+        buffer_size: int
+            see ReadAheadReader
+    """
+
+    def __init__(self, pcap_file: str, buffer_size: int = READ_AHEAD_BUFFER_SIZE):
+        self.pcap_file = pcap_file
+        self._reader = ReadAheadReader(pcap_file, buffer_size)
+        self._pcapng = None
+        self._endian = None
+        self._frac_to_ns = None
+        self._interfaces = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        self._reader.close()
+
+    def __iter__(self):
+        """
+        Yields a PcapChunk for every buffer holding complete records. Chunks
+        are only valid until the next one is requested.
+        """
+        pending = b""
+        for buf in self._reader:
+            data = pending + buf if pending else buf
+            array = np.frombuffer(data, dtype=np.uint8)
+            pos = 0
+            if self._pcapng is None:
+                if len(data) < PCAP_GLOBAL_HEADER_LEN:
+                    pending = data
+                    continue
+                pos = self._read_file_header(data)
+            while True:
+                if self._pcapng:
+                    chunk, pos, more = self._walk_pcapng(data, array, pos)
+                else:
+                    chunk, pos, more = self._walk_pcap(array, pos)
+                if chunk is not None and len(chunk.offsets):
+                    yield chunk
+                if not more:
+                    break
+            pending = data[pos:]
+
+    def packets(self):
+        """
+        Yields every packet dissected by scapy, see MmapPcapReader.packets.
+        """
+        for chunk in self:
+            for offset, length, capture_ns in zip(
+                chunk.offsets.tolist(),
+                chunk.lengths.tolist(),
+                chunk.capture_ns.tolist(),
+            ):
+                pkt = Ether(chunk.data[offset : offset + length].tobytes())
+                pkt.time = capture_ns / 10 ** 9
+                yield pkt
+
+    def _read_file_header(self, data) -> int:
+        magic = data[:4]
+        if struct.unpack("<I", magic)[0] == PCAPNG_BLOCK_SHB:
+            # Sections are parsed as blocks by _walk_pcapng.
+            self._pcapng = True
+            return 0
+        self._pcapng = False
+        for endian in "<>":
+            magic = struct.unpack_from(endian + "I", data)[0]
+            if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+                break
+        else:
+            raise ValueError("{} is not a pcap file".format(self.pcap_file))
+        self._endian = endian
+        self._frac_to_ns = 1 if magic == PCAP_MAGIC_NSEC else 1000
+        linktype = struct.unpack_from(endian + "I", data, 20)[0]
+        if linktype != PCAP_LINKTYPE_ETHERNET:
+            raise ValueError("Unsupported pcap link type {}".format(linktype))
+        return PCAP_GLOBAL_HEADER_LEN
+
+    def _walk_pcap(self, array, pos):
+        offsets = _walk_pcap_records(array, self._endian, pos)
+        if len(offsets) == 0:
+            return None, pos, False
+        lengths, capture_ns = _pcap_record_fields(
+            array, offsets, self._endian, self._frac_to_ns
+        )
+        pos = int(offsets[-1] + lengths[-1])
+        return PcapChunk(array, offsets, lengths, capture_ns), pos, False
+
+    def _walk_pcapng(self, data, array, pos):
+        """
+        Walks the blocks of a buffer up to the next section header, whose
+        byte order can differ. Returns the chunk of packets found, the
+        position after the last block walked and whether to walk again.
+        """
+        if len(data) - pos < PCAPNG_BLOCK_MIN_LEN:
+            return None, pos, False
+        if struct.unpack_from("<I", data, pos)[0] == PCAPNG_BLOCK_SHB:
+            magic = struct.unpack_from("<I", data, pos + 8)[0]
+            self._endian = "<" if magic == PCAPNG_BYTE_ORDER_MAGIC else ">"
+            length = struct.unpack_from(self._endian + "I", data, pos + 4)[0]
+            if pos + length > len(data):
+                return None, pos, False
+            self._interfaces = []
+            return None, pos + length, True
+        if self._endian is None:
+            raise ValueError("{} is not a pcapng file".format(self.pcap_file))
+
+        blocks = _walk_records(array, self._endian, pos, 4, 0, PCAPNG_BLOCK_MIN_LEN)
+        if len(blocks) == 0:
+            length = struct.unpack_from(self._endian + "I", data, pos + 4)[0]
+            if length < PCAPNG_BLOCK_MIN_LEN:
+                raise ValueError("Corrupted pcapng block in {}".format(self.pcap_file))
+            return None, pos, False
+        types = _read_u32(array, blocks, self._endian)
+        lengths = _read_u32(array, blocks + 4, self._endian).astype(np.int64)
+        sections = np.flatnonzero(types == PCAPNG_BLOCK_SHB)
+        if len(sections):
+            blocks = blocks[: sections[0]]
+            types = types[: sections[0]]
+            lengths = lengths[: sections[0]]
+        end = int(blocks[-1] + lengths[-1])
+        # The walk stops at the next section header if its byte order
+        # differs, as its length is read with the wrong one.
+        more = (
+            end + 4 <= len(data)
+            and struct.unpack_from("<I", data, end)[0] == PCAPNG_BLOCK_SHB
+        )
+
+        # Interfaces are numbered in order of definition in the section and
+        # always defined before their packets, so they can be added first.
+        for block in blocks[types == PCAPNG_BLOCK_IDB].tolist():
+            length = struct.unpack_from(self._endian + "I", data, block + 4)[0]
+            self._interfaces.append(_PcapngInterface(data, block, length, self._endian))
+
+        epb = types == PCAPNG_BLOCK_EPB
+        spb = types == PCAPNG_BLOCK_SPB
+        packets = blocks[epb | spb]
+        if len(packets) == 0:
+            return None, end, more
+        is_epb = epb[epb | spb]
+        epbs = packets[is_epb]
+        spbs = packets[~is_epb]
+        interface_ids = np.zeros(len(packets), dtype=np.int64)
+        interface_ids[is_epb] = _read_u32(array, epbs + 8, self._endian)
+        caplens = np.empty(len(packets), dtype=np.int64)
+        caplens[is_epb] = _read_u32(array, epbs + 20, self._endian)
+        caplens[~is_epb] = np.minimum(
+            _read_u32(array, spbs + 8, self._endian), lengths[spb] - 16
+        )
+        offsets = np.where(is_epb, packets + 28, packets + 12)
+        tstamps = (
+            _read_u32(array, epbs + 12, self._endian).astype(np.uint64) << np.uint64(32)
+        ) | _read_u32(array, epbs + 16, self._endian).astype(np.uint64)
+
+        # Simple packet blocks have no timestamp, their capture time is 0.
+        capture_ns = np.zeros(len(packets), dtype=np.int64)
+        epb_indexes = np.flatnonzero(is_epb)
+        keep = np.zeros(len(packets), dtype=bool)
+        for interface_id in np.unique(interface_ids).tolist():
+            if interface_id >= len(self._interfaces):
+                raise ValueError(
+                    "Packet of undefined interface {} in {}".format(
+                        interface_id, self.pcap_file
+                    )
+                )
+            interface = self._interfaces[interface_id]
+            if interface.linktype != PCAP_LINKTYPE_ETHERNET:
+                continue
+            mask = interface_ids == interface_id
+            keep |= mask
+            timed = mask[is_epb]
+            capture_ns[epb_indexes[timed]] = interface.to_ns(tstamps[timed])
+        chunk = PcapChunk(array, offsets[keep], caplens[keep], capture_ns[keep])
+        return chunk, end, more
+
+
+def capture_format(pcap_file: str) -> str:
+    """
+    Returns the format of a capture from its first bytes: "pcap", "pcapng",
+    "gzip" or "zstd".
+    """
+    with open(pcap_file, "rb") as f:
+        magic = f.read(4)
+    if magic[:2] == GZIP_MAGIC:
+        return "gzip"
+    if magic == ZSTD_MAGIC:
+        return "zstd"
+    if len(magic) == 4 and struct.unpack("<I", magic)[0] == PCAPNG_BLOCK_SHB:
+        return "pcapng"
+    return "pcap"
+
+
+def open_pcap_reader(pcap_file: str):
+    """
+    Opens a capture with a MmapPcapReader if it is an uncompressed pcap, or
+    with a StreamPcapReader otherwise. Both readers support packets().
+    """
+    if capture_format(pcap_file) == "pcap":
+        return MmapPcapReader(pcap_file)
+    return StreamPcapReader(pcap_file)
+
+
+def iter_pcap_chunks(pcap_file: str, chunk_size: int = DECODE_CHUNK_SIZE):
+    """
+    Yields the records of any capture supported by open_pcap_reader as
+    PcapChunks, of at most chunk_size records for uncompressed pcaps and of
+    one read buffer otherwise.
+    """
+    if capture_format(pcap_file) != "pcap":
+        with StreamPcapReader(pcap_file) as pcap:
+            yield from pcap
+        return
+    # The mapping cannot be closed while the caller holds the last chunk, it
+    # is released with the last reference to the chunks instead.
+    pcap = MmapPcapReader(pcap_file)
+    for start in range(0, len(pcap), chunk_size):
+        stop = start + chunk_size
+        yield PcapChunk(
+            pcap.data,
+            pcap.offsets[start:stop],
+            pcap.lengths[start:stop],
+            pcap.capture_ns[start:stop],
+        )
+
+
+def _decode_pcap(pcap_file: str, decode) -> np.ndarray:
+    if capture_format(pcap_file) == "pcap":
+        with MmapPcapReader(pcap_file) as pcap:
+            return _decode_report_chunks(
+                pcap.data, pcap.offsets, pcap.lengths, pcap.capture_ns, decode=decode
+            )
+    # The number of records is only known at the end, decoded chunks are
+    # concatenated.
+    with StreamPcapReader(pcap_file) as pcap:
+        records = [decode(*chunk) for chunk in pcap]
+    if not records:
+        return np.empty(0, dtype=REPORT_DTYPE)
+    return np.concatenate(records)
+
+
+# Version of the decoded report cache format, part of the cache key so that
+# caches written with a different REPORT_DTYPE or decoder are ignored.
+REPORT_CACHE_VERSION = 1
+HASH_BLOCK_SIZE = 1 << 23
+
+
+def pcap_content_hash(pcap_file: str) -> str:
+    """
+    Returns a hash of the capture content and of the report cache version.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(REPORT_CACHE_VERSION.to_bytes(4, "big"))
+    with open(pcap_file, "rb") as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _report_cache_prefix(pcap_file: str) -> str:
+    # Only the .pcap extension is dropped, so that other formats of the same
+    # capture (e.g. x.pcap.gz or x.pcapng next to x.pcap) have their own cache.
+    root, ext = splitext(pcap_file)
+    return (root if ext == ".pcap" else pcap_file) + ".reports-"
+
+
+def _cached_content_hash(pcap_file: str) -> str:
+    # Hashing a large capture takes longer than loading its cache, so the
+    # hash is remembered along with the capture size and modification time.
+    stat = os.stat(pcap_file)
+    signature = "{} {}".format(stat.st_size, stat.st_mtime_ns)
+    key_file = _report_cache_prefix(pcap_file) + "key"
+    if exists(key_file):
+        with open(key_file) as f:
+            key = f.read().split(" ")
+        if " ".join(key[:2]) == signature and len(key) == 3:
+            return key[2]
+    content_hash = pcap_content_hash(pcap_file)
+    try:
+        with open(key_file, "w") as f:
+            f.write("{} {}".format(signature, content_hash))
+    except OSError as e:
+        logging.warning("Cannot write report cache key %s: %s", key_file, e)
+    return content_hash
+
+
+def report_cache_file(pcap_file: str, content_hash: str = None) -> str:
+    """
+    Returns the path of the decoded report cache of a capture, next to it.
+    """
+    if content_hash is None:
+        content_hash = _cached_content_hash(pcap_file)
+    return _report_cache_prefix(pcap_file) + content_hash + ".npy"
+
+
+def load_report_pcap(pcap_file: str, cache: bool = True) -> np.ndarray:
+    """
+    Same as decode_report_pcap, but the decoded reports are cached in a .npy
+    file next to the capture, keyed by the capture content hash. Later calls
+    on the same capture map the cache in memory instead of decoding it again.
+    Caches of previous content of the same capture are removed.
+
+    :parameters:
+        pcap_file: str
+            path to the pcap file
+        cache: bool
+            False to always decode the capture without reading or writing the
+            cache
+    :returns:
+        A numpy array of REPORT_DTYPE with one entry per record, read-only
+        when loaded from the cache
+    """
+    if not cache:
+        return decode_report_pcap(pcap_file)
+    cache_file = report_cache_file(pcap_file)
+    if exists(cache_file):
+        return np.load(cache_file, mmap_mode="r")
+    reports = decode_report_pcap(pcap_file)
+    for stale_file in glob.glob(glob.escape(_report_cache_prefix(pcap_file)) + "*.npy"):
+        os.remove(stale_file)
+    # Written to a temporary file first so that concurrent readers never see
+    # a partial cache.
+    fd, tmp_file = tempfile.mkstemp(dir=dirname(abspath(cache_file)), suffix=".npy")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, reports)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logging.warning("Cannot write report cache %s: %s", cache_file, e)
+        if exists(tmp_file):
+            os.remove(tmp_file)
+    return reports
+
+
+def decode_packet_pcap(pcap_file: str) -> np.ndarray:
+    """
+    Decodes every record of a capture of regular packets, see
+    decode_packet_records.
+    """
+    return _decode_pcap(pcap_file, decode_packet_records)
+
+
+def pack_five_tuples(reports: np.ndarray):
+    """
+    Packs the inner 5-tuple of decoded reports into two uint64 keys.
+    The high key holds the IPv4 source and destination, the low key holds
+    the protocol and the L4 ports.
+    """
+    hi = (reports["ip_src"].astype(np.uint64) << np.uint64(32)) | reports[
+        "ip_dst"
+    ].astype(np.uint64)
+    lo = (
+        (reports["ip_proto"].astype(np.uint64) << np.uint64(32))
+        | (reports["l4_sport"].astype(np.uint64) << np.uint64(16))
+        | reports["l4_dport"].astype(np.uint64)
+    )
+    return hi, lo
+
+
+class QuantileSketch:
+    """
+    Mergeable streaming quantile sketch with relative-error guarantee
+    (DDSketch). Positive values are counted in logarithmic buckets, so any
+    quantile is estimated within relative_accuracy of the exact value, using
+    at most max_buckets counters whatever the number of values. When the
+    buckets do not fit, the lowest ones are collapsed, trading accuracy on
+    the smallest values.
+
+    :parameters:
+        relative_accuracy: float
+            maximum relative error of the estimated quantiles
+        max_buckets: int
+            maximum number of buckets
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self._gamma)
+        # counts[i] holds the values of bucket index offset + i, bucket k
+        # holds values in (gamma^(k-1), gamma^k].
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._offset = 0
+        self.zero_count = 0  # values <= 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def _bucket_values(self) -> np.ndarray:
+        keys = np.arange(self._offset, self._offset + len(self._counts))
+        return 2 * self._gamma ** keys / (self._gamma + 1)
+
+    def _add_counts(self, keys, counts) -> None:
+        low = min(keys.min(), self._offset) if len(self._counts) else keys.min()
+        high = max(keys.max() + 1, self._offset + len(self._counts))
+        if high - low > self.max_buckets:
+            # Collapse the lowest buckets into the lowest one we can keep.
+            low = high - self.max_buckets
+            keys = np.maximum(keys, low)
+        if len(self._counts) == 0:
+            new_counts = np.zeros(high - low, dtype=np.int64)
+        elif low != self._offset or high != self._offset + len(self._counts):
+            new_counts = np.zeros(high - low, dtype=np.int64)
+            old_keys = np.maximum(
+                np.arange(self._offset, self._offset + len(self._counts)), low
+            )
+            np.add.at(new_counts, old_keys - low, self._counts)
+        else:
+            new_counts = self._counts
+        np.add.at(new_counts, keys - low, counts)
+        self._counts = new_counts
+        self._offset = low
+
+    def add(self, values) -> None:
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        if len(positive) == 0:
+            return
+        keys = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+        keys, counts = np.unique(keys, return_counts=True)
+        self._add_counts(keys, counts)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.sum += other.sum
+        self.zero_count += other.zero_count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        nonzero = np.flatnonzero(other._counts)
+        if len(nonzero):
+            self._add_counts(nonzero + other._offset, other._counts[nonzero])
+
+    def percentile(self, q):
+        """
+        Estimates percentiles, like np.percentile (q in 0-100).
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if self.count == 0:
+            raise ValueError("Empty sketch")
+        ranks = np.clip(q / 100, 0, 1) * (self.count - 1)
+        values = np.concatenate(([0.0], self._bucket_values()))
+        cumulative = np.cumsum(np.concatenate(([self.zero_count], self._counts)))
+        estimates = values[np.searchsorted(cumulative, ranks, side="right")]
+        return np.clip(estimates, self.min, self.max)
+
+    def percentile_of_score(self, score: float) -> float:
+        """
+        Estimates the percentage of values lower than or equal to score, like
+        scipy.stats.percentileofscore.
+        """
+        if self.count == 0:
+            raise ValueError("Empty sketch")
+        if score <= 0:
+            below = self.zero_count if score == 0 else 0
+        else:
+            key = int(np.ceil(np.log(score) / self._log_gamma))
+            below = (
+                self.zero_count + self._counts[: max(key - self._offset + 1, 0)].sum()
+            )
+        return float(below) * 100 / self.count
+
+    def histogram(self, bins) -> np.ndarray:
+        """
+        Estimates the number of values in each bin, like np.histogram.
+        """
+        values = np.concatenate(([0.0], self._bucket_values()))
+        counts = np.concatenate(([self.zero_count], self._counts))
+        hist, _ = np.histogram(values, bins=bins, weights=counts)
+        return hist
+
+    def to_dict(self) -> dict:
+        """
+        Serializes the sketch, for instance to merge sketches across runs.
+        """
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_buckets": self.max_buckets,
+            "offset": int(self._offset),
+            "counts": self._counts.tolist(),
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    def copy(self) -> "QuantileSketch":
+        return QuantileSketch.from_dict(self.to_dict())
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "QuantileSketch":
+        sketch = cls(d["relative_accuracy"], d["max_buckets"])
+        sketch._offset = d["offset"]
+        sketch._counts = np.array(d["counts"], dtype=np.int64)
+        sketch.zero_count = d["zero_count"]
+        sketch.count = d["count"]
+        sketch.sum = d["sum"]
+        sketch.min = d["min"]
+        sketch.max = d["max"]
+        return sketch
+
+
+class ReportIrgs:
+    """
+    IRGs of one report type: exact number of valid, bad and invalid IRGs and
+    the distribution of the valid ones. The distribution is kept exactly up
+    to exact_limit values, then in a QuantileSketch so memory stays constant.
+
+    :parameters:
+        exact_limit: int
+            maximum number of valid IRGs kept exactly, None for no limit
+    """
+
+    def __init__(self, exact_limit: int = EXACT_IRGS_LIMIT):
+        self.exact_limit = exact_limit
+        self.valid = 0
+        self.bad = 0
+        self.invalid = 0
+        self._exact = []
+        self._sketch = None
+
+    def _add_valid(self, valid_irgs) -> None:
+        if self._sketch is not None:
+            self._sketch.add(valid_irgs)
+            return
+        self._exact.append(valid_irgs)
+        if self.exact_limit is not None and self.valid > self.exact_limit:
+            self._sketch = QuantileSketch()
+            self._sketch.add(np.concatenate(self._exact))
+            self._exact = []
+
+    def add(self, irgs: np.ndarray) -> None:
+        valid_irgs = irgs[irgs != 0]
+        self.valid += len(valid_irgs)
+        self.bad += int(np.count_nonzero((irgs > 0) & (irgs < 0.9)))
+        self.invalid += len(irgs) - len(valid_irgs)
+        self._add_valid(valid_irgs)
+
+    def merge(self, other: "ReportIrgs") -> None:
+        self.valid += other.valid
+        self.bad += other.bad
+        self.invalid += other.invalid
+        if other._sketch is None:
+            self._add_valid(np.concatenate(other._exact or [np.zeros(0)]))
+            return
+        if self._sketch is None:
+            self._sketch = QuantileSketch()
+            self._sketch.add(np.concatenate(self._exact or [np.zeros(0)]))
+            self._exact = []
+        self._sketch.merge(other._sketch)
+
+    def distribution(self):
+        """
+        Returns the valid IRGs as an array, or as a QuantileSketch when there
+        are too many of them.
+        """
+        if self._sketch is not None:
+            return self._sketch
+        return np.concatenate(self._exact or [np.zeros(0)])
+
+
+# Partial analysis of a range of records. Shards of consecutive record ranges
+# can be merged with merge_report_shards to get the results of the whole
+# capture, so the analysis can run on several cores.
+ReportShard = collections.namedtuple(
+    "ReportShard",
+    [
+        "pkt_processed",
+        "local_reports",
+        "drop_reports",
+        "skipped",
+        "correct_drop_reports",
+        # HW ID -> (first seq number, last seq number, number of reports)
+        "seq_nos",
+        # FLOW_STATE_DTYPE arrays sorted by 5-tuple
+        "local_flows",
+        "drop_flows",
+        # ReportIrgs between reports of the same flow within the shard
+        "local_irgs",
+        "drop_irgs",
+    ],
+)
+
+# Fields of ReportShard which are counters, summed when merging shards.
+REPORT_SHARD_COUNTERS = [
+    "pkt_processed",
+    "local_reports",
+    "drop_reports",
+    "skipped",
+    "correct_drop_reports",
+]
+
+# State of a flow in a shard: first and last report time and report count.
+FLOW_STATE_DTYPE = np.dtype(
+    [
+        ("hi", "<u8"),
+        ("lo", "<u8"),
+        ("first_tstamp", "<u4"),
+        ("last_tstamp", "<u4"),
+        ("reports", "<u4"),
+    ]
+)
+
+
+# Slot of a FlowTable: packed 5-tuple, last report time and report count.
+# The low key holds the IP protocol, which is never 0 for TCP and UDP, so a
+# low key of 0 marks an empty slot.
+FLOW_SLOT_DTYPE = np.dtype(
+    [("hi", "<u8"), ("lo", "<u8"), ("last_tstamp", "<u4"), ("reports", "<u4")]
+)
+
+
+class FlowTable:
+    """
+    Per-flow report state keyed by the packed 5-tuple (see pack_five_tuples).
+
+    Flows are stored in a NumPy array with open addressing and linear
+    probing, every operation works on a batch of flows at once. Each slot
+    takes 24 bytes and the table grows when it is 3/4 full, so a flow costs
+    between 32 and 64 bytes.
+
+    :parameters:
+        capacity: int
+            initial number of slots, rounded up to a power of two
+    """
+
+    MAX_LOAD = 0.75
+
+    def __init__(self, capacity: int = 1 << 16):
+        capacity = 1 << max(int(capacity - 1).bit_length(), 4)
+        self._slots = np.zeros(capacity, dtype=FLOW_SLOT_DTYPE)
+        self._flows = 0
+
+    def __len__(self):
+        return self._flows
+
+    @property
+    def nbytes(self) -> int:
+        return self._slots.nbytes
+
+    def flows_with_multiple_reports(self) -> int:
+        return int(np.count_nonzero(self._slots["reports"] > 1))
+
+    def _home_slots(self, hi, lo):
+        h = hi * np.uint64(0x9E3779B97F4A7C15)
+        h ^= lo * np.uint64(0xC2B2AE3D27D4EB4F)
+        h ^= h >> np.uint64(29)
+        return (h & np.uint64(len(self._slots) - 1)).astype(np.int64)
+
+    def lookup(self, hi, lo) -> np.ndarray:
+        """
+        Returns the slot of each flow, or -1 for flows not in the table.
+        """
+        hi = np.asarray(hi, dtype=np.uint64)
+        lo = np.asarray(lo, dtype=np.uint64)
+        slots = np.full(len(hi), -1, dtype=np.int64)
+        pos = self._home_slots(hi, lo)
+        pending = np.arange(len(hi))
+        mask = len(self._slots) - 1
+        while len(pending):
+            candidates = self._slots[pos[pending]]
+            empty = candidates["lo"] == 0
+            found = (
+                ~empty
+                & (candidates["hi"] == hi[pending])
+                & (candidates["lo"] == lo[pending])
+            )
+            slots[pending[found]] = pos[pending[found]]
+            # Probing stops at the first empty slot.
+            pending = pending[~(found | empty)]
+            pos[pending] = (pos[pending] + 1) & mask
+        return slots
+
+    def _insert(self, hi, lo) -> np.ndarray:
+        # Inserts flows that are not in the table, keys must be unique.
+        slots = np.empty(len(hi), dtype=np.int64)
+        pos = self._home_slots(hi, lo)
+        pending = np.arange(len(hi))
+        mask = len(self._slots) - 1
+        while len(pending):
+            free = np.flatnonzero(self._slots["lo"][pos[pending]] == 0)
+            # When several flows probe the same free slot, the first one wins.
+            _, first = np.unique(pos[pending[free]], return_index=True)
+            inserted = np.zeros(len(pending), dtype=bool)
+            inserted[free[first]] = True
+            winners = pending[inserted]
+            slots[winners] = pos[winners]
+            self._slots["hi"][pos[winners]] = hi[winners]
+            self._slots["lo"][pos[winners]] = lo[winners]
+            pending = pending[~inserted]
+            pos[pending] = (pos[pending] + 1) & mask
+        self._flows += len(hi)
+        return slots
+
+    def _reserve(self, new_flows: int) -> None:
+        capacity = len(self._slots)
+        while self._flows + new_flows > capacity * self.MAX_LOAD:
+            capacity *= 2
+        if capacity == len(self._slots):
+            return
+        old = self._slots[self._slots["lo"] != 0]
+        self._slots = np.zeros(capacity, dtype=FLOW_SLOT_DTYPE)
+        self._flows = 0
+        slots = self._insert(old["hi"], old["lo"])
+        self._slots["last_tstamp"][slots] = old["last_tstamp"]
+        self._slots["reports"][slots] = old["reports"]
+
+    def update_flows(self, flows: np.ndarray):
+        """
+        Records the reports of a batch of flows seen after the ones already in
+        the table.
+
+        :parameters:
+            flows: numpy array of FLOW_STATE_DTYPE with unique flows
+        :returns:
+            A tuple (prev_tstamps, has_prev) with, for each flow, the time of
+            its last report before this batch and whether there was one
+        """
+        self._reserve(len(flows))
+        slots = self.lookup(flows["hi"], flows["lo"])
+        has_prev = slots >= 0
+        prev_tstamps = np.zeros(len(flows), dtype=np.uint32)
+        prev_tstamps[has_prev] = self._slots["last_tstamp"][slots[has_prev]]
+        slots[~has_prev] = self._insert(flows["hi"][~has_prev], flows["lo"][~has_prev])
+        self._slots["last_tstamp"][slots] = flows["last_tstamp"]
+        self._slots["reports"][slots] += flows["reports"]
+        return prev_tstamps, has_prev
+
+
+def _irgs_from_tstamps(prev_tstamps, tstamps) -> np.ndarray:
+    irgs = tstamps.astype(np.int64) - prev_tstamps.astype(np.int64)
+    # timestamp overflow
+    irgs[irgs < 0] += 0xFFFFFFFF
+    return irgs / 10 ** 9
+
+
+def _analyze_flows(reports: np.ndarray):
+    """
+    Groups reports by 5-tuple. Returns the FLOW_STATE_DTYPE array of the
+    flows and the IRGs between consecutive reports of each flow.
+    """
+    if len(reports) == 0:
+        return np.zeros(0, dtype=FLOW_STATE_DTYPE), np.zeros(0, dtype=np.float64)
+    hi, lo = pack_five_tuples(reports)
+    # Stable sort, so reports of the same flow keep their capture order.
+    order = np.lexsort((lo, hi))
+    hi = hi[order]
+    lo = lo[order]
+    tstamps = reports["ingress_tstamp"][order]
+    same_flow = (hi[1:] == hi[:-1]) & (lo[1:] == lo[:-1])
+    irgs = _irgs_from_tstamps(tstamps[:-1][same_flow], tstamps[1:][same_flow])
+
+    firsts = np.flatnonzero(np.concatenate(([True], ~same_flow)))
+    lasts = np.concatenate((firsts[1:] - 1, [len(reports) - 1]))
+    flows = np.zeros(len(firsts), dtype=FLOW_STATE_DTYPE)
+    flows["hi"] = hi[firsts]
+    flows["lo"] = lo[firsts]
+    flows["first_tstamp"] = tstamps[firsts]
+    flows["last_tstamp"] = tstamps[lasts]
+    flows["reports"] = lasts - firsts + 1
+    return flows, irgs
+
+
+def analyze_report_records(
+    reports: np.ndarray, drop_reason: int = 0, exact_irgs_limit: int = EXACT_IRGS_LIMIT,
+) -> ReportShard:
+    """
+    Analyzes consecutive decoded reports (see decode_report_records).
+
+    :parameters:
+        reports: numpy array of REPORT_DTYPE
+        drop_reason: int
+            drop reason expected in drop reports, 0 to skip the check
+        exact_irgs_limit: int
+            see ReportIrgs
+    :returns:
+        A ReportShard with the partial results
+    """
+    kinds = reports["kind"]
+    is_local = kinds == REPORT_KIND_LOCAL
+    is_drop = kinds == REPORT_KIND_DROP
+    is_report = is_local | is_drop
+
+    seq_nos = {}
+    hw_ids = reports["hw_id"][is_report]
+    all_seq_nos = reports["seq_no"][is_report]
+    for hw_id in np.unique(hw_ids):
+        hw_seq_nos = all_seq_nos[hw_ids == hw_id]
+        seq_nos[int(hw_id)] = (
+            int(hw_seq_nos[0]),
+            int(hw_seq_nos[-1]),
+            len(hw_seq_nos),
+        )
+
+    correct_drop_reports = 0
+    if drop_reason:
+        correct_drop_reports = int(
+            np.count_nonzero(is_drop & (reports["drop_reason"] == drop_reason))
+        )
+
+    with_five_tuple = reports["has_five_tuple"]
+    local_flows, local_irgs = _analyze_flows(reports[is_local & with_five_tuple])
+    drop_flows, drop_irgs = _analyze_flows(reports[is_drop & with_five_tuple])
+    local_report_irgs = ReportIrgs(exact_irgs_limit)
+    local_report_irgs.add(local_irgs)
+    drop_report_irgs = ReportIrgs(exact_irgs_limit)
+    drop_report_irgs.add(drop_irgs)
+    return ReportShard(
+        pkt_processed=len(reports),
+        local_reports=int(np.count_nonzero(is_local)),
+        drop_reports=int(np.count_nonzero(is_drop)),
+        skipped=int(np.count_nonzero(~(is_report & with_five_tuple))),
+        correct_drop_reports=correct_drop_reports,
+        seq_nos=seq_nos,
+        local_flows=local_flows,
+        drop_flows=drop_flows,
+        local_irgs=local_report_irgs,
+        drop_irgs=drop_report_irgs,
+    )
+
+
+# Ethernet / IPv4 / UDP headers prepended to report payloads received from a
+# UDP socket, so that they can be decoded like captured frames.
+_REPORT_UDP_HEADERS = struct.pack(
+    "!6s6sH" "BBHHHBBH4s4s" "HHHH",
+    b"\x00" * 6,
+    b"\x00" * 6,
+    ETH_TYPE_IPV4,
+    0x45,
+    0,
+    0,
+    0,
+    0,
+    64,
+    IP_PROTO_UDP,
+    0,
+    b"\x00" * 4,
+    b"\x00" * 4,
+    0,
+    INT_REPORT_UDP_PORT,
+    0,
+    0,
+)
+# Maximum number of packets received from a socket before they are analyzed.
+COLLECTOR_BATCH_SIZE = 4096
+# Maximum time (in seconds) received packets wait before they are analyzed.
+COLLECTOR_FLUSH_INTERVAL = 0.1
+# Receive buffer requested for collector sockets, capped by net.core.rmem_max.
+COLLECTOR_RCVBUF = 1 << 26
+ETH_P_ALL = 0x0003
+
+
+class ReportCollector:
+    """
+    Analyzes INT reports as they are received instead of from a capture file.
+    Reports are decoded and analyzed in batches, then merged into the running
+    results exactly like the shards of a capture, so a snapshot at any point
+    gives the same results as analyzing a capture of the reports received so
+    far, with memory bounded by the number of flows.
+
+    Reports can be added as captured frames, as payloads of the INT report
+    UDP port, or as packets fetched from a TRex capture, or received directly
+    from a UDP or AF_PACKET socket.
+
+    :parameters:
+        drop_reason: int
+            drop reason expected in drop reports, 0 to skip the check
+        exact_irgs_limit: int
+            see ReportIrgs
+    """
+
+    def __init__(self, drop_reason: int = 0, exact_irgs_limit: int = EXACT_IRGS_LIMIT):
+        self.drop_reason = drop_reason
+        self.exact_irgs_limit = exact_irgs_limit
+        self._lock = threading.Lock()
+        # Every counter is present, so that results are complete before the
+        # first report is received.
+        self._counters = collections.Counter(dict.fromkeys(REPORT_SHARD_COUNTERS, 0))
+        self._seq_nos = {}
+        self._flows = {"local": FlowTable(), "drop": FlowTable()}
+        self._irgs = {
+            "local": ReportIrgs(exact_irgs_limit),
+            "drop": ReportIrgs(exact_irgs_limit),
+        }
+
+    def add_shard(self, shard: ReportShard) -> None:
+        """
+        Merges the analysis of reports received after the ones already added.
+        """
+        with self._lock:
+            for counter in REPORT_SHARD_COUNTERS:
+                self._counters[counter] += getattr(shard, counter)
+            for hw_id, (first, last, count) in shard.seq_nos.items():
+                if hw_id in self._seq_nos:
+                    first = self._seq_nos[hw_id][0]
+                    count += self._seq_nos[hw_id][2]
+                self._seq_nos[hw_id] = (first, last, count)
+            for report_type in ["local", "drop"]:
+                flows = getattr(shard, report_type + "_flows")
+                prev_tstamps, has_prev = self._flows[report_type].update_flows(flows)
+                irgs = self._irgs[report_type]
+                irgs.merge(getattr(shard, report_type + "_irgs"))
+                # IRGs between the last report of a flow in previous batches
+                # and its first report in this one.
+                irgs.add(
+                    _irgs_from_tstamps(
+                        prev_tstamps[has_prev], flows["first_tstamp"][has_prev]
+                    )
+                )
+
+    def add_reports(self, reports: np.ndarray) -> None:
+        """
+        Adds decoded reports (see decode_report_records).
+        """
+        self.add_shard(
+            analyze_report_records(reports, self.drop_reason, self.exact_irgs_limit)
+        )
+
+    def add_frames(self, frames, capture_ns) -> None:
+        """
+        Adds captured frames, starting from the outer Ethernet header.
+
+        :parameters:
+            frames: list of bytes-like objects
+            capture_ns: int64 array with the capture time of each frame
+        """
+        if not frames:
+            return
+        lengths = np.fromiter(map(len, frames), dtype=np.int64, count=len(frames))
+        offsets = np.zeros(len(frames), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        data = np.frombuffer(b"".join(frames), dtype=np.uint8)
+        self.add_reports(decode_report_records(data, offsets, lengths, capture_ns))
+
+    def add_report_payloads(self, payloads, capture_ns) -> None:
+        """
+        Adds payloads of UDP packets sent to the INT report port, starting
+        from the report fixed header.
+        """
+        self.add_frames([_REPORT_UDP_HEADERS + p for p in payloads], capture_ns)
+
+    def add_trex_packets(self, pkts) -> None:
+        """
+        Adds packets fetched from a TRex capture (dictionaries with the
+        "binary" frame and its "ts" capture time in seconds).
+        """
+        self.add_frames(
+            [pkt["binary"] for pkt in pkts],
+            np.array([int(pkt["ts"] * 10 ** 9) for pkt in pkts], dtype=np.int64),
+        )
+
+    def drain_trex_capture(self, client, capture_id, batch_size=COLLECTOR_BATCH_SIZE):
+        """
+        Fetches and adds all the packets currently buffered by an active TRex
+        capture. Packets are removed from the capture buffer, so calling this
+        periodically allows captures longer than the capture limit.
+
+        :returns:
+            The number of packets added
+        """
+        total = 0
+        while True:
+            pkts = []
+            client.fetch_capture_packets(capture_id, pkts, batch_size)
+            if not pkts:
+                return total
+            self.add_trex_packets(pkts)
+            total += len(pkts)
+
+    def _receive(self, sock, add_batch, duration, stop_event) -> int:
+        deadline = None if duration is None else time.monotonic() + duration
+        sock.settimeout(COLLECTOR_FLUSH_INTERVAL)
+        received = 0
+        batch = []
+        capture_ns = []
+        flush_time = time.monotonic() + COLLECTOR_FLUSH_INTERVAL
+        while True:
+            now = time.monotonic()
+            done = (deadline is not None and now >= deadline) or (
+                stop_event is not None and stop_event.is_set()
+            )
+            if batch and (
+                done or now >= flush_time or len(batch) >= COLLECTOR_BATCH_SIZE
+            ):
+                add_batch(batch, np.array(capture_ns, dtype=np.int64))
+                received += len(batch)
+                batch = []
+                capture_ns = []
+                flush_time = now + COLLECTOR_FLUSH_INTERVAL
+            if done:
+                return received
+            try:
+                batch.append(sock.recv(65535))
+            except socket.timeout:
+                continue
+            capture_ns.append(time.time_ns())
+
+    def collect_udp(
+        self,
+        port: int = INT_REPORT_UDP_PORT,
+        address: str = "",
+        duration: float = None,
+        stop_event: threading.Event = None,
+    ) -> int:
+        """
+        Receives reports sent to a local UDP port, for instance by bmv2 or the
+        Tofino model, until duration elapses or stop_event is set.
+
+        :returns:
+            The number of packets received
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, COLLECTOR_RCVBUF)
+            sock.bind((address, port))
+            return self._receive(sock, self.add_report_payloads, duration, stop_event)
+
+    def collect_af_packet(
+        self, iface: str, duration: float = None, stop_event: threading.Event = None
+    ) -> int:
+        """
+        Receives every frame seen on a network interface (requires
+        CAP_NET_RAW) until duration elapses or stop_event is set. Frames that
+        are not INT reports are counted as processed and skipped.
+
+        :returns:
+            The number of frames received
+        """
+        with socket.socket(
+            socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL)
+        ) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, COLLECTOR_RCVBUF)
+            sock.bind((iface, 0))
+            return self._receive(sock, self.add_frames, duration, stop_event)
+
+    def snapshot(self):
+        """
+        Returns the results of the reports added so far, in the same format as
+        merge_report_shards. Can be called from another thread while reports
+        are being collected.
+        """
+        with self._lock:
+            results = dict(self._counters)
+            results["dropped"] = sum(
+                last - first - (count - 1)
+                for first, last, count in self._seq_nos.values()
+            )
+            valid_irgs = {}
+            for report_type in ["local", "drop"]:
+                flows = self._flows[report_type]
+                irgs = self._irgs[report_type]
+                distribution = irgs.distribution()
+                if isinstance(distribution, QuantileSketch):
+                    distribution = distribution.copy()
+                valid_irgs[report_type] = distribution
+                results["five_tuple_to_prev_{}_report_time".format(report_type)] = len(
+                    flows
+                )
+                results[
+                    "flow_with_multiple_{}_reports".format(report_type)
+                ] = flows.flows_with_multiple_reports()
+                results["valid_{}_report_irgs".format(report_type)] = irgs.valid
+                results["bad_{}_report_irgs".format(report_type)] = irgs.bad
+                results["invalid_{}_report_irgs".format(report_type)] = irgs.invalid
+        return results, valid_irgs
+
+    def summarize(self, name: str, total_flows_from_trace: int = 0) -> dict:
+        """
+        Same as summarize_report_analysis on a snapshot. name is used like the
+        capture file name to name the plot files.
+        """
+        results, valid_irgs = self.snapshot()
+        return summarize_report_analysis(
+            name,
+            results,
+            valid_irgs["local"],
+            valid_irgs["drop"],
+            total_flows_from_trace,
+        )
+
+
+def merge_report_shards(shards):
+    """
+    Merges the partial results of consecutive record ranges.
+
+    :parameters:
+        shards: list of ReportShard, in capture order
+    :returns:
+        A tuple (results, valid_irgs) with the results dictionary of the whole
+        capture (same keys as analyze_report_pcap, without scores) and a
+        dictionary with the distribution of the valid "local" and "drop"
+        report IRGs (see ReportIrgs.distribution)
+    """
+    collector = ReportCollector(exact_irgs_limit=shards[0].local_irgs.exact_limit)
+    for shard in shards:
+        collector.add_shard(shard)
+    return collector.snapshot()
+
+
+def numpy_analyze_report_pcap(
+    pcap_file: str,
+    total_flows_from_trace: int = 0,
+    drop_reason: int = 0,
+    exact_irgs_limit: int = EXACT_IRGS_LIMIT,
+    cache: bool = True,
+) -> dict:
+    """
+    Same as analyze_report_pcap, but decodes the capture with NumPy instead of
+    scapy. Multi-million report captures are analyzed in seconds.
+
+    :parameters:
+        exact_irgs_limit: int
+            maximum number of valid IRGs per report type plotted exactly,
+            above that their distribution is estimated by a QuantileSketch.
+            None to always plot exact IRGs.
+        cache: bool
+            use the decoded report cache, see load_report_pcap
+    """
+    shard = analyze_report_records(
+        load_report_pcap(pcap_file, cache), drop_reason, exact_irgs_limit
+    )
+    results, valid_irgs = merge_report_shards([shard])
+    return summarize_report_analysis(
+        pcap_file,
+        results,
+        valid_irgs["local"],
+        valid_irgs["drop"],
+        total_flows_from_trace,
+    )
+
+
+def _analyze_report_shard(
+    pcap_file, offsets, lengths, capture_ns, drop_reason, exact_irgs_limit
+):
+    data = np.memmap(pcap_file, dtype=np.uint8, mode="r")
+    reports = _decode_report_chunks(data, offsets, lengths, capture_ns)
+    return analyze_report_records(reports, drop_reason, exact_irgs_limit)
+
+
+def _analyze_cached_report_shard(
+    cache_file, start, stop, drop_reason, exact_irgs_limit
+):
+    reports = np.load(cache_file, mmap_mode="r")[start:stop]
+    return analyze_report_records(reports, drop_reason, exact_irgs_limit)
+
+
+def _report_shard_args(pcap_file, processes, drop_reason, exact_irgs_limit):
+    with MmapPcapReader(pcap_file) as pcap:
+        bounds = np.linspace(0, len(pcap), processes + 1).astype(np.int64)
+        shard_args = [
+            (
+                pcap_file,
+                pcap.offsets[start:stop],
+                pcap.lengths[start:stop],
+                pcap.capture_ns[start:stop],
+                drop_reason,
+                exact_irgs_limit,
+            )
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+    return shard_args
+
+
+def parallel_analyze_report_pcap(
+    pcap_file: str,
+    total_flows_from_trace: int = 0,
+    drop_reason: int = 0,
+    processes: int = None,
+    exact_irgs_limit: int = EXACT_IRGS_LIMIT,
+    cache: bool = True,
+) -> dict:
+    """
+    Same as numpy_analyze_report_pcap, but the capture is split in ranges of
+    records analyzed by a pool of processes, then the partial results are
+    merged. The results are identical to the serial analysis.
+
+    :parameters:
+        processes: int
+            number of worker processes, defaults to the number of CPUs
+        exact_irgs_limit: int
+            see numpy_analyze_report_pcap
+        cache: bool
+            read the decoded report cache if the capture has one (see
+            load_report_pcap). Workers decode the capture otherwise, without
+            writing the cache. Compressed and pcapng captures can only be
+            read sequentially: they are decoded first and the cache is
+            written.
+    """
+    processes = processes or os.cpu_count()
+    cache_file = report_cache_file(pcap_file) if cache else None
+    sequential = capture_format(pcap_file) != "pcap"
+    if cache_file is not None and sequential and not exists(cache_file):
+        load_report_pcap(pcap_file)
+    if cache_file is not None and exists(cache_file):
+        reports = np.load(cache_file, mmap_mode="r")
+        bounds = np.linspace(0, len(reports), processes + 1).astype(np.int64)
+        analyze_shard = _analyze_cached_report_shard
+        shard_args = [
+            (cache_file, start, stop, drop_reason, exact_irgs_limit)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+    elif sequential:
+        reports = decode_report_pcap(pcap_file)
+        bounds = np.linspace(0, len(reports), processes + 1).astype(np.int64)
+        analyze_shard = analyze_report_records
+        shard_args = [
+            (reports[start:stop], drop_reason, exact_irgs_limit)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+    else:
+        analyze_shard = _analyze_report_shard
+        shard_args = _report_shard_args(
+            pcap_file, processes, drop_reason, exact_irgs_limit
+        )
+    with multiprocessing.Pool(processes) as pool:
+        shards = pool.starmap(analyze_shard, shard_args)
+    results, valid_irgs = merge_report_shards(shards)
+    return summarize_report_analysis(
+        pcap_file,
+        results,
+        valid_irgs["local"],
+        valid_irgs["drop"],
+        total_flows_from_trace,
+    )
+
+
+# Analysis code run by PyPy, arguments: xnt directory, pcap file, total flows,
+# drop reason and the file where the pickled results are written.
+PYPY_ANALYSIS_CODE = (
+    "import pickle, sys\n"
+    "sys.path.insert(0, sys.argv[1])\n"
+    "from xnt import analyze_report_pcap\n"
+    "result = analyze_report_pcap(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))\n"
+    "with open(sys.argv[5], 'wb') as handle:\n"
+    "    pickle.dump(result, handle, protocol=pickle.HIGHEST_PROTOCOL)\n"
+)
+
+
 def pypy_analyze_int_report_pcap(
     pcap_file: str, total_flows: int = 0, drop_reason: int = 0
 ) -> dict:
-    code = "import pickle\n" "from xnt import analyze_report_pcap\n"
+    """
+    Runs analyze_report_pcap with PyPy in a subprocess. Results are passed
+    back through a private temporary file, so concurrent analyses don't
+    interfere with each other.
+    """
+    fd, result_file = tempfile.mkstemp(prefix="xnt-", suffix=".pickle")
+    os.close(fd)
+    try:
+        cmd = [
+            "pypy",
+            "-c",
+            PYPY_ANALYSIS_CODE,
+            dirname(abspath(__file__)),
+            pcap_file,
+            str(total_flows),
+            str(drop_reason),
+            result_file,
+        ]
+        check_call(cmd)
+        with open(result_file, "rb") as handle:
+            result = pickle.load(handle)
+    finally:
+        os.remove(result_file)
+
+    return result
+
 
-    if total_flows:
-        code += f"result = analyze_report_pcap('{pcap_file}', {total_flows}, {drop_reason})\n"
+ReportAnalysisResults = collections.namedtuple(
+    "ReportAnalysisResults",
+    [
+        "pkt_processed",
+        "local_reports",
+        "five_tuple_to_prev_local_report_time",
+        "flow_with_multiple_local_reports",
+        "valid_local_report_irgs",
+        "bad_local_report_irgs",
+        "invalid_local_report_irgs",
+        "drop_reports",
+        "five_tuple_to_prev_drop_report_time",
+        "flow_with_multiple_drop_reports",
+        "valid_drop_report_irgs",
+        "bad_drop_report_irgs",
+        "invalid_drop_report_irgs",
+        "dropped",
+        "skipped",
+        "correct_drop_reports",
+        # Scores are None when they cannot be computed.
+        "flow_accuracy_score",
+        "flow_efficiency_score",
+        "drop_accuracy_score",
+        "drop_efficiency_score",
+    ],
+    defaults=[None, None, None, None],
+)
+
+# Analysis engines, they all produce the same results for the same capture.
+ANALYSIS_ENGINES = {
+    "scapy": analyze_report_pcap,
+    "numpy": numpy_analyze_report_pcap,
+    "parallel": parallel_analyze_report_pcap,
+    "pypy": pypy_analyze_int_report_pcap,
+}
+
+
+def analyze_int_report_pcap(
+    pcap_file: str,
+    total_flows: int = 0,
+    drop_reason: int = 0,
+    engine: str = "numpy",
+    in_worker: bool = False,
+) -> ReportAnalysisResults:
+    """
+    Analyzes a capture of INT reports.
+
+    :parameters:
+        pcap_file: str
+            the capture to analyze
+        total_flows: int
+            number of flows in the trace, 0 to skip the accuracy scores
+        drop_reason: int
+            drop reason expected in drop reports, 0 to skip the check
+        engine: str
+            one of ANALYSIS_ENGINES. "numpy" runs in-process, "parallel" uses
+            a pool of processes and "pypy" requires the pypy executable.
+        in_worker: bool
+            run the analysis in a worker process, results are sent back
+            through a pipe. Keeps the memory used by the analysis out of the
+            test process. Ignored by engines that already use other processes.
+    :returns:
+        The analysis results
+    """
+    if engine not in ANALYSIS_ENGINES:
+        raise ValueError("Unknown analysis engine {}".format(engine))
+    analyze = ANALYSIS_ENGINES[engine]
+    args = (pcap_file, total_flows, drop_reason)
+    if in_worker and engine in ["scapy", "numpy"]:
+        with multiprocessing.Pool(1) as pool:
+            results = pool.apply(analyze, args)
     else:
-        code += f"result = analyze_report_pcap('{pcap_file}', {drop_reason})\n"
+        results = analyze(*args)
+    return ReportAnalysisResults(**results)
+
+
+# Queue report analysis
+
+TSTAMP_MODULO = 1 << 32
+
+QueueSeries = collections.namedtuple(
+    "QueueSeries",
+    [
+        # Capture time (ns) of each local report of the queue
+        "capture_ns",
+        # Egress timestamp (ns) unwrapped to 64 bits, see unwrap_tstamps
+        "egress_tstamp",
+        # Hop latency (ns), see hop_latencies
+        "hop_latency",
+        "queue_occupancy",
+        # Mask of the reports with the queue report flag set
+        "is_queue_report",
+    ],
+)
+
+
+def hop_latencies(reports: np.ndarray) -> np.ndarray:
+    """
+    Computes the hop latency (ns) of local reports from their 32-bit ingress
+    and egress timestamps, which can wrap around between the two.
+    """
+    egress = reports["egress_tstamp"].astype(np.int64)
+    return (egress - reports["ingress_tstamp"]) % TSTAMP_MODULO
+
+
+def unwrap_tstamps(tstamps, capture_ns=None) -> np.ndarray:
+    """
+    Unwraps 32-bit timestamps (ns) to 64 bits, starting from the first one.
+    With the capture time of each timestamp, the capture clock gives the
+    epoch: only the delay between the timestamp and its capture is assumed to
+    vary by less than 2^31 ns (about 2 seconds), however far apart the
+    timestamps are. Without, consecutive timestamps are assumed to be less
+    than 2^31 ns apart, in either direction to allow reordering.
+    """
+    tstamps = np.asarray(tstamps, dtype=np.int64)
+    if len(tstamps) == 0:
+        return tstamps
+    half = TSTAMP_MODULO // 2
+    if capture_ns is not None:
+        capture_ns = np.asarray(capture_ns, dtype=np.int64)
+        offsets = (capture_ns - tstamps) % TSTAMP_MODULO
+        # Change of the capture delay since the first timestamp
+        delays = (offsets - offsets[0] + half) % TSTAMP_MODULO - half
+        return tstamps[0] + (capture_ns - capture_ns[0]) - delays
+    diffs = (np.diff(tstamps) + half) % TSTAMP_MODULO
+    unwrapped = np.empty_like(tstamps)
+    unwrapped[0] = tstamps[0]
+    np.cumsum(diffs - half, out=unwrapped[1:])
+    unwrapped[1:] += tstamps[0]
+    return unwrapped
+
+
+def analyze_queue_reports(reports: np.ndarray) -> dict:
+    """
+    Splits local reports per egress queue.
+
+    :parameters:
+        reports: numpy array of REPORT_DTYPE, in capture order
+    :returns:
+        A dictionary (egress_port_id, queue_id) -> QueueSeries
+    """
+    local = reports[reports["kind"] == REPORT_KIND_LOCAL]
+    keys = (local["egress_port_id"].astype(np.uint32) << 8) | local["queue_id"]
+    order = np.argsort(keys, kind="stable")
+    local = local[order]
+    queues, starts = np.unique(keys[order], return_index=True)
+    series = {}
+    for key, queue_reports in zip(queues, np.split(local, starts[1:])):
+        series[(int(key >> 8), int(key & 0xFF))] = QueueSeries(
+            capture_ns=queue_reports["capture_ns"],
+            egress_tstamp=unwrap_tstamps(
+                queue_reports["egress_tstamp"], queue_reports["capture_ns"]
+            ),
+            hop_latency=hop_latencies(queue_reports),
+            queue_occupancy=queue_reports["queue_occupancy"],
+            is_queue_report=queue_reports["q"] == 1,
+        )
+    return series
+
+
+def save_queue_series(npz_file: str, series: dict) -> None:
+    """
+    Saves the queue series returned by analyze_queue_reports to a compressed
+    npz file, with the series of every queue concatenated.
+    """
+    queues = sorted(series)
+    lengths = [len(series[queue].capture_ns) for queue in queues]
+    columns = {
+        field: np.concatenate(
+            [getattr(series[queue], field) for queue in queues] or [np.zeros(0)]
+        )
+        for field in QueueSeries._fields
+    }
+    np.savez_compressed(
+        npz_file,
+        queues=np.array(queues, dtype=np.int64).reshape(-1, 2),
+        offsets=np.cumsum([0] + lengths),
+        **columns,
+    )
 
-    # pickle dictionary from analyze_report_pcap
-    code += (
-        "with open('trace.pickle', 'wb') as handle:\n"
-        "    pickle.dump(result, handle, protocol=pickle.HIGHEST_PROTOCOL)"
+
+def load_queue_series(npz_file: str) -> dict:
+    """
+    Loads queue series saved by save_queue_series.
+    """
+    with np.load(npz_file) as data:
+        offsets = data["offsets"]
+        columns = {field: data[field] for field in QueueSeries._fields}
+        series = {}
+        for i, (port, queue_id) in enumerate(data["queues"]):
+            start, stop = offsets[i], offsets[i + 1]
+            series[(int(port), int(queue_id))] = QueueSeries(
+                **{field: column[start:stop] for field, column in columns.items()}
+            )
+    return series
+
+
+def analyze_queue_report_pcap(pcap_file: str, npz_file: str = None) -> dict:
+    """
+    Analyzes the hop latency and queue occupancy per egress queue in a
+    capture of INT reports, prints a summary and saves the series.
+
+    :parameters:
+        pcap_file: str
+            the capture to analyze
+        npz_file: str
+            where to save the series (see save_queue_series), defaults to the
+            capture name with a "-queues.npz" suffix
+    :returns:
+        A dictionary (egress_port_id, queue_id) -> QueueSeries
+    """
+    series = analyze_queue_reports(load_report_pcap(pcap_file))
+    for (port, queue_id), queue in sorted(series.items()):
+        print(
+            "Egress port {} queue {}: {} local reports, {} queue reports".format(
+                port,
+                queue_id,
+                len(queue.capture_ns),
+                np.count_nonzero(queue.is_queue_report),
+            )
+        )
+        p50, p99 = np.percentile(queue.hop_latency, [50, 99])
+        print(
+            "  Hop latency (ns): min {}, p50 {:.0f}, p99 {:.0f}, max {}".format(
+                queue.hop_latency.min(), p50, p99, queue.hop_latency.max()
+            )
+        )
+        print(
+            "  Queue occupancy: mean {:.1f}, max {}".format(
+                queue.queue_occupancy.mean(), queue.queue_occupancy.max()
+            )
+        )
+    if npz_file is None:
+        npz_file = splitext(pcap_file)[0] + "-queues.npz"
+    save_queue_series(npz_file, series)
+    print("Queue series can be found here: {}".format(npz_file))
+    return series
+
+
+# Join between INT reports and a capture of the reported traffic
+
+ReportJoin = collections.namedtuple(
+    "ReportJoin",
+    [
+        # Index in the traffic capture of the packet of each report, -1 when
+        # no packet has the same key
+        "packet_index",
+        # Indexes of the reports without packet
+        "misses",
+        # Indexes of the reports matched to the same packet as an earlier one
+        "duplicates",
+        # Indexes of the reports whose packet was captured before the packet
+        # of an earlier report
+        "out_of_order",
+        # Indexes of the packets between the first and last reported packets
+        # that have no report
+        "gaps",
+        # Capture time of each report minus the capture time of its packet
+        # (ns), 0 for misses
+        "capture_delay_ns",
+    ],
+)
+
+JOIN_KEYS = ["five_tuple", "ip_src"]
+
+
+def _join_keys(records: np.ndarray, key: str):
+    if key == "five_tuple":
+        return pack_five_tuples(records)
+    if key == "ip_src":
+        return records["ip_src"].astype(np.uint64), np.zeros(len(records), np.uint64)
+    raise ValueError("Unknown join key {}".format(key))
+
+
+def join_reports(
+    reports: np.ndarray, packets: np.ndarray, key: str = "five_tuple"
+) -> ReportJoin:
+    """
+    Matches reports to the packets they were generated for. A report is
+    matched to the packet with the same key (inner 5-tuple or IPv4 source)
+    that was captured closest in time, so that flows with several packets
+    can be joined, as long as the report and traffic captures use the same
+    clock (for instance two ports of the same TRex server).
+
+    :parameters:
+        reports: numpy array of REPORT_DTYPE, see decode_report_records.
+            Reports without 5-tuple are never matched.
+        packets: numpy array of REPORT_DTYPE, see decode_packet_records
+        key: str
+            one of JOIN_KEYS
+    :returns:
+        A ReportJoin
+    """
+    report_hi, report_lo = _join_keys(reports, key)
+    packet_hi, packet_lo = _join_keys(packets, key)
+    valid_packets = np.flatnonzero(packets["has_five_tuple"])
+    valid_reports = reports["has_five_tuple"]
+
+    # Reports and packets are merged into one sequence of events sorted by
+    # key, then time (packets first on ties).
+    his = np.concatenate((report_hi, packet_hi[valid_packets]))
+    los = np.concatenate((report_lo, packet_lo[valid_packets]))
+    times = np.concatenate(
+        (reports["capture_ns"], packets["capture_ns"][valid_packets])
+    )
+    is_report = np.arange(len(his)) < len(reports)
+    order = np.lexsort((is_report, times, los, his))
+    his = his[order]
+    los = los[order]
+    sorted_times = times[order]
+    positions = np.arange(len(order))
+    is_packet = ~is_report[order]
+
+    def same_key(other):
+        same = (other >= 0) & (other < len(order))
+        same[same] = (his[other[same]] == his[same]) & (los[other[same]] == los[same])
+        return same
+
+    # Closest packet event before and after each event, with the same key.
+    prev_packet = np.maximum.accumulate(np.where(is_packet, positions, -1))
+    next_packet = np.minimum.accumulate(
+        np.where(is_packet, positions, len(order))[::-1]
+    )[::-1]
+    has_prev = same_key(prev_packet)
+    has_next = same_key(next_packet)
+    prev_delay = np.where(has_prev, sorted_times - sorted_times[prev_packet], 0)
+    next_delay = np.where(
+        has_next,
+        sorted_times[np.minimum(next_packet, len(order) - 1)] - sorted_times,
+        0,
+    )
+    use_next = has_next & (~has_prev | (next_delay < prev_delay))
+    match = np.where(use_next, next_packet, np.where(has_prev, prev_packet, -1))
+
+    report_events = np.flatnonzero(~is_packet)
+    report_indexes = order[report_events]
+    matched = match[report_events]
+    packet_index = np.full(len(reports), -1, dtype=np.int64)
+    has_match = matched >= 0
+    packet_index[report_indexes[has_match]] = valid_packets[
+        order[matched[has_match]] - len(reports)
+    ]
+    packet_index[~valid_reports] = -1
+    capture_delay_ns = np.zeros(len(reports), dtype=np.int64)
+    found = np.flatnonzero(packet_index >= 0)
+    found_packets = packet_index[found]
+    capture_delay_ns[found] = (
+        reports["capture_ns"][found] - packets["capture_ns"][found_packets]
     )
 
-    cmd = ["pypy", "-c", code]
-    p = Popen(cmd)
-    p.wait()
+    _, first = np.unique(found_packets, return_index=True)
+    duplicates = np.setdiff1d(found, found[first])
+    previous_max = np.maximum.accumulate(found_packets)
+    out_of_order = found[1:][found_packets[1:] < previous_max[:-1]]
+    gaps = np.zeros(0, dtype=np.int64)
+    if len(found_packets):
+        candidates = valid_packets[
+            (valid_packets >= found_packets.min())
+            & (valid_packets <= found_packets.max())
+        ]
+        gaps = np.setdiff1d(candidates, found_packets)
+    return ReportJoin(
+        packet_index=packet_index,
+        misses=np.flatnonzero(packet_index < 0),
+        duplicates=duplicates,
+        out_of_order=out_of_order,
+        gaps=gaps,
+        capture_delay_ns=capture_delay_ns,
+    )
 
-    with open("trace.pickle", "rb") as handle:
-        result = pickle.load(handle)
 
-    return result
+def join_report_pcap(
+    report_pcap_file: str, packet_pcap_file: str, key: str = "five_tuple"
+):
+    """
+    Joins the INT reports of a capture with a capture of the reported traffic,
+    see join_reports. Records that are not INT reports are ignored.
+
+    :returns:
+        A tuple (reports, packets, join) with the decoded reports and packets
+        and the ReportJoin
+    """
+    reports = load_report_pcap(report_pcap_file)
+    kinds = reports["kind"]
+    reports = reports[(kinds == REPORT_KIND_LOCAL) | (kinds == REPORT_KIND_DROP)]
+    packets = decode_packet_pcap(packet_pcap_file)
+    return reports, packets, join_reports(reports, packets, key)
+
+
+# Fields printed by dump_report_pcap, in order. "type" and "hop_latency" are
+# derived from the decoded fields, see format_reports.
+DUMP_FIELDS = [
+    "capture_ns",
+    "type",
+    "hw_id",
+    "seq_no",
+    "switch_id",
+    "ingress_port_id",
+    "egress_port_id",
+    "queue_id",
+    "queue_occupancy",
+    "ingress_tstamp",
+    "egress_tstamp",
+    "hop_latency",
+    "drop_reason",
+] + FIVE_TUPLE_FIELDS
+DUMP_FORMATS = ["text", "csv", "json"]
+DUMP_IP_FIELDS = ["ip_src", "ip_dst"]
+DUMP_STRING_FIELDS = ["type"] + DUMP_IP_FIELDS
+
+# Report type names indexed by d << 2 | q << 1 | f.
+_REPORT_TYPE_NAMES = np.array(
+    [
+        "+".join(t for t, bit in zip(["drop", "queue", "flow"], flags) if bit) or "none"
+        for flags in np.ndindex(2, 2, 2)
+    ]
+)
+
+
+def filter_reports(reports: np.ndarray, **filters) -> np.ndarray:
+    """
+    Selects INT reports by field value.
+
+    :parameters:
+        reports: numpy array of REPORT_DTYPE
+        filters: sequences of accepted values, keyed by REPORT_DTYPE field
+            name. The "port" key matches both the ingress and egress port.
+            Filters set to None or to an empty sequence accept every value.
+    :returns:
+        The mask of the INT reports that match every filter
+    """
+    mask = reports["kind"] != REPORT_KIND_NONE
+    for field, values in filters.items():
+        if not values:
+            continue
+        if field == "port":
+            mask &= np.isin(reports["ingress_port_id"], values) | np.isin(
+                reports["egress_port_id"], values
+            )
+        else:
+            mask &= np.isin(reports[field], values)
+    return mask
+
+
+def _ip_strings(ips: np.ndarray) -> list:
+    return list(
+        map(
+            "{}.{}.{}.{}".format,
+            (ips >> 24).tolist(),
+            ((ips >> 16) & 0xFF).tolist(),
+            ((ips >> 8) & 0xFF).tolist(),
+            (ips & 0xFF).tolist(),
+        )
+    )
+
+
+def _dump_column(reports: np.ndarray, field: str) -> list:
+    if field == "type":
+        flags = (reports["d"] << 2 | reports["q"] << 1 | reports["f"]) & 7
+        return _REPORT_TYPE_NAMES[flags].tolist()
+    if field == "hop_latency":
+        latency = hop_latencies(reports)
+        return np.where(reports["kind"] == REPORT_KIND_LOCAL, latency, 0).tolist()
+    if field in DUMP_IP_FIELDS:
+        return _ip_strings(reports[field])
+    return reports[field].tolist()
+
+
+def format_reports(reports: np.ndarray, fields=None, fmt: str = "text") -> str:
+    """
+    Formats a batch of decoded INT reports, one line per report.
+
+    Every field is converted column by column and lines are built with a
+    single format string, instead of dissecting and formatting each report
+    like get_readable_int_report_str does.
+
+    :parameters:
+        reports: numpy array of REPORT_DTYPE
+        fields: list of DUMP_FIELDS to print, all of them by default
+        fmt: str
+            one of DUMP_FORMATS: "text" (name=value pairs), "csv" (values
+            only, see dump_report_pcap for the header) or "json" (JSON lines)
+    :returns:
+        The formatted lines, each terminated by a newline
+    """
+    fields = fields or DUMP_FIELDS
+    if fmt == "text":
+        template = " ".join("{}={{}}".format(f) for f in fields)
+    elif fmt == "csv":
+        template = ",".join("{}" for _ in fields)
+    elif fmt == "json":
+        template = ", ".join(
+            '"{}": "{{}}"'.format(f)
+            if f in DUMP_STRING_FIELDS
+            else '"{}": {{}}'.format(f)
+            for f in fields
+        )
+        template = "{{" + template + "}}"
+    else:
+        raise ValueError("Unknown dump format {}".format(fmt))
+    if len(reports) == 0:
+        return ""
+    columns = [_dump_column(reports, f) for f in fields]
+    return "\n".join(map(template.format, *columns)) + "\n"
+
+
+def dump_report_pcap(
+    pcap_file: str,
+    out,
+    fields=None,
+    fmt: str = "text",
+    chunk_size: int = DECODE_CHUNK_SIZE,
+    **filters,
+) -> int:
+    """
+    Decodes the INT reports of a capture chunk by chunk and writes the ones
+    selected by filters to out, see filter_reports and format_reports.
+    Output is written as soon as each chunk is decoded, so that memory usage
+    does not grow with the number of reports.
+
+    :parameters:
+        pcap_file: str
+            path to the pcap file
+        out: text file to write to
+        fields, fmt: see format_reports
+        chunk_size: int
+            number of records decoded at once, see iter_pcap_chunks
+        filters: see filter_reports
+    :returns:
+        The number of reports written
+    """
+    fields = fields or DUMP_FIELDS
+    if fmt == "csv":
+        out.write(",".join(fields) + "\n")
+    written = 0
+    for chunk in iter_pcap_chunks(pcap_file, chunk_size):
+        reports = decode_report_records(*chunk)
+        reports = reports[filter_reports(reports, **filters)]
+        out.write(format_reports(reports, fields, fmt))
+        written += len(reports)
+    return written
 
 
 def plot_histogram_and_cdf(report_plot_file, valid_report_irgs):
+    """
+    Plots the histogram and CDF of valid IRGs, given as a sequence of values
+    or as a QuantileSketch.
+    """
     if exists(report_plot_file):
         os.remove(report_plot_file)
+    if isinstance(valid_report_irgs, QuantileSketch):
+        sketch = valid_report_irgs
+        max_irg = sketch.max
+        percentile_of_score = sketch.percentile_of_score
+        percentile = sketch.percentile
+        histogram = sketch.histogram
+    else:
+        max_irg = np.max(valid_report_irgs)
+        percentile_of_score = partial(stats.percentileofscore, valid_report_irgs)
+        percentile = partial(np.percentile, valid_report_irgs)
+
+        def histogram(bins):
+            return np.histogram(valid_report_irgs, bins=bins)[0]
+
     bin_size = 0.25  # sec
-    max_val = max(np.max(valid_report_irgs), 3)
-    percentile_of_900_msec = stats.percentileofscore(valid_report_irgs, 0.9)
-    percentile_of_one_sec = stats.percentileofscore(valid_report_irgs, 1)
-    percentile_of_two_sec = stats.percentileofscore(valid_report_irgs, 2)
+    max_val = max(max_irg, 3)
+    percentile_of_900_msec = percentile_of_score(0.9)
+    percentile_of_one_sec = percentile_of_score(1)
+    percentile_of_two_sec = percentile_of_score(2)
     percentiles = [
         1,
         5,
@@ -398,10 +2965,10 @@ def plot_histogram_and_cdf(report_plot_file, valid_report_irgs):
         percentile_of_one_sec,
         percentile_of_two_sec,
     ]
-    vlines = np.percentile(valid_report_irgs, percentiles)
+    vlines = percentile(percentiles)
 
     bins = np.arange(0, max_val + bin_size, bin_size)
-    hist, bins = np.histogram(valid_report_irgs, bins=bins)
+    hist = histogram(bins)
 
     # to percentage
     hist = hist / hist.sum()
@@ -427,3 +2994,65 @@ def plot_histogram_and_cdf(report_plot_file, valid_report_irgs):
     plt.savefig(report_plot_file)
     print("Histogram and CDF graph can be found here: {}".format(report_plot_file))
     return report_plot_file
+
+
+def _ip_address(value: str) -> int:
+    return struct.unpack("!I", inet_aton(value))[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="INT report capture tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    dump = subparsers.add_parser(
+        "dump", help="Print the fields of the INT reports of a capture"
+    )
+    dump.add_argument("pcap_file", help="INT report capture", type=str)
+    dump.add_argument(
+        "--format", help="Output format", choices=DUMP_FORMATS, default="text"
+    )
+    dump.add_argument(
+        "--fields",
+        help="Comma-separated fields to print, among {}".format(",".join(DUMP_FIELDS)),
+        type=lambda x: x.split(","),
+        default=DUMP_FIELDS,
+    )
+    # Every filter can be repeated to accept several values.
+    filter_options = [
+        ("--hw-id", "hw_id", int),
+        ("--switch-id", "switch_id", int),
+        ("--port", "port", int),
+        ("--ingress-port", "ingress_port_id", int),
+        ("--egress-port", "egress_port_id", int),
+        ("--queue", "queue_id", int),
+        ("--drop-reason", "drop_reason", int),
+        ("--ip-src", "ip_src", _ip_address),
+        ("--ip-dst", "ip_dst", _ip_address),
+        ("--ip-proto", "ip_proto", int),
+        ("--sport", "l4_sport", int),
+        ("--dport", "l4_dport", int),
+    ]
+    for name, field, value_type in filter_options:
+        dump.add_argument(
+            name,
+            help="Only print reports with this {}".format(field),
+            dest=field,
+            type=value_type,
+            action="append",
+        )
+    args = parser.parse_args()
+
+    unknown_fields = set(args.fields) - set(DUMP_FIELDS)
+    if unknown_fields:
+        parser.error("Unknown fields: {}".format(", ".join(sorted(unknown_fields))))
+    filters = {field: getattr(args, field) for _, field, _ in filter_options}
+    try:
+        dump_report_pcap(
+            args.pcap_file, sys.stdout, args.fields, args.format, **filters
+        )
+    except BrokenPipeError:
+        # Output piped to head or similar, stop quietly.
+        sys.stderr.close()
+
+
+if __name__ == "__main__":
+    main()
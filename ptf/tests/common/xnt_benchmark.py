@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+
+# Copyright 2021-present Open Networking Foundation
+# SPDX-License-Identifier: Apache-2.0
+
+# Benchmarks of the xnt INT report analysis on synthetic captures. Runs
+# without switch or TRex, for instance:
+#
+#   ./xnt_benchmark.py --reports 100000 1000000 --output results.json
+
+import argparse
+import contextlib
+import datetime
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np  # noqa: E402
+import xnt  # noqa: E402
+
+DEFAULT_REPORTS = [100000, 1000000, 10000000]
+DEFAULT_FLOWS = 100000
+DEFAULT_DROP_FRACTION = 0.2
+DEFAULT_SEQ_GAP_FRACTION = 0.001
+# Reports per second of the synthetic captures, sets the capture timestamps.
+REPORT_RATE = 100000
+# Number of records generated at once.
+GENERATE_CHUNK_SIZE = 1 << 20
+# Engines slower than this rate are skipped on larger captures.
+SLOW_ENGINES = {"scapy", "pypy"}
+DEFAULT_SLOW_ENGINE_LIMIT = 100000
+READABLE_STR_REPORTS = 10000
+HW_IDS = 4
+DROP_REASON = 80
+INNER_PAYLOAD_LEN = 18
+
+OUTER_HEADERS_LEN = 14 + 20 + 8
+INNER_HEADERS_LEN = 14 + 20 + 8 + INNER_PAYLOAD_LEN
+LOCAL_RECORD_LEN = (
+    OUTER_HEADERS_LEN
+    + xnt.INT_REPORT_FIXED_LEN
+    + xnt.INT_LOCAL_REPORT_LEN
+    + INNER_HEADERS_LEN
+)
+DROP_RECORD_LEN = (
+    OUTER_HEADERS_LEN
+    + xnt.INT_REPORT_FIXED_LEN
+    + xnt.INT_DROP_REPORT_LEN
+    + INNER_HEADERS_LEN
+)
+
+
+def _put(buf, pos, values, size, byteorder="big"):
+    """
+    Writes size-byte integers at the given positions of a uint8 buffer.
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    for i in range(size):
+        shift = 8 * (size - 1 - i if byteorder == "big" else i)
+        buf[pos + i] = (values >> np.uint64(shift)) & np.uint64(0xFF)
+
+
+def _put_bytes(buf, pos, data: bytes):
+    """
+    Writes the same bytes at the given positions of a uint8 buffer.
+    """
+    buf[pos[:, None] + np.arange(len(data))] = np.frombuffer(data, dtype=np.uint8)
+
+
+def _ipv4_headers(total_len, src, dst) -> bytes:
+    return (
+        bytes([0x45, 0])
+        + total_len.to_bytes(2, "big")
+        + bytes([0, 0, 0, 0, 64, xnt.IP_PROTO_UDP, 0, 0])
+        + bytes(src)
+        + bytes(dst)
+    )
+
+
+class SyntheticReportGenerator:
+    """
+    Generates deterministic INT report captures: flow (local) and drop reports
+    of UDP flows, with reports of random flows sent at a constant rate and
+    sequence numbers per hardware ID with occasional gaps.
+
+    :parameters:
+        flows: int
+            number of distinct inner 5-tuples
+        drop_fraction: float
+            fraction of drop reports, the others are local reports
+        seq_gap_fraction: float
+            fraction of reports preceded by lost reports
+        seed: int
+            random seed, the same parameters always generate the same capture
+    """
+
+    def __init__(
+        self,
+        flows: int = DEFAULT_FLOWS,
+        drop_fraction: float = DEFAULT_DROP_FRACTION,
+        seq_gap_fraction: float = DEFAULT_SEQ_GAP_FRACTION,
+        seed: int = 0,
+    ):
+        self.flows = flows
+        self.drop_fraction = drop_fraction
+        self.seq_gap_fraction = seq_gap_fraction
+        self.seed = seed
+
+    def name(self, reports: int) -> str:
+        return "reports-{}-flows-{}-drop-{}-gap-{}-seed-{}.pcap".format(
+            reports, self.flows, self.drop_fraction, self.seq_gap_fraction, self.seed
+        )
+
+    def _generate_chunk(self, rng, first, count, seq_nos) -> np.ndarray:
+        index = np.arange(first, first + count, dtype=np.int64)
+        is_drop = rng.random(count) < self.drop_fraction
+        flow = rng.integers(0, self.flows, count)
+        hw_id = rng.integers(0, HW_IDS, count)
+        seq_no = np.empty(count, dtype=np.int64)
+        increments = 1 + (rng.random(count) < self.seq_gap_fraction) * rng.integers(
+            1, 10, count
+        )
+        for i in range(HW_IDS):
+            mask = hw_id == i
+            seq_no[mask] = seq_nos[i] + np.cumsum(increments[mask])
+            if mask.any():
+                seq_nos[i] = seq_no[mask][-1]
+        capture_ns = index * (10 ** 9 // REPORT_RATE)
+        ingress_tstamp = (capture_ns + 12345) % xnt.TSTAMP_MODULO
+        egress_tstamp = (ingress_tstamp + rng.integers(200, 5000, count)) % (
+            xnt.TSTAMP_MODULO
+        )
+
+        record_len = np.where(is_drop, DROP_RECORD_LEN, LOCAL_RECORD_LEN)
+        pos = np.zeros(count, dtype=np.int64)
+        np.cumsum(xnt.PCAP_RECORD_HEADER_LEN + record_len[:-1], out=pos[1:])
+        buf = np.zeros(
+            int(pos[-1] + xnt.PCAP_RECORD_HEADER_LEN + record_len[-1]), np.uint8
+        )
+
+        # pcap record header
+        _put(buf, pos, capture_ns // 10 ** 9, 4, "little")
+        _put(buf, pos + 4, capture_ns % 10 ** 9 // 1000, 4, "little")
+        _put(buf, pos + 8, record_len, 4, "little")
+        _put(buf, pos + 12, record_len, 4, "little")
+        pos = pos + xnt.PCAP_RECORD_HEADER_LEN
+
+        # Outer Ethernet / IPv4 / UDP, lengths are not checked by the decoder.
+        eth = bytes(6) + bytes([0, 0, 0, 0, 0, 1]) + bytes([0x08, 0x00])
+        _put_bytes(buf, pos, eth)
+        _put_bytes(
+            buf, pos + 14, _ipv4_headers(0, [192, 168, 0, 1], [192, 168, 99, 254])
+        )
+        _put(buf, pos + 34, 1234, 2)
+        _put(buf, pos + 36, xnt.INT_REPORT_UDP_PORT, 2)
+        pos = pos + OUTER_HEADERS_LEN
+
+        # Report fixed header
+        _put(buf, pos, np.where(is_drop, 1, 2), 1)
+        # d flag for drop reports, f flag for local ones and q for some of them
+        is_queue = ~is_drop & (index % 10 == 0)
+        _put(
+            buf,
+            pos + 1,
+            np.where(is_drop, 0x80, 0x20 | (is_queue.astype(np.uint8) << 6)),
+            1,
+        )
+        _put(buf, pos + 3, hw_id, 1)
+        _put(buf, pos + 4, seq_no % xnt.TSTAMP_MODULO, 4)
+        _put(buf, pos + 8, ingress_tstamp, 4)
+        pos = pos + xnt.INT_REPORT_FIXED_LEN
+
+        # Local or drop report header
+        _put(buf, pos, 1, 4)
+        _put(buf, pos + 4, 1, 2)
+        _put(buf, pos + 6, 2 + flow % 4, 2)
+        _put(buf, pos + 8, flow % 4, 1)
+        local = np.flatnonzero(~is_drop)
+        _put(buf, pos[local] + 9, rng.integers(0, 1 << 16, len(local)), 3)
+        _put(buf, pos[local] + 12, egress_tstamp[local], 4)
+        drop = np.flatnonzero(is_drop)
+        _put(buf, pos[drop] + 9, DROP_REASON, 1)
+        pos = pos + np.where(is_drop, xnt.INT_DROP_REPORT_LEN, xnt.INT_LOCAL_REPORT_LEN)
+
+        # Inner Ethernet / IPv4 / UDP
+        _put_bytes(buf, pos, eth)
+        _put_bytes(
+            buf,
+            pos + 14,
+            _ipv4_headers(INNER_HEADERS_LEN - 14, [0] * 4, [10, 255, 0, 1]),
+        )
+        _put(buf, pos + 26, (10 << 24) + flow, 4)
+        _put(buf, pos + 34, 1024 + flow % 50000, 2)
+        _put(buf, pos + 36, 53, 2)
+        _put(buf, pos + 38, 8 + INNER_PAYLOAD_LEN, 2)
+        return buf
+
+    def generate(self, pcap_file: str, reports: int) -> None:
+        """
+        Writes a capture of the given number of reports.
+        """
+        rng = np.random.default_rng(self.seed)
+        seq_nos = np.zeros(HW_IDS, dtype=np.int64)
+        with open(pcap_file, "wb") as f:
+            f.write(
+                xnt.PCAP_MAGIC_USEC.to_bytes(4, "little")
+                + (2).to_bytes(2, "little")
+                + (4).to_bytes(2, "little")
+                + bytes(8)
+                + (65535).to_bytes(4, "little")
+                + xnt.PCAP_LINKTYPE_ETHERNET.to_bytes(4, "little")
+            )
+            for first in range(0, reports, GENERATE_CHUNK_SIZE):
+                count = min(GENERATE_CHUNK_SIZE, reports - first)
+                self._generate_chunk(rng, first, count, seq_nos).tofile(f)
+
+
+# Benchmarks, run in a fresh process. They return the elapsed time and the
+# number of reports processed.
+
+
+def _quiet(func, *args, **kwargs):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return func(*args, **kwargs)
+
+
+def bench_decode(pcap_file):
+    start = time.perf_counter()
+    reports = xnt.decode_report_pcap(pcap_file)
+    return time.perf_counter() - start, len(reports)
+
+
+def bench_engine(pcap_file, engine):
+    if engine == "numpy-cached":
+        xnt.load_report_pcap(pcap_file)
+        analyze = xnt.numpy_analyze_report_pcap
+    elif engine in ["numpy", "parallel"]:
+        analyze = functools.partial(xnt.ANALYSIS_ENGINES[engine], cache=False)
+    else:
+        analyze = xnt.ANALYSIS_ENGINES[engine]
+    start = time.perf_counter()
+    results = _quiet(analyze, pcap_file, 0, DROP_REASON)
+    return time.perf_counter() - start, results["pkt_processed"]
+
+
+def bench_plot(pcap_file):
+    shard = xnt.analyze_report_records(xnt.decode_report_pcap(pcap_file))
+    _, valid_irgs = xnt.merge_report_shards([shard])
+    plot_file = os.path.splitext(pcap_file)[0] + "-bench.png"
+    start = time.perf_counter()
+    _quiet(xnt.plot_histogram_and_cdf, plot_file, valid_irgs["local"])
+    return time.perf_counter() - start, shard.local_irgs.valid
+
+
+def bench_readable_str(pcap_file):
+    with xnt.MmapPcapReader(pcap_file) as pcap:
+        pkts = []
+        for pkt in pcap.packets():
+            pkts.append(pkt)
+            if len(pkts) == READABLE_STR_REPORTS:
+                break
+    start = time.perf_counter()
+    for pkt in pkts:
+        xnt.get_readable_int_report_str(pkt)
+    return time.perf_counter() - start, len(pkts)
+
+
+def _run_benchmark(conn, bench, args):
+    seconds, reports = bench(*args)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in KiB on Linux
+    conn.send(
+        {
+            "seconds": seconds,
+            "reports": reports,
+            "reports_per_second": reports / seconds if seconds else None,
+            "peak_rss_bytes": usage.ru_maxrss * 1024,
+            "children_peak_rss_bytes": children_usage.ru_maxrss * 1024,
+        }
+    )
+    conn.close()
+
+
+def run_benchmark(bench, *args) -> dict:
+    """
+    Runs a benchmark in a fresh process, so that peak memory is measured
+    independently of the previous benchmarks. The process is not a daemon so
+    that engines can start their own worker processes.
+    """
+    context = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_run_benchmark, args=(child_conn, bench, args))
+    process.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        raise RuntimeError("Benchmark {} failed".format(bench.__name__))
+    finally:
+        process.join()
+    return result
+
+
+def available_engines():
+    engines = ["numpy", "numpy-cached", "parallel", "scapy"]
+    if shutil.which("pypy"):
+        engines.append("pypy")
+    return engines
+
+
+def run_benchmarks(
+    workdir: str,
+    report_counts,
+    engines,
+    generator: SyntheticReportGenerator,
+    slow_engine_limit: int = DEFAULT_SLOW_ENGINE_LIMIT,
+):
+    """
+    Runs every benchmark on synthetic captures of each size.
+
+    :returns:
+        A list of result dictionaries, one per benchmark run
+    """
+    results = []
+    for reports in report_counts:
+        pcap_file = os.path.join(workdir, generator.name(reports))
+        if not os.path.exists(pcap_file):
+            start = time.perf_counter()
+            generator.generate(pcap_file, reports)
+            print(
+                "Generated {} in {:.1f}s".format(pcap_file, time.perf_counter() - start)
+            )
+        benchmarks = [("decode", None, bench_decode, ())]
+        for engine in engines:
+            benchmarks.append(("analysis", engine, bench_engine, (engine,)))
+        benchmarks.append(("plot_histogram_and_cdf", None, bench_plot, ()))
+        benchmarks.append(("get_readable_int_report_str", None, bench_readable_str, ()))
+        for name, engine, bench, args in benchmarks:
+            result = {
+                "benchmark": name,
+                "engine": engine,
+                "capture_reports": reports,
+                "flows": generator.flows,
+                "drop_fraction": generator.drop_fraction,
+            }
+            if engine in SLOW_ENGINES and reports > slow_engine_limit:
+                result["skipped"] = True
+            else:
+                result.update(run_benchmark(bench, pcap_file, *args))
+                print(
+                    "{} reports, {} {}: {:.3f}s, {:.0f} reports/s, peak RSS {:.0f} MiB".format(
+                        reports,
+                        name,
+                        engine or "",
+                        result["seconds"],
+                        result["reports_per_second"] or 0,
+                        max(result["peak_rss_bytes"], result["children_peak_rss_bytes"])
+                        / 2 ** 20,
+                    )
+                )
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the INT report analysis on synthetic captures"
+    )
+    parser.add_argument(
+        "--reports",
+        help="Number of reports of each synthetic capture",
+        type=int,
+        nargs="+",
+        default=DEFAULT_REPORTS,
+    )
+    parser.add_argument(
+        "--flows", help="Number of flows", type=int, default=DEFAULT_FLOWS
+    )
+    parser.add_argument(
+        "--drop-fraction",
+        help="Fraction of drop reports",
+        type=float,
+        default=DEFAULT_DROP_FRACTION,
+    )
+    parser.add_argument(
+        "--seq-gap-fraction",
+        help="Fraction of reports following lost reports",
+        type=float,
+        default=DEFAULT_SEQ_GAP_FRACTION,
+    )
+    parser.add_argument("--seed", help="Random seed", type=int, default=0)
+    parser.add_argument(
+        "--engines",
+        help="Analysis engines to benchmark",
+        nargs="+",
+        default=available_engines(),
+    )
+    parser.add_argument(
+        "--slow-engine-limit",
+        help="Largest capture analyzed by the scapy and PyPy engines",
+        type=int,
+        default=DEFAULT_SLOW_ENGINE_LIMIT,
+    )
+    parser.add_argument(
+        "--workdir",
+        help="Directory of the synthetic captures, reused across runs",
+        type=str,
+        default=os.path.join(tempfile.gettempdir(), "xnt-benchmark"),
+    )
+    parser.add_argument(
+        "--output", help="JSON file where results are written", type=str
+    )
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    generator = SyntheticReportGenerator(
+        args.flows, args.drop_fraction, args.seq_gap_fraction, args.seed
+    )
+    results = run_benchmarks(
+        args.workdir, args.reports, args.engines, generator, args.slow_engine_limit
+    )
+    output = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+
+# Copyright 2021-present Open Networking Foundation
+# SPDX-License-Identifier: Apache-2.0
+
+# Software model of the INT report filters of fabric-tna (see
+# p4src/tna/include/control/int.p4), to estimate offline the reports the
+# switch generates for a given traffic capture and filter configuration.
+#
+# The model is statistical, not hash-exact with the switch. Hash inputs are
+# packed at byte boundaries (e.g. 9-bit ports in 2-byte fields) instead of the
+# bit layout of the P4 field lists, and switch timestamps are estimated from
+# capture times. Which packets collide differs from the switch, but the
+# collision rates, and so the report counts and scores, follow the same
+# distribution.
+#
+# Both the flow and the drop report filters are bloom filters made of two
+# registers of 16-bit digests, indexed by the upper and lower 16 bits of the
+# CRC32 hash of the packet 5-tuple. For each packet, both registers are
+# updated with the packet digest, and a report is generated only when both
+# registers held a different digest. The digest of a packet is the CRC16 of:
+# - flow filter: ingress and egress port, masked hop latency, 5-tuple hash
+#   and masked timestamp;
+# - drop filter: 5-tuple hash and masked timestamp.
+#
+# Since the value read from a register is the digest written by the previous
+# packet with the same index, the filters are evaluated for a whole capture
+# at once by sorting packets per register index.
+
+import argparse
+import collections
+import os
+
+import numpy as np
+from xnt import (
+    IP_PROTO_TCP,
+    IP_PROTO_UDP,
+    REPORT_DTYPE,
+    REPORT_KIND_DROP,
+    REPORT_KIND_LOCAL,
+    ReportCollector,
+    decode_packet_pcap,
+)
+
+# Same as in p4src/tna/include/control/int.p4
+DEFAULT_HOP_LATENCY_MASK = 0xFFFFFF00
+DEFAULT_TIMESTAMP_MASK = 0xFFFFC0000000
+# FLOW_REPORT_FILTER_WIDTH and DROP_REPORT_FILTER_WIDTH in define.p4
+REPORT_FILTER_WIDTH = 16
+TIMESTAMP_BITS = 48
+
+
+def _crc_table(reflected_poly: int) -> np.ndarray:
+    table = np.arange(256, dtype=np.uint32)
+    for _ in range(8):
+        table = np.where(table & 1, (table >> 1) ^ reflected_poly, table >> 1)
+    return table.astype(np.uint32)
+
+
+# CRC-32 (as zlib) and CRC-16/ARC, the algorithms of the CRC32 and CRC16 hashes
+# used by int.p4. Inputs are packed differently, see the module description.
+CRC32_TABLE = _crc_table(0xEDB88320)
+CRC16_TABLE = _crc_table(0xA001)
+
+
+def _crc(table, init, xor_out, rows) -> np.ndarray:
+    crc = np.full(len(rows), init, dtype=np.uint32)
+    for i in range(rows.shape[1]):
+        crc = table[(crc ^ rows[:, i]) & 0xFF] ^ (crc >> 8)
+    return crc ^ np.uint32(xor_out)
+
+
+def crc32(rows: np.ndarray) -> np.ndarray:
+    """
+    Computes the CRC32 of each row of a 2-D uint8 array.
+    """
+    return _crc(CRC32_TABLE, 0xFFFFFFFF, 0xFFFFFFFF, rows)
+
+
+def crc16(rows: np.ndarray) -> np.ndarray:
+    """
+    Computes the CRC16 of each row of a 2-D uint8 array.
+    """
+    return _crc(CRC16_TABLE, 0, 0, rows).astype(np.uint16)
+
+
+def _hash_input(*fields) -> np.ndarray:
+    """
+    Concatenates big-endian fields, given as (values, size in bytes), into
+    one row of bytes per packet.
+    """
+    columns = []
+    for values, size in fields:
+        values = np.asarray(values, dtype=np.uint64)
+        for i in reversed(range(size)):
+            columns.append((values >> np.uint64(8 * i)).astype(np.uint8))
+    return np.stack(columns, axis=1)
+
+
+def flow_hashes(records: np.ndarray) -> np.ndarray:
+    """
+    Computes the 5-tuple hash (inner_hash in hasher.p4) of decoded packets.
+    """
+    return crc32(
+        _hash_input(
+            (records["ip_src"], 4),
+            (records["ip_dst"], 4),
+            (records["ip_proto"], 1),
+            (records["l4_sport"], 2),
+            (records["l4_dport"], 2),
+        )
+    )
+
+
+def switch_tstamps(
+    records: np.ndarray, tstamp_offset: int = 0, speedup: float = 1.0
+) -> np.ndarray:
+    """
+    Estimates the 48-bit switch timestamp (ns) of each packet from its capture
+    time, for a replay of the capture at the given speedup starting when the
+    switch clock is tstamp_offset.
+    """
+    elapsed = (records["capture_ns"] - records["capture_ns"][:1]) / speedup
+    return (elapsed.astype(np.int64) + tstamp_offset) % (1 << TIMESTAMP_BITS)
+
+
+def _previous_in_register(indexes, digests) -> np.ndarray:
+    """
+    Returns the register value read by each packet: the digest written by the
+    previous packet with the same index, or 0 (the initial value).
+    """
+    order = np.argsort(indexes, kind="stable")
+    sorted_indexes = indexes[order]
+    sorted_previous = np.zeros(len(order), dtype=digests.dtype)
+    sorted_previous[1:] = digests[order][:-1]
+    sorted_previous[1:][sorted_indexes[1:] != sorted_indexes[:-1]] = 0
+    previous = np.empty_like(sorted_previous)
+    previous[order] = sorted_previous
+    return previous
+
+
+def bloom_filter_reports(
+    hashes: np.ndarray, digests: np.ndarray, filter_width: int = REPORT_FILTER_WIDTH
+) -> np.ndarray:
+    """
+    Evaluates the two-register digest filter on a sequence of packets.
+
+    :parameters:
+        hashes: uint32 array of 5-tuple hashes, registers are indexed by their
+            upper and lower 16 bits, truncated to filter_width bits
+        digests: uint16 array of packet digests
+        filter_width: int
+            log2 of the number of entries of each register
+    :returns:
+        A boolean mask of the packets that generate a report
+    """
+    index_mask = np.uint32((1 << filter_width) - 1)
+    unchanged1 = _previous_in_register((hashes >> 16) & index_mask, digests) == digests
+    unchanged2 = _previous_in_register(hashes & index_mask, digests) == digests
+    return ~(unchanged1 | unchanged2)
+
+
+def flow_report_filter(
+    records: np.ndarray,
+    hop_latency=0,
+    hop_latency_mask: int = DEFAULT_HOP_LATENCY_MASK,
+    timestamp_mask: int = DEFAULT_TIMESTAMP_MASK,
+    ig_port: int = 0,
+    eg_port: int = 0,
+    tstamp_offset: int = 0,
+    speedup: float = 1.0,
+    filter_width: int = REPORT_FILTER_WIDTH,
+) -> np.ndarray:
+    """
+    Predicts which packets generate a flow report.
+
+    :parameters:
+        records: numpy array of REPORT_DTYPE, see decode_packet_pcap. Only
+            IPv4 packets (with has_five_tuple set) are filtered.
+        hop_latency: hop latency in ns, a scalar or one value per packet
+        hop_latency_mask, timestamp_mask: int
+            masks set by FabricTest.set_up_flow_report_filter_config
+        ig_port, eg_port: int
+            switch ports of the packets
+        tstamp_offset, speedup: see switch_tstamps
+        filter_width: see bloom_filter_reports
+    :returns:
+        A boolean mask of the packets that generate a flow report
+    """
+    hashes = flow_hashes(records)
+    hop_latency = np.broadcast_to(np.asarray(hop_latency, dtype=np.int64), len(records))
+    digests = crc16(
+        _hash_input(
+            (np.full(len(records), ig_port), 2),
+            (np.full(len(records), eg_port), 2),
+            (hop_latency & hop_latency_mask, 4),
+            (hashes, 4),
+            (switch_tstamps(records, tstamp_offset, speedup) & timestamp_mask, 6),
+        )
+    )
+    is_ipv4 = records["has_five_tuple"]
+    reports = np.zeros(len(records), dtype=bool)
+    reports[is_ipv4] = bloom_filter_reports(
+        hashes[is_ipv4], digests[is_ipv4], filter_width
+    )
+    return reports
+
+
+def drop_report_filter(
+    records: np.ndarray,
+    timestamp_mask: int = DEFAULT_TIMESTAMP_MASK,
+    tstamp_offset: int = 0,
+    speedup: float = 1.0,
+    filter_width: int = REPORT_FILTER_WIDTH,
+) -> np.ndarray:
+    """
+    Predicts which dropped packets generate a drop report. Parameters are the
+    same as flow_report_filter, records should only contain dropped packets.
+
+    :returns:
+        A boolean mask of the packets that generate a drop report
+    """
+    hashes = flow_hashes(records)
+    digests = crc16(
+        _hash_input(
+            (hashes, 4),
+            (switch_tstamps(records, tstamp_offset, speedup) & timestamp_mask, 6),
+        )
+    )
+    is_ipv4 = records["has_five_tuple"]
+    reports = np.zeros(len(records), dtype=bool)
+    reports[is_ipv4] = bloom_filter_reports(
+        hashes[is_ipv4], digests[is_ipv4], filter_width
+    )
+    return reports
+
+
+# Queue reports are generated when the hop latency of a packet is above the
+# trigger threshold of its queue, as long as the quota of its (egress port,
+# queue) is not exhausted. Every report decrements the quota, which is reset
+# to DEFAULT_QUEUE_REPORT_QUOTA by any packet with a hop latency below the
+# reset threshold. Since the quota only depends on the reports since the last
+# reset, it is evaluated for a whole capture at once by numbering triggering
+# packets between resets.
+
+# Same as in p4src/tna/include/control/int.p4
+DEFAULT_QUEUE_REPORT_QUOTA = 1024
+QUEUE_REPORT_QUOTA_MAX = 0xFFFF
+# The quota register is indexed by port[6:0] ++ qid, ports with the same low 7
+# bits share their quotas.
+QUEUE_REPORT_QUOTA_PORT_MASK = 0x7F
+
+QueueReportPrediction = collections.namedtuple(
+    "QueueReportPrediction",
+    [
+        # Mask of the packets that generate a queue report
+        "reports",
+        # Dictionary (egress port & QUEUE_REPORT_QUOTA_PORT_MASK, queue id) ->
+        # quota left after the packets
+        "quotas",
+    ],
+)
+
+
+def queue_report_filter(
+    hop_latencies, thresholds: dict, egress_ports=0, queue_ids=0, quotas: dict = None,
+) -> QueueReportPrediction:
+    """
+    Predicts which packets generate a queue report.
+
+    :parameters:
+        hop_latencies: hop latency of each packet in ns, wrapped to 32 bits
+        thresholds: dict
+            queue id -> (threshold_trigger, threshold_reset) as passed to
+            FabricTest.set_up_latency_threshold_for_q_report. Queues without
+            thresholds never generate reports nor reset their quota. When the
+            trigger threshold is not above the reset one, triggering wins.
+        egress_ports, queue_ids: egress port and queue of each packet, or
+            scalars when they are the same for all packets
+        quotas: dict
+            (egress port, queue id) -> initial quota, as set by
+            FabricTest.set_queue_report_quota. Ports are masked with
+            QUEUE_REPORT_QUOTA_PORT_MASK like in the register index. Defaults to
+            DEFAULT_QUEUE_REPORT_QUOTA.
+    :returns:
+        A QueueReportPrediction
+    """
+    hop_latencies = np.asarray(hop_latencies, dtype=np.int64) & 0xFFFFFFFF
+    count = len(hop_latencies)
+    egress_ports = np.broadcast_to(np.asarray(egress_ports, dtype=np.int64), count)
+    queue_ids = np.broadcast_to(np.asarray(queue_ids, dtype=np.int64), count)
+    quotas = {
+        (port & QUEUE_REPORT_QUOTA_PORT_MASK, queue_id): quota
+        for (port, queue_id), quota in (quotas or {}).items()
+    }
+
+    trigger = np.zeros(count, dtype=bool)
+    reset = np.zeros(count, dtype=bool)
+    for queue_id, (threshold_trigger, threshold_reset) in thresholds.items():
+        in_queue = queue_ids == queue_id
+        trigger |= in_queue & (hop_latencies >= threshold_trigger)
+        reset |= in_queue & ~trigger & (hop_latencies < threshold_reset)
+
+    # Packets are grouped per quota register, and each group is split in
+    # segments starting at the first packet and at each reset.
+    keys = ((egress_ports & QUEUE_REPORT_QUOTA_PORT_MASK) << 5) | queue_ids
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    trigger = trigger[order]
+    reset = reset[order]
+    first = np.ones(count, dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    segment_starts = np.flatnonzero(first | reset)
+    segment_ids = np.cumsum(first | reset) - 1
+
+    initial_quotas = np.array(
+        [
+            quotas.get((int(key >> 5), int(key & 0x1F)), DEFAULT_QUEUE_REPORT_QUOTA)
+            for key in keys[segment_starts]
+        ],
+        dtype=np.int64,
+    )
+    segment_quotas = np.where(
+        reset[segment_starts],
+        DEFAULT_QUEUE_REPORT_QUOTA,
+        np.clip(initial_quotas, 0, QUEUE_REPORT_QUOTA_MAX),
+    )
+    # Rank (from 1) of each triggering packet in its segment
+    triggers = np.cumsum(trigger)
+    triggers_before = (triggers - trigger)[segment_starts]
+    ranks = triggers - triggers_before[segment_ids]
+    sorted_reports = trigger & (ranks <= segment_quotas[segment_ids])
+    reports = np.empty(count, dtype=bool)
+    reports[order] = sorted_reports
+
+    # Quota left in the last segment of each register
+    left = {}
+    last = np.flatnonzero(np.append(first[1:], True))
+    for i in last:
+        segment = segment_ids[i]
+        used = triggers[i] - triggers_before[segment]
+        key = int(keys[i])
+        left[(key >> 5, key & 0x1F)] = max(int(segment_quotas[segment] - used), 0)
+    for key, quota in quotas.items():
+        left.setdefault(key, min(max(quota, 0), QUEUE_REPORT_QUOTA_MAX))
+    return QueueReportPrediction(reports=reports, quotas=left)
+
+
+def predicted_reports(
+    records: np.ndarray,
+    report_mask: np.ndarray,
+    kind: int = REPORT_KIND_LOCAL,
+    drop_reason: int = 0,
+    tstamp_offset: int = 0,
+    speedup: float = 1.0,
+) -> np.ndarray:
+    """
+    Builds the reports the switch would send for the packets in report_mask,
+    in the format of decode_report_records, so that they can be analyzed like
+    a capture of reports. Reports are never lost.
+    """
+    reports = np.zeros(np.count_nonzero(report_mask), dtype=REPORT_DTYPE)
+    packets = records[report_mask]
+    for field in ["capture_ns", "ip_src", "ip_dst", "ip_proto", "l4_sport", "l4_dport"]:
+        reports[field] = packets[field]
+    # Reports are only analyzed for TCP and UDP packets.
+    reports["has_five_tuple"] = (packets["ip_proto"] == IP_PROTO_TCP) | (
+        packets["ip_proto"] == IP_PROTO_UDP
+    )
+    reports["kind"] = kind
+    reports["f"] = kind == REPORT_KIND_LOCAL
+    reports["d"] = kind == REPORT_KIND_DROP
+    reports["seq_no"] = np.arange(len(reports))
+    tstamps = switch_tstamps(records, tstamp_offset, speedup)[report_mask]
+    reports["ingress_tstamp"] = tstamps & 0xFFFFFFFF
+    reports["egress_tstamp"] = tstamps & 0xFFFFFFFF
+    reports["drop_reason"] = np.where(kind == REPORT_KIND_DROP, drop_reason, 0)
+    return reports
+
+
+def predict_report_pcap(
+    pcap_file: str,
+    total_flows: int = 0,
+    drop: bool = False,
+    drop_reason: int = 0,
+    **filter_args
+) -> dict:
+    """
+    Replays a traffic capture through the flow report filter, or the drop
+    report filter if all packets are dropped, and analyzes the predicted
+    reports like analyze_report_pcap would analyze a capture of them.
+
+    :parameters:
+        pcap_file: str
+            the traffic capture, for instance the trace replayed by TRex
+        total_flows: int
+            number of flows in the trace, 0 to skip the accuracy scores
+        drop: bool
+            predict drop reports instead of flow reports
+        drop_reason: int
+            drop reason of the dropped packets
+        filter_args:
+            arguments of flow_report_filter or drop_report_filter
+    :returns:
+        The results dictionary, with the predicted scores
+    """
+    records = decode_packet_pcap(pcap_file)
+    if drop:
+        report_mask = drop_report_filter(records, **filter_args)
+        kind = REPORT_KIND_DROP
+    else:
+        report_mask = flow_report_filter(records, **filter_args)
+        kind = REPORT_KIND_LOCAL
+    reports = predicted_reports(
+        records,
+        report_mask,
+        kind,
+        drop_reason,
+        filter_args.get("tstamp_offset", 0),
+        filter_args.get("speedup", 1.0),
+    )
+    collector = ReportCollector(drop_reason=drop_reason)
+    collector.add_reports(reports)
+    return collector.summarize(
+        os.path.splitext(pcap_file)[0] + "-predicted", total_flows
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Predict the INT reports generated for a traffic capture"
+    )
+    parser.add_argument("pcap_file", help="Traffic capture", type=str)
+    parser.add_argument(
+        "--total-flows", help="Number of flows in the capture", type=int, default=0
+    )
+    parser.add_argument(
+        "--drop", help="Predict drop reports", action="store_true", default=False
+    )
+    parser.add_argument(
+        "--hop-latency", help="Hop latency of every packet (ns)", type=int, default=0
+    )
+    parser.add_argument(
+        "--hop-latency-mask",
+        help="Hop latency mask",
+        type=lambda x: int(x, 0),
+        default=DEFAULT_HOP_LATENCY_MASK,
+    )
+    parser.add_argument(
+        "--timestamp-mask",
+        help="Timestamp mask",
+        type=lambda x: int(x, 0),
+        default=DEFAULT_TIMESTAMP_MASK,
+    )
+    parser.add_argument(
+        "--filter-width",
+        help="log2 of the number of entries of each filter register",
+        type=int,
+        default=REPORT_FILTER_WIDTH,
+    )
+    parser.add_argument(
+        "--speedup", help="Replay speedup of the capture", type=float, default=1.0
+    )
+    args = parser.parse_args()
+
+    filter_args = {
+        "timestamp_mask": args.timestamp_mask,
+        "speedup": args.speedup,
+        "filter_width": args.filter_width,
+    }
+    if not args.drop:
+        filter_args["hop_latency"] = args.hop_latency
+        filter_args["hop_latency_mask"] = args.hop_latency_mask
+    predict_report_pcap(args.pcap_file, args.total_flows, args.drop, **filter_args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+# Copyright 2021-present Open Networking Foundation
+# SPDX-License-Identifier: Apache-2.0
+
+# Timeline of the INT reports of several switches, possibly received by
+# several collectors, and reconstruction of the path of each flow.
+#
+# INT report timestamps are the lower 32 bits of the switch time in
+# nanoseconds and wrap around every 4.3 seconds. Each report is also
+# timestamped by the collector capture with a 64-bit time, a little later
+# than the switch timestamps. For every switch pipe (switch_id and hw_id),
+# the difference between both times modulo 2^32 is the clock offset plus
+# the transit delay to the collector, which only varies by a few
+# microseconds. Taking the smallest difference as reference, the switch
+# timestamps are unwrapped to the 64-bit time closest to the capture time
+# minus the transit delay: this works whatever the gap between reports of
+# the same switch, and gives the time of every hop in the capture clock.
+
+import argparse
+import collections
+import sys
+
+import numpy as np
+from xnt import (
+    DECODE_CHUNK_SIZE,
+    FIVE_TUPLE_FIELDS,
+    REPORT_DTYPE,
+    REPORT_KIND_DROP,
+    REPORT_KIND_LOCAL,
+    TSTAMP_MODULO,
+    decode_report_records,
+    hop_latencies,
+    iter_pcap_chunks,
+    pack_five_tuples,
+)
+
+# Decoded INT reports with their ingress and egress time unwrapped to 64 bits
+# in the capture clock (see SwitchClocks), and the index of the capture they
+# come from. The egress time of drop reports is their ingress time.
+TIMELINE_DTYPE = np.dtype(
+    REPORT_DTYPE.descr
+    + [("ingress_ns", "<i8"), ("egress_ns", "<i8"), ("source", "<u2")]
+)
+# Maximum difference of transit delay from a switch to a collector between
+# two reports. Reports are merged in time order once every capture is past
+# their time by this much.
+TIMELINE_MAX_DELAY_NS = 100 * 10 ** 6
+# Maximum time between the egress of a packet from a switch and its ingress
+# in the next switch of its path.
+TIMELINE_HOP_WINDOW_NS = 10 ** 6
+
+FlowPath = collections.namedtuple(
+    "FlowPath",
+    [
+        # (switch_id, ingress_port_id, egress_port_id) of every hop
+        "hops",
+        # Number of packets reported along this path
+        "count",
+        # Ingress time (ns) in the first switch of the first and last packet
+        "first_ns",
+        "last_ns",
+    ],
+)
+
+
+def _centered(values: np.ndarray) -> np.ndarray:
+    # Maps differences modulo 2^32 to [-2^31, 2^31).
+    half = TSTAMP_MODULO // 2
+    return (values + half) % TSTAMP_MODULO - half
+
+
+class SwitchClocks:
+    """
+    Unwraps the 32-bit timestamps of INT reports in the capture clock, see
+    the module description. Batches are unwrapped as they are read, with
+    the smallest offset seen so far for each switch pipe as reference: the
+    times of the first reports of a pipe can be a few microseconds later
+    than those of the next ones, until the reference settles.
+    """
+
+    def __init__(self):
+        # (switch_id << 8 | hw_id) -> reference offset modulo 2^32
+        self.references = {}
+
+    def unwrap(self, reports: np.ndarray):
+        """
+        :parameters:
+            reports: numpy array of REPORT_DTYPE, local and drop reports only
+        :returns:
+            A tuple (ingress_ns, egress_ns) of int64 arrays
+        """
+        keys = reports["switch_id"].astype(np.int64) << 8 | reports["hw_id"]
+        capture_ns = reports["capture_ns"]
+        offsets = (capture_ns - reports["ingress_tstamp"]) % TSTAMP_MODULO
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        references = np.empty(len(unique_keys), dtype=np.int64)
+        for i, key in enumerate(unique_keys.tolist()):
+            switch_offsets = offsets[inverse == i]
+            reference = self.references.get(key, int(switch_offsets[0]))
+            shift = int(_centered(switch_offsets - reference).min())
+            if shift < 0:
+                reference = (reference + shift) % TSTAMP_MODULO
+            self.references[key] = reference
+            references[i] = reference
+        ingress_ns = capture_ns - _centered(offsets - references[inverse])
+        is_local = reports["kind"] == REPORT_KIND_LOCAL
+        egress_ns = ingress_ns + np.where(is_local, hop_latencies(reports), 0)
+        return ingress_ns, egress_ns
+
+
+def _timeline_records(reports: np.ndarray, clocks: SwitchClocks, source: int):
+    records = np.empty(len(reports), dtype=TIMELINE_DTYPE)
+    for name in REPORT_DTYPE.names:
+        records[name] = reports[name]
+    records["ingress_ns"], records["egress_ns"] = clocks.unwrap(reports)
+    records["source"] = source
+    return records
+
+
+def report_timeline(
+    pcap_file: str,
+    clocks: SwitchClocks,
+    source: int = 0,
+    chunk_size: int = DECODE_CHUNK_SIZE,
+):
+    """
+    Yields the local and drop reports of a capture as arrays of
+    TIMELINE_DTYPE, in capture order, one per chunk of records (see
+    iter_pcap_chunks).
+    """
+    for chunk in iter_pcap_chunks(pcap_file, chunk_size):
+        reports = decode_report_records(*chunk)
+        kinds = reports["kind"]
+        reports = reports[(kinds == REPORT_KIND_LOCAL) | (kinds == REPORT_KIND_DROP)]
+        if len(reports):
+            yield _timeline_records(reports, clocks, source)
+
+
+class ReportTimeline:
+    """
+    Merges the INT reports of several collector captures in order of ingress
+    time. Captures are read chunk by chunk: reports are kept until every
+    capture is more than max_delay_ns past them, then they are yielded in
+    time order, so memory usage does not grow with the captures. Reports
+    that arrive later than that are still yielded, in the next batch, and
+    counted in late_reports.
+
+    :parameters:
+        pcap_files: list of str
+            INT report captures, see open_pcap_reader for the formats
+        max_delay_ns: int
+            maximum difference of transit delay to the collectors
+        chunk_size: int
+            number of records decoded at once
+    """
+
+    def __init__(
+        self,
+        pcap_files,
+        max_delay_ns: int = TIMELINE_MAX_DELAY_NS,
+        chunk_size: int = DECODE_CHUNK_SIZE,
+    ):
+        self.pcap_files = pcap_files
+        self.max_delay_ns = max_delay_ns
+        self.chunk_size = chunk_size
+        self.clocks = SwitchClocks()
+        self.reports = 0
+        self.late_reports = 0
+
+    def __iter__(self):
+        """
+        Yields arrays of TIMELINE_DTYPE sorted by ingress_ns.
+        """
+        sources = {
+            i: report_timeline(pcap_file, self.clocks, i, self.chunk_size)
+            for i, pcap_file in enumerate(self.pcap_files)
+        }
+        # Capture time of the last report read from each capture
+        last_capture_ns = {}
+        pending = np.empty(0, dtype=TIMELINE_DTYPE)
+        emitted_ns = None
+        try:
+            while True:
+                # Read from the capture that is the most behind, or from all
+                # of them at first.
+                unread = [i for i in sources if i not in last_capture_ns]
+                if unread:
+                    source = unread[0]
+                elif sources:
+                    source = min(sources, key=last_capture_ns.get)
+                else:
+                    break
+                records = next(sources[source], None)
+                if records is None:
+                    del sources[source]
+                    last_capture_ns.pop(source, None)
+                else:
+                    last_capture_ns[source] = records["capture_ns"].max()
+                    pending = np.concatenate([pending, records])
+                if any(i not in last_capture_ns for i in sources):
+                    continue
+                if sources:
+                    horizon = min(last_capture_ns.values()) - self.max_delay_ns
+                    ready = pending["ingress_ns"] < horizon
+                else:
+                    ready = np.ones(len(pending), dtype=bool)
+                if not ready.any():
+                    continue
+                batch = pending[ready]
+                pending = pending[~ready]
+                batch = batch[np.argsort(batch["ingress_ns"], kind="stable")]
+                if emitted_ns is not None:
+                    self.late_reports += int(
+                        np.count_nonzero(batch["ingress_ns"] < emitted_ns)
+                    )
+                emitted_ns = batch["ingress_ns"][-1]
+                self.reports += len(batch)
+                yield batch
+        finally:
+            for timeline in sources.values():
+                timeline.close()
+
+
+class FlowPaths:
+    """
+    Reconstructs the path of the packets of every flow from the local
+    reports of a timeline. Reports of a flow are grouped in packets: a
+    report continues the path of the previous report of the same flow if it
+    comes from another switch and less than hop_window_ns after the egress
+    from the previous one. Paths still open at the end of a batch are kept
+    until the next one, or until flush().
+
+    :parameters:
+        hop_window_ns: int
+            maximum time between the egress of a packet from a switch and its
+            ingress in the next switch
+    """
+
+    def __init__(self, hop_window_ns: int = TIMELINE_HOP_WINDOW_NS):
+        self.hop_window_ns = hop_window_ns
+        # 5-tuple -> {hops: [count, first_ns, last_ns]}
+        self._paths = collections.defaultdict(dict)
+        self._pending = np.empty(0, dtype=TIMELINE_DTYPE)
+
+    def add(self, records: np.ndarray) -> None:
+        """
+        Adds a batch of a timeline, see ReportTimeline.
+        """
+        local = records[
+            (records["kind"] == REPORT_KIND_LOCAL) & records["has_five_tuple"]
+        ]
+        if len(local) == 0:
+            return
+        records = np.concatenate([self._pending, local])
+        horizon = local["ingress_ns"].max() - self.hop_window_ns
+        self._pending = self._add_paths(records, horizon)
+
+    def flush(self) -> None:
+        """
+        Closes the paths kept from the previous batches.
+        """
+        self._pending = self._add_paths(self._pending, None)
+
+    def _add_paths(self, records: np.ndarray, horizon) -> np.ndarray:
+        if len(records) == 0:
+            return records
+        hi, lo = pack_five_tuples(records)
+        order = np.lexsort((records["ingress_ns"], lo, hi))
+        records, hi, lo = records[order], hi[order], lo[order]
+        switch_ids = records["switch_id"]
+        new_packet = (
+            (hi[1:] != hi[:-1])
+            | (lo[1:] != lo[:-1])
+            | (switch_ids[1:] == switch_ids[:-1])
+            | (
+                records["ingress_ns"][1:] - records["egress_ns"][:-1]
+                > self.hop_window_ns
+            )
+        )
+        starts = np.flatnonzero(np.concatenate([[True], new_packet]))
+        ends = np.append(starts[1:], len(records))
+        if horizon is None:
+            closed = np.ones(len(starts), dtype=bool)
+        else:
+            closed = records["egress_ns"][ends - 1] < horizon
+
+        columns = [
+            records[field].tolist()
+            for field in ["switch_id", "ingress_port_id", "egress_port_id"]
+        ]
+        ingress_ns = records["ingress_ns"].tolist()
+        five_tuples = list(
+            zip(*[records[field].tolist() for field in FIVE_TUPLE_FIELDS])
+        )
+        for start, end in zip(starts[closed].tolist(), ends[closed].tolist()):
+            hops = tuple(zip(*[column[start:end] for column in columns]))
+            paths = self._paths[five_tuples[start]]
+            path = paths.get(hops)
+            if path is None:
+                paths[hops] = [1, ingress_ns[start], ingress_ns[start]]
+            else:
+                path[0] += 1
+                path[2] = ingress_ns[start]
+        open_records = np.repeat(~closed, ends - starts)
+        return records[open_records]
+
+    def paths(self) -> dict:
+        """
+        :returns:
+            A dict with the list of FlowPaths of every flow, most used first,
+            keyed by 5-tuple (ip_src, ip_dst, ip_proto, l4_sport, l4_dport)
+        """
+        return {
+            five_tuple: sorted(
+                (FlowPath(hops, *path) for hops, path in paths.items()),
+                key=lambda path: -path.count,
+            )
+            for five_tuple, paths in self._paths.items()
+        }
+
+
+def analyze_report_timeline(
+    pcap_files,
+    max_delay_ns: int = TIMELINE_MAX_DELAY_NS,
+    hop_window_ns: int = TIMELINE_HOP_WINDOW_NS,
+):
+    """
+    Reconstructs the flow paths of the INT reports of several captures.
+
+    :returns:
+        A tuple (timeline, paths) with the ReportTimeline, for its counters,
+        and the paths of every flow (see FlowPaths.paths)
+    """
+    timeline = ReportTimeline(pcap_files, max_delay_ns)
+    flow_paths = FlowPaths(hop_window_ns)
+    for records in timeline:
+        flow_paths.add(records)
+    flow_paths.flush()
+    return timeline, flow_paths.paths()
+
+
+def _ip_str(ip: int) -> str:
+    return "{}.{}.{}.{}".format(
+        ip >> 24, (ip >> 16) & 0xFF, (ip >> 8) & 0xFF, ip & 0xFF
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reconstruct the flow paths of INT reports of several switches"
+    )
+    parser.add_argument("pcap_files", help="INT report captures", type=str, nargs="+")
+    parser.add_argument(
+        "--max-delay",
+        help="Maximum difference of transit delay to the collectors (ns)",
+        type=int,
+        default=TIMELINE_MAX_DELAY_NS,
+    )
+    parser.add_argument(
+        "--hop-window",
+        help="Maximum time between two hops of a packet (ns)",
+        type=int,
+        default=TIMELINE_HOP_WINDOW_NS,
+    )
+    args = parser.parse_args()
+
+    timeline, paths = analyze_report_timeline(
+        args.pcap_files, args.max_delay, args.hop_window
+    )
+    for (ip_src, ip_dst, ip_proto, sport, dport), flow_paths in sorted(paths.items()):
+        print(
+            "{}:{} -> {}:{} proto {}".format(
+                _ip_str(ip_src), sport, _ip_str(ip_dst), dport, ip_proto
+            )
+        )
+        for path in flow_paths:
+            hops = " ".join(
+                "{}[{}->{}]".format(switch_id, ingress_port, egress_port)
+                for switch_id, ingress_port, egress_port in path.hops
+            )
+            print("  {} packets: {}".format(path.count, hops))
+    print("Reports: {}".format(timeline.reports), file=sys.stderr)
+    print("Late reports: {}".format(timeline.late_reports), file=sys.stderr)
+    print("Switch pipes: {}".format(len(timeline.clocks.references)), file=sys.stderr)
+    print("Flows: {}".format(len(paths)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# Copyright 2020-present Open Networking Foundation
+# SPDX-License-Identifier: Apache-2.0
+
+# Flow count scaling benchmark of the INT flow and drop report filters.
+# Not executed by default, it takes several minutes per flow count:
+#   BENCHMARKS=1 ./ptf/run/hw/linerate fabric-int TEST=int_flow_scaling
+# The flow counts and rate can be changed with the "flow_counts" (comma
+# separated) and "rate_pps" test parameters.
+
+import csv
+import ipaddress
+from datetime import datetime
+
+from base_test import *
+from fabric_test import *
+from ptf.testutils import group
+from trex_stl_lib.api import STLVM, STLPktBuilder, STLStream, STLTXCont
+from trex_test import TRexTest
+from trex_utils import list_port_status
+from xnt import analyze_int_report_pcap
+
+FLOW_COUNTS = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+RATE_PPS = 4_000_000
+# Every flow is sent at least this many times at each flow count.
+MIN_PASSES = 3
+MIN_DURATION_SECONDS = 10
+CAPTURE_LIMIT = 40_000_000
+# Flows get consecutive source addresses from this one.
+FLOW_IP_SRC = "10.0.0.0"
+
+# Records of the CAIDA trace tests, checked up to the flow count of the trace
+ACCURACY_RECORD = 99.6
+TRACE_FLOWS = 921458
+
+SENDER_PORT = 0
+RECEIVER_PORT = 1
+INT_COLLECTOR_PORT = 2
+
+
+@group("int")
+@group("trex-hw-mode")
+@group("benchmark")
+class IntFlowScaling(TRexTest, IntTest):
+    """
+    Measures how the accuracy and efficiency of the INT flow and drop report
+    filters degrade with the number of concurrent flows. For each flow count,
+    TRex sends flows with distinct 5-tuples (source address, source and
+    destination ports) generated by the field engine, at a fixed rate, and the
+    INT reports are analyzed like in the traffic trace tests. Flows are first
+    forwarded, to measure flow reports, then dropped by an ACL, to measure
+    drop reports.
+    """
+
+    def create_stream(self, pkt, flows: int, rate_pps: int) -> STLStream:
+        """
+        Stream cycling through flows distinct 5-tuples: the flow index is
+        added to the source address, its low 16 bits are written to the source
+        port and its second byte to the destination port.
+        """
+        vm = STLVM()
+        vm.var(name="flow", min_value=0, max_value=flows - 1, size=4, op="inc", step=1)
+        vm.write(
+            fv_name="flow",
+            pkt_offset="IP.src",
+            add_val=int(ipaddress.IPv4Address(FLOW_IP_SRC)),
+        )
+        vm.write_mask(
+            fv_name="flow",
+            pkt_offset="UDP.sport",
+            pkt_cast_size=2,
+            mask=0xFFFF,
+            shift=0,
+        )
+        vm.write_mask(
+            fv_name="flow",
+            pkt_offset="UDP.dport",
+            pkt_cast_size=2,
+            mask=0xFF00,
+            shift=0,
+        )
+        vm.fix_chksum()
+        return STLStream(
+            packet=STLPktBuilder(pkt=pkt, vm=vm), mode=STLTXCont(pps=rate_pps)
+        )
+
+    def run_flows(self, pkt, flows: int, rate_pps: int, drop_reason: int = 0):
+        """
+        Sends flows and analyzes the INT reports.
+
+        :return: a tuple (results, duration, port stats)
+        """
+        duration = max(MIN_DURATION_SECONDS, math.ceil(MIN_PASSES * flows / rate_pps))
+        self.trex_client.remove_all_streams(ports=[SENDER_PORT])
+        self.trex_client.clear_stats()
+        self.trex_client.add_streams(
+            self.create_stream(pkt, flows, rate_pps), ports=[SENDER_PORT]
+        )
+        capture = self.trex_client.start_capture(
+            rx_ports=[INT_COLLECTOR_PORT], limit=CAPTURE_LIMIT
+        )
+        print(f"Sending {flows} flows for {duration} seconds...")
+        self.trex_client.start(ports=[SENDER_PORT], duration=duration)
+        self.trex_client.wait_on_traffic(ports=[SENDER_PORT])
+
+        output = "/tmp/int-flow-scaling-{}-{}-{}.pcap".format(
+            flows,
+            "drop" if drop_reason else "flow",
+            datetime.now().strftime("%Y%m%d-%H%M%S"),
+        )
+        self.trex_client.stop_capture(capture["id"], output)
+        results = analyze_int_report_pcap(output, flows, drop_reason, engine="parallel")
+        port_stats = self.trex_client.get_stats()
+        list_port_status(port_stats)
+        return results, duration, port_stats
+
+    @autocleanup
+    def runTest(self):
+        self.push_chassis_config()
+        flow_counts = [
+            int(flows)
+            for flows in str(
+                ptf.testutils.test_param_get("flow_counts", "")
+                or ",".join(map(str, FLOW_COUNTS))
+            ).split(",")
+        ]
+        rate_pps = int(ptf.testutils.test_param_get("rate_pps", RATE_PPS))
+
+        pkt = testutils.simple_udp_packet(eth_dst=SWITCH_MAC)
+        with self.batch_writes():
+            self.set_up_int_flows(
+                is_device_spine=False, pkt=pkt, send_report_to_spine=False
+            )
+            self.set_up_watchlist_flow()
+            self.set_up_ipv4_unicast_rules(
+                next_hop_mac=HOST2_MAC,
+                ig_port=self.port1,
+                eg_port=self.port2,
+                dst_ipv4="0.0.0.0",
+                prefix_len=0,
+            )
+        self.trex_client.set_service_mode(ports=[INT_COLLECTOR_PORT], enabled=True)
+
+        rows = []
+        for report, drop_reason in [("flow", 0), ("drop", INT_DROP_REASON_ACL_DENY)]:
+            if drop_reason:
+                self.add_forwarding_acl_drop_ingress_port(ingress_port=self.port1)
+            for flows in flow_counts:
+                results, duration, port_stats = self.run_flows(
+                    pkt, flows, rate_pps, drop_reason
+                )
+                labels = {"report": report, "flows": flows}
+                self.telemetry.add_int_analysis(results, labels)
+                self.record_port_stats(port_stats)
+                # Captures missing reports received by the collector port
+                # underestimate the accuracy.
+                int_packets = port_stats[INT_COLLECTOR_PORT]["ipackets"]
+                rows.append(
+                    {
+                        "report": report,
+                        "flows": flows,
+                        "rate_pps": rate_pps,
+                        "duration": duration,
+                        "sent_packets": port_stats[SENDER_PORT]["opackets"],
+                        "int_packets": int_packets,
+                        "captured_reports": results.pkt_processed,
+                        "capture_complete": results.pkt_processed >= int_packets,
+                        "accuracy_score": getattr(results, f"{report}_accuracy_score"),
+                        "efficiency_score": getattr(
+                            results, f"{report}_efficiency_score"
+                        ),
+                    }
+                )
+
+        path = f"{self.telemetry_dir()}/{self.__class__.__name__}.scaling.csv"
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Flow scaling results written to {path}")
+        for row in rows:
+            print(
+                "{report:>4} reports, {flows:>9} flows: accuracy {accuracy_score}%,"
+                " efficiency {efficiency_score}%,"
+                " {captured_reports}/{int_packets} reports captured".format(**row)
+            )
+
+        for row in rows:
+            if row["flows"] > TRACE_FLOWS or not row["capture_complete"]:
+                continue
+            self.failIf(
+                row["accuracy_score"] < ACCURACY_RECORD,
+                f"{row['report']} report accuracy with {row['flows']} flows should be"
+                f" at least {ACCURACY_RECORD}%, was {row['accuracy_score']}%",
+            )
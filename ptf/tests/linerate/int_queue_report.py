@@ -2,14 +2,13 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
-from collections import deque
 
 from base_test import *
 from fabric_test import *
 from ptf.testutils import group
-from scapy.utils import PcapReader
 from trex_stl_lib.api import STLVM, STLPktBuilder, STLStream, STLTXCont
 from trex_test import TRexTest
+from xnt import MmapPcapReader, analyze_queue_report_pcap, join_report_pcap
 
 TRAFFIC_MULT = "1"
 RATE = 1000  # pps
@@ -130,6 +129,7 @@ class IntQueueReportTest(TRexTest, IntTest, SlicingTest):
 
         # Check if we receive every packets we sent.
         port_stats = self.trex_client.get_stats()
+        self.record_port_stats(port_stats)
         sent_packets = port_stats[SENDER_PORT]["opackets"]
         recv_packets = port_stats[RECEIVER_PORT]["ipackets"]
         self.failIf(sent_packets != recv_packets, "Didn't receive all packets")
@@ -141,112 +141,94 @@ class IntQueueReportTest(TRexTest, IntTest, SlicingTest):
         # - Latency in every queue report will higher than the threshold we set
         # - The total number of report will be less or equal to the report quota
         # - Egress port and queue must be the one we set
-        pcap_reader = PcapReader(pcap_path)
-        report_pkt = None
-        number_of_reports = 0
-        hw_id_to_seq = {}
-        reported_ip_srcs = deque()
-        while True:
-            try:
-                report_pkt = pcap_reader.recv()
-            except (EOFError, KeyboardInterrupt):
-                break
-            except Exception:
-                raise
+        with MmapPcapReader(pcap_path) as pcap_reader:
+            number_of_reports = 0
+            hw_id_to_seq = {}
+            for report_pkt in pcap_reader.packets():
+                if INT_L45_REPORT_FIXED not in report_pkt:
+                    self.fail("Packet is not an INT report")
+                if INT_L45_LOCAL_REPORT not in report_pkt:
+                    self.fail("Packet is not an INT local report")
+
+                int_fixed_header = report_pkt[INT_L45_REPORT_FIXED]
+                int_local_report_header = report_pkt[INT_L45_LOCAL_REPORT]
+                inner_ip_header = int_local_report_header[IP]
 
-            if INT_L45_REPORT_FIXED not in report_pkt:
-                self.fail("Packet is not an INT report")
-            if INT_L45_LOCAL_REPORT not in report_pkt:
-                self.fail("Packet is not an INT local report")
-
-            int_fixed_header = report_pkt[INT_L45_REPORT_FIXED]
-            int_local_report_header = report_pkt[INT_L45_LOCAL_REPORT]
-            inner_ip_header = int_local_report_header[IP]
-
-            self.failIf(int_fixed_header.d != 0, "Received an unexpected drop report")
-            self.failIf(int_fixed_header.f != 0, "Received an unexpected flow report")
-            self.failIf(int_fixed_header.q != 1, "Not a queue report")
-            self.failIf(
-                INT_L45_LOCAL_REPORT in inner_ip_header,
-                "Unexpected report-in-report packet.",
-            )
-
-            number_of_reports += 1
-            hw_id = int_fixed_header.hw_id
-            seq_no = int_fixed_header.seq_no
-            ingress_time = int_fixed_header.ingress_tstamp
-            egress_time = int_local_report_header.egress_tstamp
-            latency = egress_time - ingress_time
-            egress_port = int_local_report_header.egress_port_id
-            egress_queue = int_local_report_header.queue_id
-
-            self.failIf(
-                egress_port != self.sdn_to_sdk_port[self.port4],
-                f"Unexpected egress port {egress_port}",
-            )
-            self.failIf(
-                egress_queue != DEFAULT_QID, f"Unexpected queue id {egress_queue}"
-            )
-
-            if hw_id not in hw_id_to_seq:
-                hw_id_to_seq[hw_id] = seq_no
-            else:
                 self.failIf(
-                    hw_id_to_seq[hw_id] != (seq_no - 1),
-                    f"Sequence number is wrong, should be {hw_id_to_seq[hw_id]+1}, but got {seq_no}.",
+                    int_fixed_header.d != 0, "Received an unexpected drop report"
+                )
+                self.failIf(
+                    int_fixed_header.f != 0, "Received an unexpected flow report"
+                )
+                self.failIf(int_fixed_header.q != 1, "Not a queue report")
+                self.failIf(
+                    INT_L45_LOCAL_REPORT in inner_ip_header,
+                    "Unexpected report-in-report packet.",
                 )
-                hw_id_to_seq[hw_id] = seq_no
-
-            # 32-bit timestamp overflow case
-            if latency < 0:
-                latency += 0xFFFFFFFF
 
-            self.failIf(
-                latency < THRESHOLD_TRIGGER,
-                f"Latency should be higher than trigger {THRESHOLD_TRIGGER}, got {latency}",
-            )
-            reported_ip_srcs.append(inner_ip_header.src)
+                number_of_reports += 1
+                hw_id = int_fixed_header.hw_id
+                seq_no = int_fixed_header.seq_no
+                egress_port = int_local_report_header.egress_port_id
+                egress_queue = int_local_report_header.queue_id
 
-        pcap_reader.close()
+                self.failIf(
+                    egress_port != self.sdn_to_sdk_port[self.port4],
+                    f"Unexpected egress port {egress_port}",
+                )
+                self.failIf(
+                    egress_queue != DEFAULT_QID, f"Unexpected queue id {egress_queue}"
+                )
 
+                if hw_id not in hw_id_to_seq:
+                    hw_id_to_seq[hw_id] = seq_no
+                else:
+                    self.failIf(
+                        hw_id_to_seq[hw_id] != (seq_no - 1),
+                        f"Sequence number is wrong, should be {hw_id_to_seq[hw_id]+1}, but got {seq_no}.",
+                    )
+                    hw_id_to_seq[hw_id] = seq_no
+
+        # Every packet is queued above the trigger threshold, so the switch
+        # reports exactly the quota.
         self.failIf(
             number_of_reports != DEFAULT_QUOTA,
-            f"The number of reports is more than the quota, expected {DEFAULT_QUOTA}, got {number_of_reports}",
+            f"Unexpected number of reports, expected {DEFAULT_QUOTA}, got {number_of_reports}",
         )
         self.failIf(number_of_reports == 0, "No INT reports received")
 
+        queues = analyze_queue_report_pcap(pcap_path)
+        queue_key = (self.sdn_to_sdk_port[self.port4], DEFAULT_QID)
+        if queue_key not in queues:
+            self.fail(f"No report for egress port {queue_key[0]} queue {DEFAULT_QID}")
+        queue = queues[queue_key]
+        min_latency = queue.hop_latency.min()
+        self.failIf(
+            min_latency < THRESHOLD_TRIGGER,
+            f"Latency should be higher than trigger {THRESHOLD_TRIGGER}, got {min_latency}",
+        )
+
         # In this section we will verify if the switch is reporting all congested packets.
-        # We will try to find a subset of packets from the RX capture.
-        # The reason we need to compare from the RX capture is because we can't guarantee
-        # that the packet from TRex is in order, so we cannot just check if IP addresses
-        # are sequential.
-        pcap_reader = PcapReader(rx_pcap_path)
-        checking_ip_src = False
-        while True:
-            try:
-                pkt = pcap_reader.recv()
-            except (EOFError, KeyboardInterrupt):
-                break
-            except Exception:
-                raise
-            if IP not in pkt:
-                continue
-            ip_src = pkt[IP].src
-            if checking_ip_src:
-                if ip_src != reported_ip_srcs[0]:
-                    self.fail(f"Expected IP src {ip_src}, got {reported_ip_srcs[0]}")
-                else:
-                    reported_ip_srcs.popleft()
-            else:
-                if ip_src == reported_ip_srcs[0]:
-                    checking_ip_src = True
-                    reported_ip_srcs.popleft()
-            if len(reported_ip_srcs) == 0:
-                break
-        pcap_reader.close()
+        # Every report is joined with the packet of the RX capture it was generated
+        # for. The reason we need to compare with the RX capture is because we can't
+        # guarantee that the packet from TRex is in order, so we cannot just check if
+        # IP addresses are sequential. The reported packets must be a contiguous,
+        # in-order run of the received ones.
+        _, _, join = join_report_pcap(pcap_path, rx_pcap_path, key="ip_src")
+        self.telemetry.add_int_analysis(
+            {field: len(value) for field, value in join._asdict().items()},
+            {"capture": os.path.basename(pcap_path)},
+        )
+        self.failIf(
+            len(join.misses) != 0, f"Received {len(join.misses)} unexpected report(s)",
+        )
+        self.failIf(
+            len(join.out_of_order) != 0,
+            f"{len(join.out_of_order)} report(s) out of order with the RX capture",
+        )
         self.failIf(
-            len(reported_ip_srcs) != 0,
-            f"Received {len(reported_ip_srcs)} unexpected report(s)",
+            len(join.gaps) != 0,
+            f"{len(join.gaps)} congested packet(s) were not reported",
         )
 
     def runTest(self):
@@ -9,7 +9,7 @@ from ptf.testutils import group
 from trex_stl_lib.api import STLPktBuilder, STLStream, STLTXCont
 from trex_test import TRexTest
 from trex_utils import *
-from xnt import pypy_analyze_int_report_pcap
+from xnt import analyze_int_report_pcap
 
 TRAFFIC_MULT = "1"
 RATE = 40_000_000_000  # 40 Gbps
@@ -80,8 +80,10 @@ class IntSingleFlow(TRexTest, IntTest):
         )
         self.trex_client.stop_capture(capture["id"], output)
 
-        results = pypy_analyze_int_report_pcap(output)
+        results = analyze_int_report_pcap(output)
         port_stats = self.trex_client.get_stats()
+        self.record_port_stats(port_stats)
+        self.telemetry.add_int_analysis(results, {"capture": os.path.basename(output)})
 
         sent_packets = port_stats[SENDER_PORT]["opackets"]
         recv_packets = port_stats[RECEIVER_PORT]["ipackets"]
@@ -99,7 +101,7 @@ class IntSingleFlow(TRexTest, IntTest):
             f"Didn't receive all packets; sent {sent_packets}, received {recv_packets}",
         )
 
-        local_reports = results["local_reports"]
+        local_reports = results.local_reports
         self.assertTrue(
             local_reports in [EXPECTED_FLOW_REPORTS, EXPECTED_FLOW_REPORTS + 1],
             f"Flow reports generated for 10 second single flow test should be 10 or 11, was {local_reports}",
@@ -8,7 +8,7 @@ from fabric_test import *
 from ptf.testutils import group
 from trex_test import TRexTest
 from trex_utils import list_port_status
-from xnt import pypy_analyze_int_report_pcap
+from xnt import analyze_int_report_pcap
 
 TRAFFIC_SPEEDUP = 1.0
 TEST_DURATION = 60
@@ -79,9 +79,11 @@ class IntFlowFilterWithTrafficTrace(TRexTest, IntTest):
             datetime.now().strftime("%Y%m%d-%H%M%S")
         )
         self.trex_client.stop_capture(capture["id"], output)
-        results = pypy_analyze_int_report_pcap(output, TOTAL_FLOWS)
+        results = analyze_int_report_pcap(output, TOTAL_FLOWS)
 
         port_stats = self.trex_client.get_stats()
+        self.record_port_stats(port_stats)
+        self.telemetry.add_int_analysis(results, {"capture": os.path.basename(output)})
         sent_packets = port_stats[SENDER_PORT]["opackets"]
         recv_packets = port_stats[RECEIVER_PORT]["ipackets"]
         int_packets = port_stats[INT_COLLECTOR_PORT]["ipackets"]
@@ -100,13 +102,13 @@ class IntFlowFilterWithTrafficTrace(TRexTest, IntTest):
             f"Didn't receive all packets; sent {sent_packets}, received {recv_packets}",
         )
 
-        accuracy_score = results["flow_accuracy_score"]
+        accuracy_score = results.flow_accuracy_score
         self.failIf(
             accuracy_score < ACCURACY_RECORD,
             f"Accuracy score should be at least {ACCURACY_RECORD}%, was {accuracy_score}%",
         )
 
-        efficiency_score = results["flow_efficiency_score"]
+        efficiency_score = results.flow_efficiency_score
         self.failIf(
             efficiency_score < EFFICIENCY_RECORD,
             f"Efficiency score should be at least {EFFICIENCY_RECORD}%, was {efficiency_score}%",
@@ -166,11 +168,11 @@ class IntIngressDropReportFilterWithTrafficTrace(TRexTest, IntTest):
             datetime.now().strftime("%Y%m%d-%H%M%S")
         )
         self.trex_client.stop_capture(capture["id"], output)
-        results = pypy_analyze_int_report_pcap(
-            output, TOTAL_FLOWS, INT_DROP_REASON_ACL_DENY
-        )
+        results = analyze_int_report_pcap(output, TOTAL_FLOWS, INT_DROP_REASON_ACL_DENY)
 
         port_stats = self.trex_client.get_stats()
+        self.record_port_stats(port_stats)
+        self.telemetry.add_int_analysis(results, {"capture": os.path.basename(output)})
         sent_packets = port_stats[SENDER_PORT]["opackets"]
         recv_packets = port_stats[RECEIVER_PORT]["ipackets"]
         int_packets = port_stats[INT_COLLECTOR_PORT]["ipackets"]
@@ -189,20 +191,20 @@ class IntIngressDropReportFilterWithTrafficTrace(TRexTest, IntTest):
             recv_packets > 0, f"ACL did not drop all packets, received {recv_packets}",
         )
 
-        accuracy_score = results["drop_accuracy_score"]
+        accuracy_score = results.drop_accuracy_score
         self.failIf(
             accuracy_score < ACCURACY_RECORD,
             f"Accuracy score should be at least {ACCURACY_RECORD}%, was {accuracy_score}%",
         )
 
-        efficiency_score = results["drop_efficiency_score"]
+        efficiency_score = results.drop_efficiency_score
         self.failIf(
             efficiency_score < EFFICIENCY_RECORD,
             f"Efficiency score should be at least {EFFICIENCY_RECORD}%, was {efficiency_score}%",
         )
 
-        total_drop_reports = results["drop_reports"]
-        correct_drop_reports = results["correct_drop_reports"]
+        total_drop_reports = results.drop_reports
+        correct_drop_reports = results.correct_drop_reports
         self.failIf(
             total_drop_reports != correct_drop_reports,
             f"All drop reports should be for reason DROP_REASON_ACL_DENY, {total_drop_reports - correct_drop_reports} were not.",
@@ -277,11 +279,13 @@ class IntEgressDropReportFilterWithTrafficTrace(TRexTest, IntTest):
             datetime.now().strftime("%Y%m%d-%H%M%S")
         )
         self.trex_client.stop_capture(capture["id"], output)
-        results = pypy_analyze_int_report_pcap(
+        results = analyze_int_report_pcap(
             output, TOTAL_FLOWS, INT_DROP_REASON_EGRESS_NEXT_MISS
         )
 
         port_stats = self.trex_client.get_stats()
+        self.record_port_stats(port_stats)
+        self.telemetry.add_int_analysis(results, {"capture": os.path.basename(output)})
         sent_packets = port_stats[SENDER_PORT]["opackets"]
         recv_packets = port_stats[RECEIVER_PORT]["ipackets"]
         int_packets = port_stats[INT_COLLECTOR_PORT]["ipackets"]
@@ -301,20 +305,20 @@ class IntEgressDropReportFilterWithTrafficTrace(TRexTest, IntTest):
             f"Egress VLAN table did not drop all packets, received {recv_packets}",
         )
 
-        accuracy_score = results["drop_accuracy_score"]
+        accuracy_score = results.drop_accuracy_score
         self.failIf(
             accuracy_score < ACCURACY_RECORD,
             f"Accuracy score should be at least {ACCURACY_RECORD}%, was {accuracy_score}%",
         )
 
-        efficiency_score = results["drop_efficiency_score"]
+        efficiency_score = results.drop_efficiency_score
         self.failIf(
             efficiency_score < EFFICIENCY_RECORD,
             f"Efficiency score should be at least {EFFICIENCY_RECORD}%, was {efficiency_score}%",
         )
 
-        total_drop_reports = results["drop_reports"]
-        correct_drop_reports = results["correct_drop_reports"]
+        total_drop_reports = results.drop_reports
+        correct_drop_reports = results.correct_drop_reports
         self.failIf(
             total_drop_reports != correct_drop_reports,
             f"All drop reports should be for reason DROP_REASON_EGRESS_NEXT_MISS, {total_drop_reports - correct_drop_reports} were not.",
@@ -149,29 +149,27 @@ class UpfPolicingTest(TRexTest, UpfSimpleTest, StatsTest):
             flow_stats=stats,
         )
 
-    def min_max_monitored_port_stats(self, stats) -> {}:
+    def min_max_monitored_port_stats(self, sampler: PortStatsSampler) -> {}:
         """
-        Minimum and maximum of the TX/RX stats captured live, obtained removing
-        the initial and last 2 samples that might be inaccurate due to rump up
-        and down of traffic from TRex (if we have enough samples).
-        :param stats:
+        Minimum and maximum of the TX/RX rates sampled live, leaving out the
+        first and last 2 seconds of traffic that might be inaccurate due to
+        ramp up and down of traffic from TRex (if traffic lasts long enough).
+        :param sampler: port stats sampled while traffic was running
         :return: dictionary with per port min and max TX/RX
         """
-        min_s = 2 if len(stats[0]["tx_bps"]) > 4 else 0
-        max_s = -2 if len(stats[0]["tx_bps"]) > 4 else -1
-        min_tx = [
-            min(v["tx_bps"][min_s:max_s]) for (k, v) in stats.items() if k != "duration"
+        margin = 2 if TRAFFIC_DURATION_SECONDS > 4 else 0
+        rates = [
+            sampler.rates(port, margin, TRAFFIC_DURATION_SECONDS - margin)
+            for port in ALL_PORTS
         ]
-        max_tx = [
-            max(v["tx_bps"][min_s:max_s]) for (k, v) in stats.items() if k != "duration"
-        ]
-        min_rx = [
-            min(v["rx_bps"][min_s:max_s]) for (k, v) in stats.items() if k != "duration"
-        ]
-        max_rx = [
-            max(v["rx_bps"][min_s:max_s]) for (k, v) in stats.items() if k != "duration"
-        ]
-        return {"min_tx": min_tx, "max_tx": max_tx, "min_rx": min_rx, "max_rx": max_rx}
+        for port, port_rates in zip(ALL_PORTS, rates):
+            self.telemetry.add_port_rates(port, port_rates, sampler.start_timestamp)
+        return {
+            "min_tx": [r.tx_bps.min() for r in rates],
+            "max_tx": [r.tx_bps.max() for r in rates],
+            "min_rx": [r.rx_bps.min() for r in rates],
+            "max_rx": [r.rx_bps.max() for r in rates],
+        }
 
 
 @group("trex-sw-mode")
@@ -245,14 +243,16 @@ class UpfAppOnlyPolicingTest(UpfPolicingTest):
         self.trex_client.add_streams(streams, ports=TREX_TX_PORT)
         print(f"Starting traffic, duration: {TRAFFIC_DURATION_SECONDS} sec")
         self.trex_client.start(TREX_TX_PORT, duration=TRAFFIC_DURATION_SECONDS)
-        live_stats = monitor_port_stats(self.trex_client, ALL_PORTS)
-        self.trex_client.wait_on_traffic(ports=TREX_TX_PORT, rx_delay_ms=100)
-        live_stats = self.min_max_monitored_port_stats(live_stats)
+        with PortStatsSampler(self.trex_client, ALL_PORTS) as sampler:
+            self.trex_client.wait_on_traffic(ports=TREX_TX_PORT, rx_delay_ms=100)
+        live_stats = self.min_max_monitored_port_stats(sampler)
 
         # Get and print TREX stats
         trex_stats = self.trex_client.get_stats()
         flow_stats_ue1 = get_flow_stats(pg_id_ue1, trex_stats)
+        self.telemetry.add_flow_stats(flow_stats_ue1)
         flow_stats_ue2 = get_flow_stats(pg_id_ue2, trex_stats)
+        self.telemetry.add_flow_stats(flow_stats_ue2)
         rx_bps_ue1 = (flow_stats_ue1.rx_bytes * 8) / TRAFFIC_DURATION_SECONDS
         rx_bps_ue2 = (flow_stats_ue2.rx_bytes * 8) / TRAFFIC_DURATION_SECONDS
 
@@ -358,14 +358,16 @@ class UpfSessionPolicingTest(UpfPolicingTest):
         self.trex_client.add_streams(streams, ports=TREX_TX_PORT)
         print(f"Starting traffic, duration: {TRAFFIC_DURATION_SECONDS} sec")
         self.trex_client.start(TREX_TX_PORT, duration=TRAFFIC_DURATION_SECONDS)
-        live_stats = monitor_port_stats(self.trex_client, ALL_PORTS)
-        self.trex_client.wait_on_traffic(ports=TREX_TX_PORT, rx_delay_ms=100)
-        live_stats = self.min_max_monitored_port_stats(live_stats)
+        with PortStatsSampler(self.trex_client, ALL_PORTS) as sampler:
+            self.trex_client.wait_on_traffic(ports=TREX_TX_PORT, rx_delay_ms=100)
+        live_stats = self.min_max_monitored_port_stats(sampler)
 
         # Get and print TREX stats
         trex_stats = self.trex_client.get_stats()
         flow_stats_ue1 = get_flow_stats(pg_id_ue1, trex_stats)
+        self.telemetry.add_flow_stats(flow_stats_ue1)
         flow_stats_ue2 = get_flow_stats(pg_id_ue2, trex_stats)
+        self.telemetry.add_flow_stats(flow_stats_ue2)
         rx_bps_ue1 = (flow_stats_ue1.rx_bytes * 8) / TRAFFIC_DURATION_SECONDS
         rx_bps_ue2 = (flow_stats_ue2.rx_bytes * 8) / TRAFFIC_DURATION_SECONDS
 
@@ -480,14 +482,16 @@ class UpfSliceFairPolicingTest(UpfPolicingTest):
         self.trex_client.add_streams(streams, ports=TREX_TX_PORT)
         print(f"Starting traffic, duration: {TRAFFIC_DURATION_SECONDS} sec")
         self.trex_client.start(TREX_TX_PORT, duration=TRAFFIC_DURATION_SECONDS)
-        live_stats = monitor_port_stats(self.trex_client, ALL_PORTS)
-        self.trex_client.wait_on_traffic(ports=TREX_TX_PORT, rx_delay_ms=100)
-        live_stats = self.min_max_monitored_port_stats(live_stats)
+        with PortStatsSampler(self.trex_client, ALL_PORTS) as sampler:
+            self.trex_client.wait_on_traffic(ports=TREX_TX_PORT, rx_delay_ms=100)
+        live_stats = self.min_max_monitored_port_stats(sampler)
 
         # Get and print TREX stats
         trex_stats = self.trex_client.get_stats()
         flow_stats_ue1 = get_flow_stats(pg_id_ue1, trex_stats)
+        self.telemetry.add_flow_stats(flow_stats_ue1)
         flow_stats_ue2 = get_flow_stats(pg_id_ue2, trex_stats)
+        self.telemetry.add_flow_stats(flow_stats_ue2)
         rx_bps_ue1 = (flow_stats_ue1.rx_bytes * 8) / TRAFFIC_DURATION_SECONDS
         rx_bps_ue2 = (flow_stats_ue2.rx_bytes * 8) / TRAFFIC_DURATION_SECONDS
 
@@ -626,14 +630,16 @@ class UpfSessionFairPolicingTest(UpfPolicingTest):
         self.trex_client.add_streams(streams, ports=TREX_TX_PORT)
         print(f"Starting traffic, duration: {TRAFFIC_DURATION_SECONDS} sec")
         self.trex_client.start(TREX_TX_PORT, duration=TRAFFIC_DURATION_SECONDS)
-        live_stats = monitor_port_stats(self.trex_client, ALL_PORTS)
-        self.trex_client.wait_on_traffic(ports=TREX_TX_PORT, rx_delay_ms=100)
-        live_stats = self.min_max_monitored_port_stats(live_stats)
+        with PortStatsSampler(self.trex_client, ALL_PORTS) as sampler:
+            self.trex_client.wait_on_traffic(ports=TREX_TX_PORT, rx_delay_ms=100)
+        live_stats = self.min_max_monitored_port_stats(sampler)
 
         # Get and print TREX stats
         trex_stats = self.trex_client.get_stats()
         flow_stats_app1 = get_flow_stats(pg_id_app1, trex_stats)
+        self.telemetry.add_flow_stats(flow_stats_app1)
         flow_stats_app2 = get_flow_stats(pg_id_app2, trex_stats)
+        self.telemetry.add_flow_stats(flow_stats_app2)
         rx_bps_app1 = (flow_stats_app1.rx_bytes * 8) / TRAFFIC_DURATION_SECONDS
         rx_bps_app2 = (flow_stats_app2.rx_bytes * 8) / TRAFFIC_DURATION_SECONDS
 
@@ -292,10 +292,13 @@ class FlowCountersSanityTest(QosTest):
         # Get and print TREX stats
         trex_stats = self.trex_client.get_stats()
         trex_flow_stats_1 = get_flow_stats(pg_id_1, trex_stats)
+        self.telemetry.add_flow_stats(trex_flow_stats_1)
         print(get_readable_flow_stats(trex_flow_stats_1))
         trex_flow_stats_2 = get_flow_stats(pg_id_2, trex_stats)
+        self.telemetry.add_flow_stats(trex_flow_stats_2)
         print(get_readable_flow_stats(trex_flow_stats_2))
         trex_flow_stats_3 = get_flow_stats(pg_id_3, trex_stats)
+        self.telemetry.add_flow_stats(trex_flow_stats_3)
         print(get_readable_flow_stats(trex_flow_stats_3))
 
         for port in ALL_PORTS:
@@ -366,7 +369,9 @@ class MinFlowrateWithSoftwareLatencyMeasurement(QosTest):
         # Get latency stats
         stats = self.trex_client.get_stats()
         lat_stats = get_latency_stats(self.control_pg_id, stats)
+        self.telemetry.add_latency_stats(lat_stats)
         flow_stats = get_flow_stats(self.control_pg_id, stats)
+        self.telemetry.add_flow_stats(flow_stats)
         print(get_readable_latency_stats(lat_stats))
         tx_bps_L1 = stats[BACKGROUND_SENDER_PORT[0]].get("tx_bps_L1", 0)
         rx_bps_L1 = stats[RECEIVER_PORT[0]].get("rx_bps_L1", 0)
@@ -427,7 +432,9 @@ class StrictPriorityControlTrafficIsPrioritized(QosTest):
         # Get latency stats
         stats = self.trex_client.get_stats()
         lat_stats = get_latency_stats(self.control_pg_id, stats)
+        self.telemetry.add_latency_stats(lat_stats)
         flow_stats = get_flow_stats(self.control_pg_id, stats)
+        self.telemetry.add_flow_stats(flow_stats)
         print(get_readable_latency_stats(lat_stats))
         # Get statistics for TX and RX ports
         for port in ALL_PORTS:
@@ -484,7 +491,9 @@ class ControlTrafficIsNotPrioritizedWithoutRules(QosTest):
         # Get latency stats
         stats = self.trex_client.get_stats()
         lat_stats = get_latency_stats(self.control_pg_id, stats)
+        self.telemetry.add_latency_stats(lat_stats)
         flow_stats = get_flow_stats(self.control_pg_id, stats)
+        self.telemetry.add_flow_stats(flow_stats)
         print(get_readable_latency_stats(lat_stats))
         # Get statistics for TX and RX ports
         for port in ALL_PORTS:
@@ -538,7 +547,9 @@ class ControlTrafficIsShaped(QosTest):
         # Get latency stats
         stats = self.trex_client.get_stats()
         lat_stats = get_latency_stats(self.control_pg_id, stats)
+        self.telemetry.add_latency_stats(lat_stats)
         flow_stats = get_flow_stats(self.control_pg_id, stats)
+        self.telemetry.add_flow_stats(flow_stats)
         rx_port_stats = get_port_stats(RECEIVER_PORT[0], stats)
         # Get statistics for TX and RX ports
         for port in ALL_PORTS:
@@ -619,7 +630,9 @@ class RealtimeTrafficIsRrScheduled(QosTest):
         stats = self.trex_client.get_stats()
         # Check RT stream 1
         lat_stats_1 = get_latency_stats(self.realtime_pg_id_1, stats)
+        self.telemetry.add_latency_stats(lat_stats_1)
         flow_stats_1 = get_flow_stats(self.realtime_pg_id_1, stats)
+        self.telemetry.add_flow_stats(flow_stats_1)
         print(get_readable_latency_stats(lat_stats_1))
         self.assertGreater(
             flow_stats_1.rx_packets, 0, "No realtime traffic has been received"
@@ -641,7 +654,9 @@ class RealtimeTrafficIsRrScheduled(QosTest):
         )
         # Check RT stream 2
         lat_stats_2 = get_latency_stats(self.realtime_pg_id_2, stats)
+        self.telemetry.add_latency_stats(lat_stats_2)
         flow_stats_2 = get_flow_stats(self.realtime_pg_id_2, stats)
+        self.telemetry.add_flow_stats(flow_stats_2)
         print(get_readable_latency_stats(lat_stats_2))
         self.assertGreater(
             flow_stats_2.rx_packets, 0, "No realtime traffic has been received"
@@ -663,7 +678,9 @@ class RealtimeTrafficIsRrScheduled(QosTest):
         )
         # Check RT stream 3
         lat_stats_3 = get_latency_stats(self.realtime_pg_id_3, stats)
+        self.telemetry.add_latency_stats(lat_stats_3)
         flow_stats_3 = get_flow_stats(self.realtime_pg_id_3, stats)
+        self.telemetry.add_flow_stats(flow_stats_3)
         print(get_readable_latency_stats(lat_stats_3))
         self.assertGreater(
             flow_stats_3.rx_packets, 0, "No realtime traffic has been received"
@@ -885,3 +902,164 @@ class ElasticTrafficIsWrrScheduled(QosTest):
             delta=0.008,
             msg="Best-effort source 3 was not scheduled as expected",
         )
+
+
+@group("trex-hw-mode")
+@group("benchmark")
+class LatencyUnderLoadSweep(QosTest):
+    """
+    Benchmark of the latency of each traffic class under increasing load. A
+    mix of control, realtime, elastic and best-effort streams is sent at
+    aggregate loads stepping from 10% to 120% of the link rate, each class
+    getting a fixed share of the load. The loss and latency percentiles of
+    each class are recorded at every step, giving a latency under load curve
+    per class. The knee of a curve shows where strict priority and WRR stop
+    protecting the class. Below 100% load, control and realtime traffic must
+    not be impacted by the elastic and best-effort traffic.
+    """
+
+    def runTest(self) -> None:
+        # At 40G, the fixed shares of the control and realtime classes exceed
+        # the maximum rates of their queues, sized for the 1G shaped port.
+        print("\nSweeping 1G bottleneck...")
+        self.doRunTest(link_bps=1 * G)
+
+    def create_sweep_streams(self, load_bps) -> {}:
+        """
+        Streams of each traffic class for an aggregate load. At 100% load of
+        the 1G port, control and realtime classes are within the maximum rate
+        of their queue.
+
+        :param load_bps: aggregate L1 rate of all streams
+        :return: dictionary of traffic class to list of (pg_id, L1 rate, stream, TRex port)
+        """
+        realtime = [
+            (1, 0.04 * load_bps, qos_utils.L4_DPORT_REALTIME_TRAFFIC_1),
+            (2, 0.025 * load_bps, qos_utils.L4_DPORT_REALTIME_TRAFFIC_2),
+            (3, 0.02 * load_bps, qos_utils.L4_DPORT_REALTIME_TRAFFIC_3),
+        ]
+        elastic = [
+            (4, 0.3 * load_bps, qos_utils.L4_DPORT_ELASTIC_TRAFFIC_1),
+            (5, 0.3 * load_bps, qos_utils.L4_DPORT_ELASTIC_TRAFFIC_2),
+        ]
+        control_bps = 0.05 * load_bps
+        best_effort_pg_id = 6
+        best_effort_bps = 0.265 * load_bps
+        return {
+            "control": [
+                (
+                    self.control_pg_id,
+                    control_bps,
+                    self.create_control_stream(self.control_pg_id, l1_bps=control_bps),
+                    PRIORITY_SENDER_PORT[0],
+                )
+            ],
+            "realtime": [
+                (
+                    pg_id,
+                    l1_bps,
+                    self.create_realtime_stream(pg_id, l1_bps=l1_bps, dport=dport),
+                    PRIORITY_SENDER_PORT[0],
+                )
+                for pg_id, l1_bps, dport in realtime
+            ],
+            "elastic": [
+                (
+                    pg_id,
+                    l1_bps,
+                    self.create_elastic_stream(
+                        pg_id, l1_bps=l1_bps, dport=dport, l2_size=1400
+                    ),
+                    BACKGROUND_SENDER_PORT[0],
+                )
+                for pg_id, l1_bps, dport in elastic
+            ],
+            "best-effort": [
+                (
+                    best_effort_pg_id,
+                    best_effort_bps,
+                    self.create_best_effort_stream(
+                        pg_id=best_effort_pg_id,
+                        dport=qos_utils.L4_DPORT_BEST_EFFORT_TRAFFIC_1,
+                        l2_size=1400,
+                        l1_bps=best_effort_bps,
+                    ),
+                    BACKGROUND_SENDER_PORT[0],
+                )
+            ],
+        }
+
+    @autocleanup
+    def doRunTest(self, link_bps) -> None:
+        self.push_chassis_config()
+        self.setup_queue_classification()
+        if link_bps == 1 * G:
+            self.setup_basic_forwarding_to_1g()
+        elif link_bps == 40 * G:
+            self.setup_basic_forwarding_to_40g()
+        else:
+            raise Exception(f"Invalid link_bps: {link_bps}")
+
+        points = []
+        for load in LOAD_SWEEP_STEPS:
+            classes = self.create_sweep_streams(load * link_bps)
+            self.trex_client.remove_all_streams(ports=ALL_SENDER_PORTS)
+            self.trex_client.clear_stats()
+            for streams in classes.values():
+                for _, _, stream, port in streams:
+                    self.trex_client.add_streams(stream, ports=[port])
+            logging.info(
+                "Offering %d%% load, duration: %d sec",
+                load * 100,
+                TRAFFIC_DURATION_SECONDS,
+            )
+            self.trex_client.start(
+                ALL_SENDER_PORTS, mult="1", duration=TRAFFIC_DURATION_SECONDS
+            )
+            self.trex_client.wait_on_traffic(ports=ALL_SENDER_PORTS, rx_delay_ms=100)
+            stats = self.trex_client.get_stats()
+            for traffic_class, streams in classes.items():
+                pg_ids = [pg_id for pg_id, _, _, _ in streams]
+                flow_stats = [get_flow_stats(pg_id, stats) for pg_id in pg_ids]
+                tx_packets = sum(s.tx_packets for s in flow_stats)
+                rx_packets = sum(s.rx_packets for s in flow_stats)
+                point = LoadSweepPoint(
+                    traffic_class=traffic_class,
+                    load=load,
+                    offered_bps=sum(l1_bps for _, l1_bps, _, _ in streams),
+                    tx_packets=tx_packets,
+                    rx_packets=rx_packets,
+                    loss_ratio=max(tx_packets - rx_packets, 0) / max(tx_packets, 1),
+                    latency=LatencyHistogram.merged(
+                        get_latency_histogram(pg_id, stats) for pg_id in pg_ids
+                    ),
+                )
+                self.telemetry.add_load_sweep_point(point, {"link_bps": int(link_bps)})
+                points.append(point)
+
+        print(get_readable_load_sweep(points))
+        path = (
+            f"{self.telemetry_dir()}/{self.__class__.__name__}-"
+            f"{int(link_bps / G)}g.sweep.csv"
+        )
+        write_load_sweep(path, points)
+        print(f"Latency under load curves written to {path}")
+
+        for point in points:
+            if point.load > 1 or point.traffic_class not in ["control", "realtime"]:
+                continue
+            self.assertEqual(
+                point.loss_ratio,
+                0,
+                f"{point.traffic_class} traffic has been dropped at {point.load:.0%} load",
+            )
+            if point.traffic_class == "control":
+                expected_latency = EXPECTED_99_9_PERCENTILE_LATENCY_CONTROL_TRAFFIC_US
+            else:
+                expected_latency = EXPECTED_99_9_PERCENTILE_LATENCY_REALTIME_TRAFFIC_US
+            self.assertLessEqual(
+                point.latency.percentile(99.9),
+                expected_latency,
+                f"99.9th percentile latency of {point.traffic_class} traffic is too "
+                f"high at {point.load:.0%} load",
+            )
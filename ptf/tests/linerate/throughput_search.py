@@ -0,0 +1,113 @@
+# Copyright 2020-present Open Networking Foundation
+# SPDX-License-Identifier: Apache-2.0
+
+# RFC 2544 style throughput search: finds the no drop rate (NDR) and partial
+# drop rate (PDR) of routed IPv4 traffic for each frame size and IMIX, and
+# writes the throughput/latency curve of the current profile.
+# Not executed by default, it takes about 2 minutes per frame size:
+#   BENCHMARKS=1 ./ptf/run/hw/linerate fabric TEST=throughput_search
+
+from base_test import *
+from fabric_test import *
+from ptf.testutils import group
+from trex_stl_lib.api import STLFlowLatencyStats, STLPktBuilder, STLStream, STLTXCont
+from trex_test import TRexTest
+from trex_utils import *
+
+# Frame sizes (bytes, including FCS) searched, as in RFC 2544
+FRAME_SIZES = [64, 128, 256, 512, 1024, 1280, 1518]
+# Simple IMIX, frame size to relative number of packets
+IMIX_FRAME_SIZES = {64: 7, 594: 4, 1518: 1}
+FCS_BYTES = 4
+
+LINE_RATE_BPS = 40 * G
+TRIAL_SECONDS = THROUGHPUT_SEARCH_TRIAL_SECONDS
+
+# Low rate stream measuring the latency of each trial
+LATENCY_PG_ID = 1
+LATENCY_PPS = 1000
+LATENCY_FRAME_SIZE = 128
+LATENCY_UDP_DPORT = 5000
+
+SENDER_PORT = 0
+RECEIVER_PORT = 1
+
+
+@group("trex-hw-mode")
+@group("benchmark")
+class ThroughputSearchTest(TRexTest, IPv4UnicastTest):
+    def create_streams(self, frame_sizes: dict, rate_bps: float) -> []:
+        """
+        Streams of a trial: one stream per frame size, sharing rate_bps in
+        proportion to their L1 bytes, and the latency stream.
+
+        :parameters:
+            frame_sizes: dict
+                frame size to relative number of packets
+            rate_bps: float
+                total L1 rate of the frame size streams
+        """
+        l1_bytes = {
+            size: count * (size + L1_OVERHEAD_BYTES)
+            for size, count in frame_sizes.items()
+        }
+        total_l1_bytes = sum(l1_bytes.values())
+        streams = [
+            STLStream(
+                packet=STLPktBuilder(
+                    pkt=testutils.simple_udp_packet(pktlen=size - FCS_BYTES)
+                ),
+                mode=STLTXCont(bps_L1=rate_bps * l1_bytes[size] / total_l1_bytes),
+            )
+            for size in frame_sizes
+        ]
+        latency_pkt = testutils.simple_udp_packet(
+            pktlen=LATENCY_FRAME_SIZE - FCS_BYTES, udp_dport=LATENCY_UDP_DPORT
+        )
+        streams.append(
+            STLStream(
+                packet=STLPktBuilder(pkt=latency_pkt),
+                mode=STLTXCont(pps=LATENCY_PPS),
+                flow_stats=STLFlowLatencyStats(pg_id=LATENCY_PG_ID),
+            )
+        )
+        return streams
+
+    @autocleanup
+    def runTest(self):
+        self.push_chassis_config()
+        self.runIPv4UnicastTest(
+            pkt=testutils.simple_udp_packet(),
+            next_hop_mac=HOST2_MAC,
+            prefix_len=24,
+            ig_port=self.port1,
+            eg_port=self.port2,
+            no_send=True,
+        )
+
+        traffics = {size: {size: 1} for size in FRAME_SIZES}
+        traffics["imix"] = IMIX_FRAME_SIZES
+        results = {}
+        for name, frame_sizes in traffics.items():
+            print(f"Searching the throughput of {name} frames...")
+            result = self.search_throughput(
+                lambda rate_bps: self.create_streams(frame_sizes, rate_bps),
+                SENDER_PORT,
+                RECEIVER_PORT,
+                LINE_RATE_BPS,
+                TRIAL_SECONDS,
+                latency_pg_id=LATENCY_PG_ID,
+            )
+            print(get_readable_throughput_search(result))
+            self.telemetry.add_throughput_search(result, {"frame_size": name})
+            results[name] = result
+
+        profile = ptf.testutils.test_param_get("profile")
+        path = f"{self.telemetry_dir()}/{self.__class__.__name__}-{profile}.curve.csv"
+        write_throughput_curve(path, results)
+        print(f"Throughput curve written to {path}")
+
+        for name, result in results.items():
+            self.assertGreater(
+                result.rates["pdr"], 0, f"No traffic forwarded with {name} frames"
+            )